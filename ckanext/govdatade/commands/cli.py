@@ -2,7 +2,6 @@
 '''
 Click commands.
 '''
-import json
 import os
 
 import click
@@ -11,7 +10,7 @@ from ckan.logic import get_action
 from ckan.plugins import toolkit as tk
 from ckanext.govdatade import util
 from ckanext.govdatade.commands import command_util
-from ckanext.govdatade.validators import link_checker
+from ckanext.govdatade.validators import backends, link_checker
 
 DAYS_TO_SUBTRACT_DEFAULT = 30
 
@@ -31,19 +30,48 @@ def get_commands():
     help='Objects older than the defined days are deleted. '
     'The default is %d days.' % DAYS_TO_SUBTRACT_DEFAULT
 )
-def cleanupdb(delete_activities, older_than_days):
+@click.option(
+    '--chunk-size',
+    default=None,
+    type=click.IntRange(min=1),
+    help='Deletes the objects with SQL statements deleting the given number of rows each '
+    'instead of deleting them one by one.'
+)
+@click.option(
+    '--window-days',
+    default=None,
+    type=click.IntRange(min=1),
+    help='Deletes the objects in windows of the given number of days by timestamp, oldest '
+    'first. A further run resumes after the last completed window.'
+)
+@click.option(
+    '--max-rows-per-second',
+    default=None,
+    type=click.IntRange(min=1),
+    help='Limits the number of deleted rows per second.'
+)
+def cleanupdb(delete_activities, older_than_days, chunk_size, window_days, max_rows_per_second):
     '''Clean up the CKAN database, e.g. dataset activities.
 
     Usage:
 
-      activities [--older-than-days={days}]
+      activities [--older-than-days={days}] [--chunk-size={rows}] [--window-days={window}]
+                 [--max-rows-per-second={rate}]
         - Deletes all activities older than the given {days}. Default is 30 days.
+          With {rows} the activities are deleted in chunks of {rows} rows, with {window}
+          in windows of {window} days, oldest first, and with {rate} at most {rate} rows
+          per second.
 
     '''
 
     if delete_activities:
         days_to_subtract = _check_option_days(older_than_days)
-        command_util.delete_activities(days_to_subtract)
+        if chunk_size or window_days or max_rows_per_second:
+            command_util.delete_activities_in_chunks(
+                days_to_subtract, chunk_size or command_util.DB_BLOCK_SIZE,
+                window_days=window_days, max_rows_per_second=max_rows_per_second)
+        else:
+            command_util.delete_activities(days_to_subtract)
     else:
         tk.error_shout('Command not recognized')
         raise click.Abort()
@@ -58,13 +86,35 @@ def cleanupdb(delete_activities, older_than_days):
     help='With dry-run True the deletion will be not executed. '
     'The default is True.'
 )
-def delete(args, dry_run):
+@click.option(
+    '--batch-size',
+    default=None,
+    type=click.IntRange(min=1),
+    help='Deletes the datasets in batches of the given number of datasets and commits the '
+    'search index once per batch.'
+)
+@click.option(
+    '--workers',
+    default=1,
+    type=click.IntRange(min=1),
+    help='Number of workers deleting the batches concurrently. The default is 1.'
+)
+@click.option(
+    '--failed-ids-file',
+    default=None,
+    type=click.Path(dir_okay=False, writable=True),
+    help='CSV file for the IDs of the datasets, which could not be deleted in batches.'
+)
+def delete(args, dry_run, batch_size, workers, failed_ids_file):
     '''Deletes objects in the CKAN database, e.g. datasets.
 
     Usage:
 
-        datasets {filter-query-params} [--dry-run]
-        - Deletes all datasets matching the given {filter-query-params}.
+        datasets {filter-query-params} [--dry-run] [--batch-size={size}] [--workers={workers}]
+                 [--failed-ids-file={file}]
+        - Deletes all datasets matching the given {filter-query-params}. With {size} the
+          datasets are deleted in batches of {size} datasets by {workers} workers and the IDs
+          of the datasets, which could not be deleted, are written to the CSV file {file}.
 
     '''
 
@@ -83,7 +133,9 @@ def delete(args, dry_run):
     if cmd == 'datasets':
         package_search_filter_params = command_util.check_package_search_params(args[1:])
         dry_run_result = _check_options(dry_run)
-        command_util.delete_datasets(dry_run_result, package_search_filter_params, admin_user)
+        command_util.delete_datasets(dry_run_result, package_search_filter_params, admin_user,
+                                     batch_size=batch_size, workers=workers,
+                                     failed_ids_file=failed_ids_file)
     else:
         tk.error_shout(u'Command {} not recognized'.format(cmd))
         raise click.Abort()
@@ -92,43 +144,95 @@ def delete(args, dry_run):
 
 @click.command('linkchecker')
 @click.argument('args', nargs=-1)
-def linkchecker(args):
+@click.option(
+    '--workers',
+    default=1,
+    type=click.IntRange(min=1),
+    help='Number of concurrent workers checking the URLs. The default is 1.'
+)
+@click.option(
+    '--incremental',
+    is_flag=True,
+    help='Checks only the URLs being due according to the schedule of the previous runs.'
+)
+@click.option(
+    '--resume',
+    is_flag=True,
+    help='Resumes an interrupted run without checking the datasets already processed again.'
+)
+@click.option(
+    '--time-limit',
+    default=None,
+    type=click.IntRange(min=1),
+    help='Stops checking further datasets after the given number of minutes. '
+         'The run is completed by further runs with --resume.'
+)
+@click.option(
+    '--shard',
+    default=None,
+    help='Checks only the datasets of shard K of N shards, given as K/N, by the hash of their '
+         'IDs. The deprecated datasets are deleted after all N shards were completed.'
+)
+def linkchecker(args, *, workers, incremental, resume, time_limit, shard):
     '''Checks the availability of the dataset's URLs
 
     report                         Creates a report for all datasets
     specific <dataset-name>        Checks links for a specific dataset
     remote <host-name>             Checks links for datasets of a given remote host
+    migrate                        Migrates the link check records of the previous storage
+                                   layout in Redis and rewrites them with the configured codec
+    enqueue                        Starts a round of the distributed link check by enqueuing
+                                   all datasets in Redis
+    worker                         Checks the enqueued datasets of the distributed link check
+                                   until the round is completed
     '''
 
-    active_datasets = set()
     if len(args) == 0:
 
         context = {'model': model,
                    'session': model.Session,
                    'ignore_auth': True}
 
-        validator = link_checker.LinkChecker(tk.config)
-
-        num_datasets = 0
-        for dummy_index, dataset in enumerate(util.iterate_local_datasets(context)):
-            util.normalize_action_dataset(dataset)
-            try:
-                validator.process_record(dataset)
-                num_datasets += 1
-                active_datasets.add(dataset['id'])
-            except Exception as ex:
-                click.echo(u'LinkChecker: Error while processing dataset {}. Details: {}'.format(
-                    str(dataset['id']), str(ex)))
-
-        command_util.delete_deprecated_datasets(active_datasets)
-        general = {'num_datasets': num_datasets}
-        validator.redis_client.set('general', json.dumps(general))
-        click.secho('Generated link check report data.', fg='green')
+        shard = _check_option_shard(shard)
+        validator = backends.create_link_checker(tk.config)
+        url_cache = validator.enable_url_cache()
+        validator.enable_url_schedule(incremental)
+
+        num_datasets, completed = command_util.run_link_checker(
+            validator, context, workers, resume=resume,
+            time_limit=time_limit and time_limit * 60, shard=shard)
+        click.echo(u'URL cache: {} hits, {} misses, hit ratio {:.1%}'.format(
+            url_cache.hits, url_cache.misses, url_cache.hit_ratio()))
+        if completed:
+            click.secho('Generated link check report data.', fg='green')
+        else:
+            click.echo(u'Checked {} datasets, time limit reached. Continue with --resume.'.format(
+                num_datasets))
 
     if len(args) > 0:
         subcommand = args[0]
         if subcommand == 'remote':
             command_util.check_remote_host(args[1])
+        elif subcommand == 'enqueue':
+            context = {'model': model,
+                       'session': model.Session,
+                       'ignore_auth': True}
+            num_datasets = command_util.enqueue_link_check(
+                link_checker.LinkChecker(tk.config), context)
+            if num_datasets is None:
+                click.echo(u'The previous round of the link check is not completed yet.')
+            else:
+                click.echo(u'Enqueued {} datasets.'.format(num_datasets))
+        elif subcommand == 'worker':
+            validator = backends.create_link_checker(tk.config)
+            validator.enable_url_cache()
+            validator.enable_url_schedule(incremental)
+            num_datasets = command_util.run_link_check_worker(validator, workers)
+            click.echo(u'Checked {} datasets.'.format(num_datasets))
+        elif subcommand == 'migrate':
+            num_records, num_values = command_util.migrate_link_checker_records()
+            click.echo(u'Migrated {} link check records, rewrote {} record values.'.format(
+                num_records, num_values))
         elif len(args) == 2 and args[0] == 'specific':
             dataset_name = args[1]
 
@@ -177,10 +281,16 @@ def purge(args):
 
 
 @click.command('report')
-def report():
+@click.option(
+    '--processes',
+    default=1,
+    type=click.IntRange(min=1),
+    help='Number of processes rendering the report. The default is 1.'
+)
+def report(processes):
     '''Generates metadata quality report based on Redis data.'''
 
-    command_util.generate_report()
+    command_util.generate_report(processes)
     report_path = os.path.normpath(
         tk.config.get('ckanext.govdata.validators.report.dir')
     )
@@ -216,3 +326,19 @@ def _check_option_days(older_than_days):
         click.echo('INFO Using default of {} days.'.format(days_to_subtract))
 
     return days_to_subtract
+
+def _check_option_shard(shard_option):
+    ''' Check value K/N for option shard '''
+
+    if not shard_option:
+        return None
+    try:
+        shard, num_shards = [int(value) for value in shard_option.split('/')]
+    except ValueError as ex:
+        tk.error_shout(u'ERROR Value \'{}\' for shard is not of the form K/N!'.format(
+            str(shard_option)))
+        raise click.Abort() from ex
+    if not 1 <= shard <= num_shards:
+        tk.error_shout(u'ERROR Shard {} is not between 1 and {}!'.format(shard, num_shards))
+        raise click.Abort()
+    return shard, num_shards
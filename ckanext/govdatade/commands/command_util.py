@@ -2,24 +2,37 @@
 Commands util methods
 '''
 import csv
+import functools
 import io
+import itertools
+import json
 import logging
 import os
+import socket
 import sys
 import time
 from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from datetime import datetime, timedelta
 
 from jinja2 import Environment, FileSystemLoader
+from sqlalchemy import delete, func, select
 
 from ckan import model
+from ckan.lib import search
 from ckan.plugins import toolkit as tk
 from ckanext.activity.model import Activity
 from ckanext.govdatade import util
 from ckanext.govdatade.validators import link_checker
+from ckanext.govdatade.validators.link_check_queue import LinkCheckQueue
+from ckanext.govdatade.validators.link_check_run import LinkCheckRun, LinkCheckShards, \
+    dataset_shard
 
 DB_BLOCK_SIZE = 10000
-ROWS = 100
+ROWS = 1000
+REPORT_FRAGMENT_SIZE = 500
+# system info with the end of the last window of deleted activities
+ACTIVITIES_DELETED_UNTIL_KEY = 'ckanext.govdata.cleanupdb.activities.deleted_until'
 
 LOGGER = logging.getLogger(__name__)
 
@@ -46,17 +59,25 @@ def check_package_search_params(psfp_args):
         print('ERROR: Missing required parameter with package search filter params!')
         sys.exit(1)
 
-def delete_datasets(dry_run, package_search_filter_params, admin_user):
-    '''Deletes all datasets matching package search filter query.'''
-    starttime = time.time()
+def delete_datasets(dry_run, package_search_filter_params, admin_user, *, batch_size=None,
+                    workers=1, failed_ids_file=None):
+    '''Deletes all datasets matching package search filter query. The IDs are deleted while
+       they are gathered. With batch_size the datasets are deleted in batches by the given
+       number of workers, see _delete_datasets_in_batches.
+    '''
     package_ids_to_delete = _gather_dataset_ids(package_search_filter_params)
-    endtime = time.time()
-    print("INFO: %s datasets found for deletion. Total time: %s." % \
-            (len(package_ids_to_delete), str(endtime - starttime)))
 
     if dry_run:
+        starttime = time.time()
+        found_count = sum(1 for dummy_package_id in package_ids_to_delete)
+        endtime = time.time()
+        print("INFO: %s datasets found for deletion. Total time: %s." % \
+                (found_count, str(endtime - starttime)))
         print("INFO: DRY-RUN: The dataset deletion is disabled.")
-    elif len(package_ids_to_delete) > 0:
+    elif batch_size:
+        _delete_datasets_in_batches(package_ids_to_delete, admin_user, batch_size, workers,
+                                    failed_ids_file)
+    else:
         success_count = error_count = 0
         starttime = time.time()
         for package_id in package_ids_to_delete:
@@ -78,35 +99,109 @@ def delete_datasets(dry_run, package_search_filter_params, admin_user):
         print("INFO: %s datasets successfully deleted. %s datasets couldn't deleted. Total time: %s." % \
                 (success_count, error_count, str(endtime - starttime)))
 
+def _delete_datasets_in_batches(package_ids, admin_user, batch_size, workers, failed_ids_file):
+    '''Deletes the datasets with the given IDs in batches of batch_size datasets by the given
+       number of workers. The search index is committed once per batch instead of once per
+       dataset. The IDs of the datasets, which couldn't be deleted, are written with the error
+       to the CSV file failed_ids_file.
+    '''
+    success_count = 0
+    failed = []
+    completed_batches = 0
+    starttime = time.time()
+
+    def complete(future, batch):
+        nonlocal success_count, completed_batches
+        batch_failed = future.result()
+        search.commit()
+        success_count += len(batch) - len(batch_failed)
+        failed.extend(batch_failed)
+        completed_batches += 1
+        print("DEBUG: Deleted %d batches, %d datasets, %d errors, %.1f datasets/s." % \
+              (completed_batches, success_count, len(failed),
+               (success_count + len(failed)) / max(time.time() - starttime, 0.001)))
+
+    solr_commit = tk.config.get('ckan.search.solr_commit', True)
+    tk.config['ckan.search.solr_commit'] = False
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            pending = {}
+            package_ids = iter(package_ids)
+            for batch in iter(lambda: list(itertools.islice(package_ids, batch_size)), []):
+                pending[executor.submit(_delete_batch, batch, admin_user)] = batch
+                # gathers further IDs while at most two batches per worker are pending
+                if len(pending) >= 2 * workers:
+                    done, dummy_not_done = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        complete(future, pending.pop(future))
+            for future in list(pending):
+                complete(future, pending.pop(future))
+    finally:
+        tk.config['ckan.search.solr_commit'] = solr_commit
+
+    for package_id, error in failed:
+        print('ERROR: While deleting dataset with id %s. Details: %s' % (package_id, error))
+    if failed and failed_ids_file:
+        with io.open(failed_ids_file, 'w', encoding='utf-8', newline='') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(['id', 'error'])
+            writer.writerows(failed)
+        print("INFO: Wrote the IDs of the datasets, which couldn't deleted, to %s." % failed_ids_file)
+
+    endtime = time.time()
+    print('=============================================================')
+    print("INFO: %s datasets successfully deleted. %s datasets couldn't deleted. Total time: %s. "
+          "Throughput: %.1f datasets/s." % \
+            (success_count, len(failed), str(endtime - starttime),
+             (success_count + len(failed)) / max(endtime - starttime, 0.001)))
+
+def _delete_batch(package_ids, admin_user):
+    '''Deletes the datasets with the given IDs and returns the failed IDs with the error.'''
+    failed = []
+    try:
+        for package_id in package_ids:
+            try:
+                _delete(package_id, admin_user)
+            except Exception as error:
+                model.Session.rollback()
+                failed.append((package_id, str(error)))
+    finally:
+        # the session of the worker thread
+        model.Session.remove()
+    return failed
+
 def _delete(dataset_ref, admin_user):
     '''Deletes the dataset with the given ID.'''
     context = {'user': admin_user['name']}
     tk.get_action('package_delete')(context, {'id': dataset_ref})
 
-def _gather_dataset_ids(package_search_filter_params):
-    '''Collects all dataset ids matching the filter params.'''
-    package_ids_found = []
-    offset = 0
-    count = 0
+def _gather_dataset_ids(package_search_filter_params, rows=ROWS):
+    '''Yields the IDs of all datasets matching the filter params. Only the field id is requested
+       in pages of the given rows ordered by ID, each page starts after the last ID of the
+       previous page, so that the pages don't shift while the found datasets are deleted.
+    '''
     package_search = tk.get_action('package_search')
+    last_id = None
+    count = 0
 
-    while offset <= count:
+    while True:
         query_object = {
             "fq": package_search_filter_params,
-            "rows": ROWS,
-            "start": offset
+            "fl": ['id'],
+            "rows": rows,
+            "sort": 'id asc'
             }
-        result = package_search({}, query_object)
-        datasets = result["results"]
+        if last_id is not None:
+            query_object['fq_list'] = ['id:{"%s" TO *]' % last_id]
+        datasets = package_search({}, query_object)["results"]
         count += len(datasets)
-        print("DEBUG: offset: %s, count: %s" % (str(offset), str(count)))
-        offset += ROWS
-
-        if count != 0:
-            for dataset in datasets:
-                package_ids_found.append(dataset['id'])
+        print("DEBUG: last id: %s, count: %s" % (str(last_id), str(count)))
 
-    return set(package_ids_found)
+        for dataset in datasets:
+            yield dataset['id']
+        if len(datasets) < rows:
+            break
+        last_id = datasets[-1]['id']
 
 #######################################
 ###         purge utils             ###
@@ -175,20 +270,163 @@ def _format_date_string(time_in_seconds):
 ###         linkchecker utils       ###
 #######################################
 
+def iterate_link_check_results(context):
+    '''
+    Iterates over the search results of the local datasets with the fields needed for the
+    link check, util.link_check_dataset creates the datasets of the results
+    '''
+    return util.iterate_local_link_check_results(context)
+
+def run_link_checker(validator, context, workers=1, *, resume=False, time_limit=None,
+                     shard=None):
+    '''
+    Checks the links of all local datasets and returns a tuple (number of processed datasets,
+    completed). The progress is persisted in Redis, so that an interrupted run can be resumed.
+    With a time limit in seconds no further datasets are checked after the time limit, the
+    run is completed by a further run with resume. Only a completed run deletes the records
+    of deprecated datasets and writes the general data. Records of the legacy storage layout
+    are migrated before the first run, record values are rewritten after changing the codec.
+    With a shard tuple (shard, number of shards) only the datasets of the shard are checked,
+    the records of deprecated datasets are deleted after all shards were completed.
+    '''
+    num_records, num_values = validator.ensure_record_layout()
+    if num_records:
+        LOGGER.info('Migrated %s link checker records', num_records)
+    if num_values:
+        LOGGER.info('Rewrote %s link checker record values with codec %s',
+                    num_values, validator.codec.codec.name)
+    results = iterate_link_check_results(context)
+    run_prefix = validator.KEY_PREFIX
+    if shard is not None:
+        results = (result for result in results
+                   if dataset_shard(result['id'], shard[1]) == shard[0])
+        run_prefix += 'shard:%s/%s:' % shard
+    run = LinkCheckRun(validator.redis_client, run_prefix)
+    if run.start(resume):
+        LOGGER.info('Resuming link checker run with %s processed datasets', run.num_processed())
+    deadline = time.monotonic() + time_limit if time_limit else None
+
+    completed = True
+    datasets = run.pending(results)
+    results = validator.process_records(datasets, workers, util.link_check_dataset)
+    try:
+        for dataset, error in results:
+            if error is None:
+                run.processed(dataset['id'])
+            else:
+                print(u'LinkChecker: Error while processing dataset {}. Details: {}'.format(
+                    str(dataset['id']), str(error)))
+            if deadline is not None and time.monotonic() >= deadline:
+                completed = False
+                LOGGER.info('LinkChecker: Time limit reached, resume the run to complete it')
+                break
+    finally:
+        results.close()
+        run.checkpoint()
+
+    num_datasets = run.num_processed()
+    if completed and shard is not None:
+        shards = LinkCheckShards(validator.redis_client, validator.KEY_PREFIX, shard[1])
+        if shards.complete(shard[0], run):
+            LOGGER.info('LinkChecker: All %s shards completed', shard[1])
+            complete_link_checker_run(validator, shards.iterate_active(), shards.num_active())
+        run.finish()
+    elif completed:
+        complete_link_checker_run(validator, run.iterate_processed(), num_datasets)
+        run.finish()
+    return num_datasets, completed
+
+
+def complete_link_checker_run(validator, dataset_ids, num_datasets):
+    '''
+    Deletes the records of the datasets not checked by the completed run, prunes the schedule
+    and writes the general data.
+    '''
+    delete_deprecated_datasets(dataset_ids)
+    if validator.url_schedule is not None:
+        validator.url_schedule.prune(2 * validator.max_check_interval)
+    validator.redis_client.set('general', json.dumps({'num_datasets': num_datasets}))
+
+
+def create_link_check_queue(validator):
+    '''
+    Creates the work queue of the distributed link check
+    '''
+    return LinkCheckQueue(validator.redis_client, validator.KEY_PREFIX,
+                          validator.queue_visibility_timeout)
+
+
+def enqueue_link_check(validator, context):
+    '''
+    Starts a round of the distributed link check with all local datasets and returns the
+    number of enqueued datasets or None, if the previous round is still active.
+    '''
+    num_records, dummy_num_values = validator.ensure_record_layout()
+    if num_records:
+        LOGGER.info('Migrated %s link checker records', num_records)
+    return create_link_check_queue(validator).start(iterate_link_check_results(context))
+
+
+def run_link_check_worker(validator, workers=1, poll_interval=1.0):
+    '''
+    Checks the datasets of the distributed link check round claimed from the work queue until
+    the round is drained and returns the number of datasets checked by this worker. The
+    worker observing the end of the round completes it.
+    '''
+    link_check_queue = create_link_check_queue(validator)
+    worker_id = '%s:%s' % (socket.gethostname(), os.getpid())
+    # claimed datasets wait in the queues of the pipeline, keep them few so that they are
+    # checked before their claims expire
+    validator.pipeline_queue_size = min(validator.pipeline_queue_size, workers)
+
+    num_datasets = 0
+    results = validator.process_records(
+        link_check_queue.claims(worker_id, poll_interval), workers, util.link_check_dataset)
+    try:
+        for dataset, error in results:
+            if error is not None:
+                print(u'LinkChecker: Error while processing dataset {}. Details: {}'.format(
+                    str(dataset['id']), str(error)))
+            if link_check_queue.ack(dataset['id'], worker_id, error is None):
+                num_datasets += 1
+    finally:
+        results.close()
+
+    if link_check_queue.finish():
+        LOGGER.info('LinkChecker: Completing the round of the distributed link check')
+        complete_link_checker_run(validator, link_check_queue.iterate_processed(),
+                                  link_check_queue.num_processed())
+        link_check_queue.clear()
+    return num_datasets
+
+
 def delete_deprecated_datasets(dataset_ids):
     '''
     Deletes deprecated datasets from Redis
     '''
+    dataset_ids = set(dataset_ids)
     validator = link_checker.LinkChecker(tk.config)
-    redis_client = validator.redis_client
-    redis_ids = redis_client.keys()
-    for redis_id in redis_ids:
-        if redis_id not in dataset_ids:
-            record = redis_client.get(redis_id)
-            if (record is not None) and (redis_id != 'general'):
-                redis_client.delete(redis_id)
-                LOGGER.info('Deleted deprecated broken links information for dataset %s from Redis',
-                            str(redis_id))
+    deprecated_ids = (redis_id for redis_id in validator.records.iterate_dataset_ids()
+                      if redis_id not in dataset_ids)
+    for batch in link_checker.iterate_batches(deprecated_ids, validator.SCAN_BATCH_SIZE):
+        validator.records.delete(batch)
+        for redis_id in batch:
+            LOGGER.info('Deleted deprecated broken links information for dataset %s from Redis',
+                        str(redis_id))
+
+
+def migrate_link_checker_records():
+    '''
+    Migrates the link checker records of the previous storage layout in Redis and rewrites the
+    record values not encoded with the configured codec
+    '''
+    validator = link_checker.LinkChecker(tk.config)
+    num_records = validator.migrate_legacy_records()
+    LOGGER.info('Migrated %s link checker records', num_records)
+    num_values = validator.upgrade_records()
+    LOGGER.info('Rewrote %s link checker record values with codec %s',
+                num_values, validator.codec.codec.name)
+    return num_records, num_values
 
 def check_remote_host(endpoint):
     '''
@@ -214,14 +452,16 @@ def check_remote_host(endpoint):
 ###         report utils            ###
 #######################################
 
-def generate_report():
+def generate_report(processes=1):
     '''
-    Generates the report
+    Generates the report. The table rows of the broken links are rendered in fragments of
+    REPORT_FRAGMENT_SIZE records by the given number of processes.
     '''
     data = defaultdict(defaultdict)
 
     util.generate_general_data(data)
     util.generate_link_checker_data(data)
+    data['rows'] = _render_report_rows(data['entries'], processes)
 
     util.copy_report_asset_files()
     util.copy_report_vendor_files()
@@ -233,9 +473,38 @@ def generate_report():
         rendered_template = _render_template(template_file, data)
         _write_validation_result(rendered_template, template_file)
 
-def _render_template(template_file, data):
+def _render_report_rows(entries, processes=1):
     '''
-    Renders the report template
+    Renders the table rows of the records per portal in the given entries and returns them by
+    portal.
+    '''
+    govdata_detail_url = tk.config.get('ckanext.govdata.validators.report.detail.url')
+    fragments = []
+    for portal, records in entries.items():
+        for start in range(0, len(records), REPORT_FRAGMENT_SIZE):
+            fragments.append((portal, records[start:start + REPORT_FRAGMENT_SIZE]))
+
+    rows = defaultdict(list)
+    rendered_fragments = util.map_in_processes(
+        _render_rows_fragment,
+        ((records, govdata_detail_url) for dummy_portal, records in fragments),
+        processes)
+    for (portal, dummy_records), rendered in zip(fragments, rendered_fragments):
+        rows[portal].append(rendered)
+    return {portal: ''.join(rendered) for portal, rendered in rows.items()}
+
+def _render_rows_fragment(fragment):
+    '''
+    Renders the table rows of the given fragment (records, govdata_detail_url)
+    '''
+    records, govdata_detail_url = fragment
+    template = _template_environment().get_template('linkchecker_rows.html.jinja2')
+    return template.render(records=records, govdata_detail_url=govdata_detail_url)
+
+@functools.lru_cache(maxsize=None)
+def _template_environment():
+    '''
+    Returns the environment of the report templates
     '''
     template_dir = os.path.dirname(__file__)
     template_dir = os.path.join(
@@ -247,13 +516,18 @@ def _render_template(template_file, data):
 
     environment = Environment(loader=FileSystemLoader(template_dir))
     environment.globals.update(amend_portal=util.amend_portal)
+    return environment
 
+def _render_template(template_file, data):
+    '''
+    Renders the report template
+    '''
     data['ckan_api_url'] = tk.config.get('ckan.api.url.portal')
     data['govdata_detail_url'] = tk.config.get(
         'ckanext.govdata.validators.report.detail.url'
     )
 
-    template = environment.get_template(template_file)
+    template = _template_environment().get_template(template_file)
     return template.render(data)
 
 def _write_validation_result(rendered_template, template_file):
@@ -316,6 +590,112 @@ def delete_activities(days_to_subtract):
                 (_format_date_string(endtime), success_count, str(endtime - starttime)))
 
 
+def delete_activities_in_chunks(days_to_subtract, chunk_size=DB_BLOCK_SIZE, *, window_days=None,
+                                max_rows_per_second=None):
+    '''Deletes all dataset activities like delete_activities, but with SQL statements deleting
+       up to chunk_size rows each instead of loading the activities. Each chunk is committed.
+       With window_days the activities are deleted in windows of window_days days by timestamp,
+       oldest first. The end of the last completed window is stored in the system info, so that
+       a further run resumes there. With max_rows_per_second the deletion is delayed to not
+       exceed the given rate.
+    '''
+
+    date_limit = datetime.today() - timedelta(days=days_to_subtract)
+    date_limit_string = date_limit.strftime("%Y-%m-%d")
+    print('INFO Delete all activities older than %s in chunks of %d rows.' % (
+        date_limit_string, chunk_size))
+
+    success_count = 0
+    starttime = time.time()
+    print('INFO [%s]: START deleting activities...' % _format_date_string(starttime))
+    try:
+        # IDs of the activities to delete
+        harvest_user_ids = select(model.User.id).where(model.User.name == 'harvest')
+        activity_ids = select(Activity.id)\
+            .where(Activity.user_id.in_(harvest_user_ids))\
+            .where(Activity.timestamp < date_limit_string)
+
+        rows_to_delete_count = model.Session.execute(
+            select(func.count()).select_from(activity_ids.subquery())).scalar()
+        print("DEBUG Activity deleting count: %s " % rows_to_delete_count)
+
+        # Delete activities
+        if window_days is None:
+            for deleted_count in _delete_activity_chunks(activity_ids, chunk_size,
+                                                         max_rows_per_second):
+                success_count += deleted_count
+                print('DEBUG Deleted %d of %d objects of type Activity, %d rows/s' % (
+                    success_count, rows_to_delete_count,
+                    success_count / max(time.time() - starttime, 0.001)))
+        else:
+            windows = _activity_windows(
+                activity_ids, datetime.strptime(date_limit_string, "%Y-%m-%d"), window_days)
+            for window_start, window_end in windows:
+                window_starttime = time.time()
+                window_count = 0
+                window_ids = activity_ids\
+                    .where(Activity.timestamp >= window_start)\
+                    .where(Activity.timestamp < window_end)
+                for deleted_count in _delete_activity_chunks(window_ids, chunk_size,
+                                                             max_rows_per_second):
+                    window_count += deleted_count
+                    success_count += deleted_count
+                model.set_system_info(ACTIVITIES_DELETED_UNTIL_KEY, window_end.isoformat())
+                print('DEBUG Deleted %d activities from %s to %s in %.1fs, %d of %d in total' % (
+                    window_count, window_start.isoformat(), window_end.isoformat(),
+                    time.time() - window_starttime, success_count, rows_to_delete_count))
+    except Exception as error:
+        model.Session.rollback()
+        print('ERROR while deleting activities! Details: %s' % str(error))
+
+    endtime = time.time()
+    print('=============================================================')
+    print("INFO [%s]: Totally deleted rows: %d. Total time: %s." % \
+                (_format_date_string(endtime), success_count, str(endtime - starttime)))
+
+
+def _delete_activity_chunks(activity_ids, chunk_size, max_rows_per_second=None):
+    '''Deletes the activities of the given query of IDs with SQL statements deleting up to
+       chunk_size rows each and yields the number of deleted rows per committed chunk.
+    '''
+
+    statement = delete(Activity)\
+        .where(Activity.id.in_(activity_ids.limit(chunk_size)))\
+        .execution_options(synchronize_session=False)
+    starttime = time.time()
+    success_count = 0
+    while True:
+        deleted_count = model.Session.execute(statement).rowcount
+        model.repo.commit()
+        success_count += deleted_count
+        yield deleted_count
+        if deleted_count < chunk_size:
+            break
+        if max_rows_per_second:
+            delay = success_count / max_rows_per_second - (time.time() - starttime)
+            if delay > 0:
+                time.sleep(delay)
+
+
+def _activity_windows(activity_ids, date_limit, window_days):
+    '''Yields the windows (start, end) of window_days days up to the given date limit. The
+       first window starts at the oldest activity of the given query of IDs, which is not older
+       than the end of the last completed window stored in the system info.
+    '''
+
+    deleted_until = model.get_system_info(ACTIVITIES_DELETED_UNTIL_KEY)
+    if deleted_until:
+        print('INFO Resume deleting activities from %s.' % deleted_until)
+        activity_ids = activity_ids.where(
+            Activity.timestamp >= datetime.fromisoformat(deleted_until))
+    window_start = model.Session.execute(
+        activity_ids.with_only_columns(func.min(Activity.timestamp))).scalar()
+    while window_start is not None and window_start < date_limit:
+        window_end = min(window_start + timedelta(days=window_days), date_limit)
+        yield window_start, window_end
+        window_start = window_end
+
+
 def _process_result_state(success_count, rows_to_delete_count, object_type):
     '''Executes a commit at checkpoints and at the and of all results. Raises RuntimeError,
        if the maximum number of rows to delete was exceeded.
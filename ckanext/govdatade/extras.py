@@ -12,6 +12,10 @@ class Extras(object):
 
     def __init__(self, extras):
         self.extras = extras
+        # position of the first extra per key in the list of dicts, built on the first lookup
+        self._index = None
+        self._indexed_extras = None
+        self._indexed_length = 0
 
     def get(self):
         '''
@@ -44,23 +48,22 @@ class Extras(object):
         if self.extras is None:
             return False
 
+        # Handle list of dicts
+        if isinstance(self.extras, list):
+            position = self._position(key)
+            if position is None:
+                return False
+            value = self.extras[position].get('value')
+            if isinstance(value, str):
+                value = value.strip()
+            return not disallow_empty or bool(value)
+
         if key in self.extras:
             if disallow_empty and not self.extras[key]:
                 return False
 
             return True
 
-        # Handle list of dicts
-        if isinstance(self.extras, list) and len(self.extras) >= 1:
-            for extra in self.extras:
-                if isinstance(extra, dict) and extra['key'] == key:
-                    value = extra.get('value')
-                    if isinstance(value, str):
-                        value = value.strip()
-                    if disallow_empty and not value:
-                        return False
-                    return True
-
         return False
 
     def value(self, key, default=None):
@@ -68,24 +71,42 @@ class Extras(object):
         Returns the value for the given key. When the
         key is not found a default is returned.
         '''
+        # Handle list of dicts
+        if isinstance(self.extras, list):
+            position = self._position(key)
+            if position is not None:
+                return self.extras[position].get('value')
+            if default is None:
+                raise KeyError
+            return default
+
         if not self.key(key) and default is None:
             raise KeyError
 
         if key in self.extras:
             return self.extras.get(key)
 
-        # Handle list of dicts
-        if isinstance(self.extras, list) and len(self.extras) >= 1:
-            for extra in self.extras:
-                if isinstance(extra, dict) and extra['key'] == key:
-                    return extra.get('value')
-
         return default
 
     def update(self, key, value, upsert=False):
         '''
         Updates the value of the given key.
         '''
+        # Handle list of dicts
+        if isinstance(self.extras, list):
+            position = self._position(key)
+            if position is not None:
+                self.extras[position]['value'] = value
+                return True
+            if upsert is False:
+                raise KeyError
+
+            # add key to list of dicts
+            self.extras.append({'key': key, 'value': value})
+            self._index[key] = len(self.extras) - 1
+            self._indexed_length = len(self.extras)
+            return True
+
         if not self.key(key) and upsert is False:
             raise KeyError
 
@@ -94,24 +115,22 @@ class Extras(object):
             self.extras[key] = value
             return True
 
-        # Handle list of dicts
-        if isinstance(self.extras, list) and len(self.extras) >= 1:
-            for extra in self.extras:
-                if isinstance(extra, dict) and extra['key'] == key:
-                    extra['value'] = value
-                    return True
-
-        # add key to list of dicts
-        if upsert and isinstance(self.extras, list):
-            self.extras.append({'key': key, 'value': value})
-            return True
-
         return False
 
     def remove(self, key):
         '''
         Removes the give key.
         '''
+        # Handle list of dicts
+        if isinstance(self.extras, list):
+            position = self._position(key)
+            if position is None:
+                raise KeyError
+            del self.extras[position]
+            # the positions of the following extras changed
+            self._index = None
+            return True
+
         if not self.key(key):
             raise KeyError
 
@@ -119,11 +138,33 @@ class Extras(object):
             del self.extras[key]
             return True
 
-        # Handle list of dicts
-        if isinstance(self.extras, list) and len(self.extras) >= 1:
-            for index, extra in enumerate(self.extras):
-                if isinstance(extra, dict) and extra['key'] == key:
-                    del self.extras[index]
-                    return True
-
         return False
+
+    def _position(self, key):
+        '''
+        Returns the position of the first extra with the given key in the list of dicts or None.
+        The index is rebuilt, if the list was replaced or changed its length, e.g. by changes
+        of the list returned by get().
+        '''
+        if self._index is None or self._indexed_extras is not self.extras \
+                or self._indexed_length != len(self.extras):
+            self._build_index()
+        position = self._index.get(key)
+        if position is not None and (not isinstance(self.extras[position], dict)
+                                     or self.extras[position].get('key') != key):
+            # the list was changed without changing its length
+            self._build_index()
+            position = self._index.get(key)
+        return position
+
+    def _build_index(self):
+        '''
+        Builds the index of the first extra per key in the list of dicts.
+        '''
+        index = {}
+        for position, extra in enumerate(self.extras):
+            if isinstance(extra, dict):
+                index.setdefault(extra['key'], position)
+        self._index = index
+        self._indexed_extras = self.extras
+        self._indexed_length = len(self.extras)
@@ -0,0 +1,16 @@
+'''
+Marker of the benchmarks, which are not part of the default test run.
+'''
+import os
+import unittest
+
+BENCHMARKS_VARIABLE = 'GOVDATA_BENCHMARKS'
+
+
+def benchmark(test):
+    '''
+    Skips the given benchmark test or class, unless the environment variable
+    GOVDATA_BENCHMARKS is set.
+    '''
+    return unittest.skipUnless(os.environ.get(BENCHMARKS_VARIABLE),
+                               'benchmark, set %s to run it' % BENCHMARKS_VARIABLE)(test)
@@ -0,0 +1,122 @@
+import time
+import unittest
+from datetime import datetime, timedelta
+
+from ckan import model
+from mock import Mock, patch
+from sqlalchemy import Column, DateTime, UnicodeText, create_engine
+from sqlalchemy.orm import declarative_base, sessionmaker
+import ckanext.govdatade.commands.command_util as util
+
+Base = declarative_base()
+
+
+class User(Base):
+    '''
+    The columns of the CKAN user table used by the deletion.
+    '''
+    __tablename__ = 'user'
+    id = Column(UnicodeText, primary_key=True)
+    name = Column(UnicodeText)
+
+
+class Activity(Base):
+    '''
+    The columns of the CKAN activity table used by the deletion.
+    '''
+    __tablename__ = 'activity'
+    id = Column(UnicodeText, primary_key=True)
+    timestamp = Column(DateTime)
+    user_id = Column(UnicodeText)
+
+
+class TestCleanupdbCommand(unittest.TestCase):
+
+    NOT_DELETED = sorted(['new-%s' % index for index in range(5)]
+                         + ['editor-%s' % index for index in range(5)])
+
+    def setUp(self):
+        engine = create_engine('sqlite://')
+        Base.metadata.create_all(engine)
+        self.session = sessionmaker(bind=engine)()
+        self.session.add_all([User(id='1', name='harvest'), User(id='2', name='editor')])
+        now = datetime.today()
+        for index in range(25):
+            # 25 old activities of the user harvest
+            self.session.add(Activity(id='old-%s' % index, user_id='1',
+                                      timestamp=now - timedelta(days=40 + index)))
+        for index in range(5):
+            self.session.add(Activity(id='new-%s' % index, user_id='1',
+                                      timestamp=now - timedelta(days=index)))
+            self.session.add(Activity(id='editor-%s' % index, user_id='2',
+                                      timestamp=now - timedelta(days=40 + index)))
+        self.session.commit()
+
+        self.system_info = {}
+
+    def tearDown(self):
+        self.session.close()
+
+    def _delete_activities(self, commit, **kwargs):
+        with patch.object(model, 'Session', self.session), patch.object(model, 'User', User), \
+                patch.object(model, 'repo', Mock(commit=commit)), \
+                patch.object(model, 'get_system_info', side_effect=self.system_info.get), \
+                patch.object(model, 'set_system_info', side_effect=self.system_info.__setitem__), \
+                patch.object(util, 'Activity', Activity):
+            util.delete_activities_in_chunks(30, **kwargs)
+
+    def _remaining(self):
+        return sorted(activity.id for activity in self.session.query(Activity))
+
+    def test_delete_activities_in_chunks(self):
+        # prepare
+        commit = Mock(side_effect=self.session.commit)
+
+        # execute
+        self._delete_activities(commit, chunk_size=10)
+
+        # verify: old activities of the user harvest are deleted in 3 chunks
+        self.assertEqual(self._remaining(), self.NOT_DELETED)
+        self.assertEqual(commit.call_count, 3)
+        self.assertEqual(self.system_info, {})
+
+    def test_delete_activities_in_windows(self):
+        # prepare
+        commit = Mock(side_effect=self.session.commit)
+
+        # execute
+        self._delete_activities(commit, chunk_size=20, window_days=10)
+
+        # verify: 25 days of old activities and the days up to the limit in 4 windows
+        self.assertEqual(self._remaining(), self.NOT_DELETED)
+        self.assertEqual(commit.call_count, 4)
+        date_limit = (datetime.today() - timedelta(days=30)).strftime('%Y-%m-%d')
+        self.assertEqual(self.system_info, {
+            util.ACTIVITIES_DELETED_UNTIL_KEY: date_limit + 'T00:00:00'})
+
+    def test_delete_activities_in_windows_resumes(self):
+        # prepare: the windows up to 50 days ago were completed
+        commit = Mock(side_effect=self.session.commit)
+        deleted_until = datetime.today() - timedelta(days=50)
+        self.system_info[util.ACTIVITIES_DELETED_UNTIL_KEY] = deleted_until.isoformat()
+
+        # execute
+        self._delete_activities(commit, chunk_size=20, window_days=10)
+
+        # verify: the older activities were not deleted in this run
+        self.assertEqual(self._remaining(), sorted(
+            self.NOT_DELETED + ['old-%s' % index for index in range(10, 25)]))
+        self.assertEqual(commit.call_count, 2)
+
+    def test_delete_activities_max_rows_per_second(self):
+        # prepare
+        commit = Mock(side_effect=self.session.commit)
+
+        # execute
+        starttime = time.time()
+        self._delete_activities(commit, chunk_size=5, max_rows_per_second=50)
+        elapsed = time.time() - starttime
+
+        # verify: the last of 5 chunks is deleted after 20 rows at 50 rows/s
+        self.assertEqual(self._remaining(), self.NOT_DELETED)
+        self.assertGreaterEqual(elapsed, 0.4)
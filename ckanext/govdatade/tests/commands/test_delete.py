@@ -1,9 +1,39 @@
+import bisect
+import csv
+import io
+import os
+import shutil
+import tempfile
 import unittest
 
+from ckan.plugins import toolkit as tk
 from mock import patch, Mock, call
 import ckanext.govdatade.commands.command_util as util
 
 
+class FakeSearchIndex(object):
+    '''
+    Search index stand-in with the given dataset IDs, from which deleted datasets disappear.
+    '''
+
+    def __init__(self, package_ids):
+        self.package_ids = sorted(package_ids)
+        self.requests = []
+
+    def package_search(self, dummy_context, data_dict):
+        self.requests.append(data_dict)
+        start = 0
+        for filter_query in data_dict.get('fq_list', []):
+            # id:{"<last id>" TO *]
+            start = bisect.bisect_right(self.package_ids, filter_query.split('"')[1])
+        results = self.package_ids[start:start + data_dict['rows']]
+        return {'count': len(self.package_ids),
+                'results': [{'id': package_id} for package_id in results]}
+
+    def delete(self, package_id, dummy_admin_user):
+        self.package_ids.remove(package_id)
+
+
 class TestDeleteCommand(unittest.TestCase):
 
     def test_command_delete_missing_second_argument(self):
@@ -104,7 +134,8 @@ class TestDeleteCommand(unittest.TestCase):
         # verify
         self.assertEqual(1, mock_get_action.call_count)
         self.assertEqual(mock_get_action.call_args_list, [call("package_search")])
-        expected_package_search_calls = [call({}, {"fq": package_search_filter_params, "rows": 100, "start": 0})]
+        expected_package_search_calls = [call({}, {"fq": package_search_filter_params, "fl": ['id'],
+                                                   "rows": 1000, "sort": 'id asc'})]
         mock_action_methods.assert_has_calls(expected_package_search_calls)
         # dry-run
         mock_delete.assert_not_called()
@@ -131,11 +162,12 @@ class TestDeleteCommand(unittest.TestCase):
         # verify
         self.assertEqual(1, mock_get_action.call_count)
         self.assertEqual(mock_get_action.call_args_list, [call("package_search")])
-        expected_package_search_calls = [call({}, {"fq": package_search_filter_params, "rows": 100, "start": 0})]
+        expected_package_search_calls = [call({}, {"fq": package_search_filter_params, "fl": ['id'],
+                                                   "rows": 1000, "sort": 'id asc'})]
         mock_action_methods.assert_has_calls(expected_package_search_calls)
         self.assertEqual(2, mock_delete.call_count)
         expected_delete_calls_ordered = []
-        for id in set([x['id'] for x in package_search_result['results']]):
+        for id in [x['id'] for x in package_search_result['results']]:
             expected_delete_calls_ordered.append(call(id, admin_user))
         self.assertEqual(mock_delete.call_args_list, expected_delete_calls_ordered)
 
@@ -156,3 +188,96 @@ class TestDeleteCommand(unittest.TestCase):
         self.assertEqual(mock_get_action.call_args_list, [call("package_delete")])
         expected_package_delete_calls = [call({'user': admin_user['name']}, {'id': package_id})]
         mock_action_methods.assert_has_calls(expected_package_delete_calls)
+
+    @patch('ckanext.govdatade.commands.command_util.search.commit')
+    @patch('ckanext.govdatade.commands.command_util._gather_dataset_ids')
+    @patch('ckanext.govdatade.commands.command_util._delete')
+    def test_delete_datasets_in_batches(self, mock_delete, mock_gather_dataset_ids,
+                                        mock_search_commit):
+        # prepare
+        package_ids = ['id%s' % index for index in range(10)]
+        mock_gather_dataset_ids.return_value = set(package_ids)
+        solr_commits = []
+
+        def delete(package_id, dummy_admin_user):
+            solr_commits.append(tk.config['ckan.search.solr_commit'])
+            if package_id == 'id3':
+                raise ValueError('not found')
+
+        mock_delete.side_effect = delete
+        admin_user = {'name': 'default'}
+        target_dir = tempfile.mkdtemp()
+        failed_ids_file = os.path.join(target_dir, 'failed.csv')
+
+        # execute
+        try:
+            with patch.dict(tk.config, {'ckan.search.solr_commit': True}):
+                util.delete_datasets(False, 'title:waterfall', admin_user, batch_size=3,
+                                     workers=2, failed_ids_file=failed_ids_file)
+                solr_commit = tk.config['ckan.search.solr_commit']
+            with io.open(failed_ids_file, newline='') as csv_file:
+                failed_rows = list(csv.reader(csv_file))
+        finally:
+            shutil.rmtree(target_dir)
+
+        # verify: the search index is committed per batch
+        self.assertCountEqual(mock_delete.call_args_list,
+                              [call(package_id, admin_user) for package_id in package_ids])
+        self.assertEqual(mock_search_commit.call_count, 4)
+        self.assertEqual(solr_commits, [False] * 10)
+        self.assertTrue(solr_commit)
+        self.assertEqual(failed_rows, [['id', 'error'], ['id3', 'not found']])
+
+    @patch('ckanext.govdatade.commands.command_util.search.commit')
+    @patch('ckanext.govdatade.commands.command_util._gather_dataset_ids')
+    @patch('ckanext.govdatade.commands.command_util._delete')
+    def test_delete_datasets_in_batches_dry_run(self, mock_delete, mock_gather_dataset_ids,
+                                                mock_search_commit):
+        # prepare
+        mock_gather_dataset_ids.return_value = {'id1', 'id2'}
+
+        # execute
+        util.delete_datasets(True, 'title:waterfall', {'name': 'default'}, batch_size=1, workers=2)
+
+        # verify
+        mock_delete.assert_not_called()
+        mock_search_commit.assert_not_called()
+
+    @patch('ckan.plugins.toolkit.get_action')
+    @patch('ckanext.govdatade.commands.command_util._delete')
+    def test_delete_datasets_of_large_result(self, mock_delete, mock_get_action):
+        # prepare
+        package_ids = ['%032x' % (index * 7919) for index in range(100000)]
+        index = FakeSearchIndex(package_ids)
+        mock_get_action.return_value = index.package_search
+        package_ids_deleted = []
+
+        def delete(package_id, admin_user):
+            package_ids_deleted.append(package_id)
+            index.delete(package_id, admin_user)
+
+        mock_delete.side_effect = delete
+
+        # execute
+        util.delete_datasets(False, 'title:waterfall', {'name': 'default'})
+
+        # verify: all IDs are found once, although the found datasets are deleted meanwhile
+        self.assertEqual(package_ids_deleted, sorted(package_ids))
+        self.assertEqual(len(index.requests), 101)
+        self.assertTrue(all(request['fl'] == ['id'] for request in index.requests))
+
+    @patch('ckan.plugins.toolkit.get_action')
+    def test_gather_dataset_ids_streams(self, mock_get_action):
+        # prepare
+        index = FakeSearchIndex(['%05d' % number for number in range(2500)])
+        mock_get_action.return_value = index.package_search
+
+        # execute
+        package_ids = util._gather_dataset_ids('title:waterfall')
+        first_ids = [next(package_ids) for dummy_index in range(3)]
+
+        # verify: only the first page was requested
+        self.assertEqual(first_ids, ['00000', '00001', '00002'])
+        self.assertEqual(len(index.requests), 1)
+        self.assertEqual(len(list(package_ids)), 2497)
+        self.assertEqual(index.requests[-1]['fq_list'], ['id:{"01999" TO *]'])
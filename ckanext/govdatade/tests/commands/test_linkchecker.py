@@ -1,10 +1,31 @@
 import json
+import multiprocessing
 import unittest
 
 from ckan.plugins import toolkit as tk
+from mock import patch
 import ckanext.govdatade.commands.command_util as util
+from ckanext.govdatade.tests.http_stub_server import StubServer
+from ckanext.govdatade.validators.link_check_run import dataset_shard
 from ckanext.govdatade.validators.link_checker import LinkChecker
 
+CHECKED_KEY = 'test:checked'
+
+
+def run_worker():
+    '''
+    Runs a link check worker, which records the IDs of the checked datasets.
+    '''
+    validator = LinkChecker(tk.config)
+    link_check_dataset = util.util.link_check_dataset
+
+    def checked_dataset(result):
+        validator.redis_client.rpush(CHECKED_KEY, result['id'])
+        return link_check_dataset(result)
+
+    with patch.object(util.util, 'link_check_dataset', side_effect=checked_dataset):
+        util.run_link_check_worker(validator, workers=2, poll_interval=0.05)
+
 
 class TestLinkChecker(unittest.TestCase):
 
@@ -22,9 +43,10 @@ class TestLinkChecker(unittest.TestCase):
         initial_record = {
             'id': dataset_id,
             'name': dataset_name,
-            'urls': {}
+            'urls': {'http://example.com': {'status': 404, 'date': '2014-01-01', 'strikes': 1}}
         }
-        self.link_checker.redis_client.set(dataset_id, json.dumps(initial_record))
+        self.link_checker.records.save(dataset_id, initial_record)
+        self.link_checker.records.save('2', initial_record)
 
         active_datasets = ['2', '3']
 
@@ -32,5 +54,227 @@ class TestLinkChecker(unittest.TestCase):
         util.delete_deprecated_datasets(active_datasets)
 
         # verify
-        record_actual = self.link_checker.redis_client.get(dataset_id)
+        record_actual = self.link_checker.records.load(dataset_id)
         self.assertIsNone(record_actual)
+        self.assertEqual(list(self.link_checker.records.iterate_dataset_ids()), ['2'])
+
+    def test_migrate_link_checker_records(self):
+        # prepare
+        url_entry = {'status': 404, 'date': '2014-01-01', 'strikes': 3}
+        legacy_record = {'id': '1', 'name': 'example', 'urls': {'http://example.com': url_entry}}
+        self.link_checker.redis_client.set('1', json.dumps(legacy_record))
+        self.link_checker.redis_client.set('2', str(dict(legacy_record, id='2')))
+        self.link_checker.redis_client.set('3', json.dumps({'id': '3', 'urls': {}}))
+        self.link_checker.redis_client.set('harvest_object_id:1', '2015-12-02 14:15:34.793933')
+        self.link_checker.redis_client.set('general', json.dumps({'num_datasets': 3}))
+
+        # execute
+        num_records, dummy_num_values = util.migrate_link_checker_records()
+
+        # verify
+        self.assertEqual(num_records, 3)
+        self.assertEqual(self.link_checker.records.load('1'), legacy_record)
+        self.assertEqual(self.link_checker.records.load('2'), dict(legacy_record, id='2'))
+        self.assertIsNone(self.link_checker.records.load('3'))
+        for key in ('1', '2', '3'):
+            self.assertIsNone(self.link_checker.redis_client.get(key))
+        self.assertIsNotNone(self.link_checker.redis_client.get('harvest_object_id:1'))
+        self.assertIsNotNone(self.link_checker.redis_client.get('general'))
+        self.assertCountEqual(self.link_checker.records.top_broken(), [('1', 3), ('2', 3)])
+
+    def _datasets(self, count, interrupt_after=None):
+        for index in range(count):
+            if index == interrupt_after:
+                raise KeyboardInterrupt()
+            yield {'id': str(index), 'name': 'dataset-%s' % index, 'res_url': []}
+
+    def _run(self, datasets, **kwargs):
+        checked = []
+        process_records = self.link_checker.process_records
+
+        def spy(datasets, workers, normalize):
+            return process_records((checked.append(d['id']) or d for d in datasets), workers,
+                                   normalize)
+
+        with patch.object(util, 'iterate_link_check_results', return_value=datasets), \
+                patch.object(self.link_checker, 'process_records', side_effect=spy):
+            result = util.run_link_checker(self.link_checker, {}, **kwargs)
+        return result, checked
+
+    def _save_broken_record(self, dataset_id):
+        self.link_checker.records.save(dataset_id, {'id': dataset_id, 'name': 'example', 'urls': {
+            'http://example.com': {'status': 404, 'date': '2014-01-01', 'strikes': 1}}})
+
+    def test_run_link_checker(self):
+        # prepare
+        self._save_broken_record('deprecated')
+
+        # execute
+        (num_datasets, completed), checked = self._run(self._datasets(250))
+
+        # verify
+        self.assertEqual((num_datasets, completed), (250, True))
+        self.assertEqual(len(checked), 250)
+        self.assertEqual(json.loads(self.link_checker.redis_client.get('general')),
+                         {'num_datasets': 250})
+        self.assertIsNone(self.link_checker.records.load('deprecated'))
+        self.assertEqual(self.link_checker.redis_client.keys('linkchecker:run:*'), [])
+
+    def test_run_link_checker_migrates_legacy_records(self):
+        # prepare
+        legacy_record = {'id': '1', 'name': 'example', 'urls': {
+            'http://example.com': {'status': 404, 'date': '2014-01-01', 'strikes': 1}}}
+        self.link_checker.redis_client.set('1', json.dumps(legacy_record))
+
+        # execute
+        with patch.object(self.link_checker, 'migrate_legacy_records',
+                          wraps=self.link_checker.migrate_legacy_records) as migrate:
+            self._run(self._datasets(2))
+            self._run(self._datasets(2))
+
+        # verify: the legacy records are migrated by the first run only
+        self.assertEqual(migrate.call_count, 1)
+        self.assertIsNone(self.link_checker.redis_client.get('1'))
+
+    def test_run_link_checker_resume_after_interruption(self):
+        # prepare
+        self._save_broken_record('deprecated')
+        self._save_broken_record('5')
+        with self.assertRaises(KeyboardInterrupt):
+            self._run(self._datasets(300, interrupt_after=250), workers=2)
+
+        # execute
+        (num_datasets, completed), checked = self._run(self._datasets(300), resume=True)
+
+        # verify: the datasets of the interrupted run are not checked again
+        self.assertEqual((num_datasets, completed), (300, True))
+        self.assertEqual(checked, [str(index) for index in range(250, 300)])
+        self.assertIsNone(self.link_checker.records.load('deprecated'))
+        self.assertEqual(self.link_checker.records.load('5'), None)
+        self.assertEqual(json.loads(self.link_checker.redis_client.get('general')),
+                         {'num_datasets': 300})
+
+    def test_run_link_checker_without_resume_starts_again(self):
+        # prepare
+        with self.assertRaises(KeyboardInterrupt):
+            self._run(self._datasets(10, interrupt_after=5))
+
+        # execute
+        (num_datasets, dummy_completed), checked = self._run(self._datasets(10))
+
+        # verify
+        self.assertEqual(num_datasets, 10)
+        self.assertEqual(len(checked), 10)
+
+    def test_run_link_checker_time_limit(self):
+        # prepare
+        self._save_broken_record('deprecated')
+
+        # execute: the time limit is reached after the first dataset
+        (num_datasets, completed), dummy_checked = self._run(self._datasets(10), time_limit=1e-6)
+
+        # verify: the run is not completed, so the deprecated record is kept
+        self.assertEqual((num_datasets, completed), (1, False))
+        self.assertIsNone(self.link_checker.redis_client.get('general'))
+        self.assertIsNotNone(self.link_checker.records.load('deprecated'))
+
+        # execute: the next time box completes the run
+        (num_datasets, completed), checked = self._run(self._datasets(10), resume=True)
+
+        # verify
+        self.assertEqual((num_datasets, completed), (10, True))
+        self.assertEqual(len(checked), 9)
+        self.assertIsNone(self.link_checker.records.load('deprecated'))
+
+    def test_run_link_checker_shards(self):
+        # prepare
+        self._save_broken_record('deprecated')
+        self._save_broken_record('5')
+
+        # execute
+        (num_first, completed_first), checked_first = self._run(self._datasets(100),
+                                                                 shard=(1, 2))
+        first_general = self.link_checker.redis_client.get('general')
+        deprecated_after_first = self.link_checker.records.load('deprecated')
+        (num_second, completed_second), checked_second = self._run(self._datasets(100),
+                                                                   shard=(2, 2))
+
+        # verify: each dataset is checked by one shard, the last shard completes the check
+        self.assertTrue(completed_first and completed_second)
+        self.assertEqual(sorted(checked_first + checked_second, key=int),
+                         [str(index) for index in range(100)])
+        self.assertEqual((len(checked_first), len(checked_second)), (num_first, num_second))
+        self.assertTrue(0 < num_first < 100)
+        self.assertIsNone(first_general)
+        self.assertIsNotNone(deprecated_after_first)
+        self.assertIsNone(self.link_checker.records.load('deprecated'))
+        self.assertIsNone(self.link_checker.records.load('5'))
+        self.assertEqual(json.loads(self.link_checker.redis_client.get('general')),
+                         {'num_datasets': 100})
+
+    def test_run_link_checker_shard_completed_twice(self):
+        # prepare: the first shard is completed again before the second one
+        self._run(self._datasets(10), shard=(1, 2))
+        self._run(self._datasets(10), shard=(1, 2))
+        self.assertIsNone(self.link_checker.redis_client.get('general'))
+
+        # execute
+        self._run(self._datasets(10), shard=(2, 2))
+
+        # verify
+        self.assertEqual(json.loads(self.link_checker.redis_client.get('general')),
+                         {'num_datasets': 10})
+
+    def test_dataset_shard(self):
+        shards = [dataset_shard(str(index), 4) for index in range(1000)]
+
+        self.assertEqual(sorted(set(shards)), [1, 2, 3, 4])
+        self.assertEqual(shards, [dataset_shard(str(index), 4) for index in range(1000)])
+        self.assertTrue(all(150 < shards.count(shard) < 350 for shard in range(1, 5)))
+
+
+class TestLinkCheckWorker(unittest.TestCase):
+
+    NUM_DATASETS = 60
+    NUM_PROCESSES = 3
+
+    def setUp(self):
+        self.link_checker = LinkChecker(tk.config)
+        self.link_checker.redis_client.flushdb()
+        self.server = StubServer().start()
+
+    def tearDown(self):
+        self.server.stop()
+        self.link_checker.redis_client.flushdb()
+
+    def _results(self):
+        for index in range(self.NUM_DATASETS):
+            url = self.server.register('/%s' % index, status=404 if index % 2 else 200,
+                                       delay=0.02)
+            yield {'id': str(index), 'name': 'dataset-%s' % index, 'res_url': [url]}
+
+    def test_workers_check_each_dataset_once(self):
+        # prepare
+        self.link_checker.records.save('deprecated', {'id': 'deprecated', 'name': 'example', 'urls': {
+            'http://example.com': {'status': 404, 'date': '2014-01-01', 'strikes': 1}}})
+        with patch.object(util, 'iterate_link_check_results', return_value=self._results()):
+            self.assertEqual(util.enqueue_link_check(self.link_checker, {}), self.NUM_DATASETS)
+        context = multiprocessing.get_context('spawn')
+        processes = [context.Process(target=run_worker) for dummy_index in range(self.NUM_PROCESSES)]
+
+        # execute
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join(60)
+
+        # verify: the last worker completed the round
+        self.assertEqual([process.exitcode for process in processes], [0] * self.NUM_PROCESSES)
+        checked = self.link_checker.redis_client.lrange(CHECKED_KEY, 0, -1)
+        self.assertEqual(sorted(checked), sorted(str(index) for index in range(self.NUM_DATASETS)))
+        self.assertEqual(json.loads(self.link_checker.redis_client.get('general')),
+                         {'num_datasets': self.NUM_DATASETS})
+        self.assertEqual(len(list(self.link_checker.records.iterate_dataset_ids())),
+                         self.NUM_DATASETS // 2)
+        self.assertIsNone(self.link_checker.records.load('deprecated'))
+        self.assertEqual(self.link_checker.redis_client.keys('linkchecker:queue:*'), [])
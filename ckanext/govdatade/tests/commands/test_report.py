@@ -0,0 +1,103 @@
+import io
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from ckan.plugins import toolkit as tk
+from mock import patch
+import ckanext.govdatade.commands.command_util as util
+from ckanext.govdatade.tests.benchmark import benchmark
+from ckanext.govdatade.validators.link_checker import LinkChecker
+
+LOGGER = logging.getLogger(__name__)
+
+
+def _records(count, num_portals=10):
+    '''
+    Returns the given number of records with a broken URL grouped by portal.
+    '''
+    entries = {}
+    for index in range(count):
+        record = {
+            'id': str(index),
+            'name': 'dataset-%s' % index,
+            'maintainer': 'maintainer-%s' % index,
+            'urls': {'http://example.com/%s' % index: {'status': 'HTTP 404', 'strikes': index % 5}}
+        }
+        entries.setdefault('portal-%s' % (index % num_portals), []).append(record)
+    return entries
+
+
+class TestReport(unittest.TestCase):
+
+    def setUp(self):
+        self.link_checker = LinkChecker(tk.config)
+        self.link_checker.redis_client.flushdb()
+        self.report_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.link_checker.redis_client.flushdb()
+        shutil.rmtree(self.report_dir)
+
+    def test_render_report_rows_in_processes(self):
+        # prepare
+        entries = _records(2 * util.REPORT_FRAGMENT_SIZE + 1, num_portals=1)
+
+        # execute
+        rows = util._render_report_rows(entries, processes=1)
+        rows_in_processes = util._render_report_rows(entries, processes=2)
+
+        # verify: the fragments are joined in the order of the records
+        self.assertEqual(rows, rows_in_processes)
+        self.assertEqual(rows['portal-0'].count('<tr>'), 2 * util.REPORT_FRAGMENT_SIZE + 1)
+        self.assertLess(rows['portal-0'].index('dataset-999<'), rows['portal-0'].index('dataset-1000<'))
+
+    def test_generate_report(self):
+        # prepare
+        self.link_checker.redis_client.set('general', json.dumps({'num_datasets': 2}))
+        self.link_checker.records.save('1', {
+            'id': '1',
+            'name': 'example',
+            'metadata_original_portal': 'http://example.com/portal',
+            'urls': {'http://example.com/broken': {'status': 404, 'date': '2014-01-01', 'strikes': 1}}
+        })
+
+        # execute
+        with patch.dict(tk.config, {'ckanext.govdata.validators.report.dir': self.report_dir}):
+            util.generate_report(processes=2)
+
+        # verify
+        with io.open(os.path.join(self.report_dir, 'linkchecker.html')) as report_file:
+            report = report_file.read()
+        self.assertIn('<td class="name">example</td>', report)
+        self.assertIn('<td class="error">HTTP 404</td>', report)
+
+
+@benchmark
+class TestReportBenchmark(unittest.TestCase):
+
+    NUM_RECORDS = 100000
+
+    def test_render_report_rows_speedup(self):
+        # prepare
+        entries = _records(self.NUM_RECORDS)
+        num_cpus = multiprocessing.cpu_count()
+
+        # execute
+        elapsed = {}
+        for processes in sorted({1, 2, num_cpus}):
+            starttime = time.time()
+            util._render_report_rows(entries, processes)
+            elapsed[processes] = time.time() - starttime
+            LOGGER.info('Rendered %s records with %s processes in %.2fs, speedup %.2f',
+                        self.NUM_RECORDS, processes, elapsed[processes],
+                        elapsed[1] / elapsed[processes])
+
+        # verify
+        if num_cpus >= 2:
+            self.assertLess(elapsed[num_cpus], elapsed[1])
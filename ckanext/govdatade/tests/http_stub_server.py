@@ -0,0 +1,192 @@
+'''
+Local HTTP stub server used by the link checker tests.
+'''
+import os
+import shutil
+import ssl
+import subprocess
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubRoute(object):
+    '''
+    Response definition for a path of the stub server. Instead of a body a body_size can be
+    given, the body of zero bytes is then generated while sending. With an etag the route
+    answers conditional requests with 304. With accept_ranges the route answers a request
+    for the first byte with 206, or with 416 if the body is empty.
+    '''
+
+    def __init__(self, status=200, headers=None, body=b'', delay=0.0, methods=None,
+                 body_size=None, etag=None, accept_ranges=False):
+        self.status = status
+        self.headers = headers or {}
+        self.body = body
+        self.delay = delay
+        self.methods = methods
+        self.body_size = len(body) if body_size is None else body_size
+        self.etag = etag
+        self.accept_ranges = accept_ranges
+
+
+class StubServer(object):
+    '''
+    Threaded HTTP server on a free local port answering with the registered routes. Unknown
+    paths are answered with 404. The server counts the requests, the accepted connections and
+    the maximum number of requests answered at the same time.
+    With tls the server uses a self-signed certificate, which requires the openssl command.
+    '''
+
+    def __init__(self, tls=False):
+        self.routes = {}
+        self.requests = []
+        self.connections = 0
+        self.bytes_sent = 0
+        self.active_requests = 0
+        self.max_active_requests = 0
+        self.scheme = 'https' if tls else 'http'
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+        if tls:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            certificate, key = self_signed_certificate()
+            context.load_cert_chain(certificate, key)
+            shutil.rmtree(os.path.dirname(certificate))
+            self._server.socket = context.wrap_socket(self._server.socket, server_side=True)
+
+    def register(self, path, **kwargs):
+        '''
+        Registers the response for the given path and returns the URL of the path.
+        '''
+        self.routes[path] = StubRoute(**kwargs)
+        return self.url(path)
+
+    def url(self, path):
+        '''
+        Returns the URL of the given path.
+        '''
+        return '%s://127.0.0.1:%s%s' % (self.scheme, self._server.server_address[1], path)
+
+    def start(self):
+        '''
+        Starts serving in a background thread.
+        '''
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        '''
+        Stops serving and closes the socket.
+        '''
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            '''
+            Request handler answering with the routes of the stub server.
+            '''
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                BaseHTTPRequestHandler.setup(self)
+                with server._lock:
+                    server.connections += 1
+
+            def log_message(self, *args):
+                pass
+
+            def do_HEAD(self):
+                self._respond(send_body=False)
+
+            def do_GET(self):
+                self._respond(send_body=True)
+
+            def _respond(self, send_body):
+                with server._lock:
+                    server.requests.append((self.command, self.path, dict(self.headers)))
+                    server.active_requests += 1
+                    server.max_active_requests = max(
+                        server.max_active_requests, server.active_requests)
+                try:
+                    self._respond_route(send_body)
+                finally:
+                    with server._lock:
+                        server.active_requests -= 1
+
+            def _respond_route(self, send_body):
+                route = server.routes.get(self.path, StubRoute(status=404))
+                if route.delay:
+                    time.sleep(route.delay)
+                if route.methods and self.command not in route.methods:
+                    route = StubRoute(status=405)
+                elif route.etag and self.headers.get('If-None-Match') == route.etag:
+                    route = StubRoute(status=304, headers={'ETag': route.etag})
+                elif route.accept_ranges and self.headers.get('Range') == 'bytes=0-0':
+                    route = self._range_route(route)
+                self.send_response(route.status)
+                for name, value in route.headers.items():
+                    self.send_header(name, value)
+                if route.etag:
+                    self.send_header('ETag', route.etag)
+                self.send_header('Content-Length', str(route.body_size))
+                self.end_headers()
+                if send_body and route.body_size:
+                    self._send_body(route)
+
+            def _range_route(self, route):
+                if not route.body_size:
+                    return StubRoute(status=416, headers={'Content-Range': 'bytes */0'})
+                return StubRoute(status=206, body=(route.body or b'\0')[:1], headers=dict(
+                    route.headers, **{'Content-Range': 'bytes 0-0/%s' % route.body_size}))
+
+            def _send_body(self, route):
+                chunk = route.body or b'\0' * 65536
+                remaining = route.body_size
+                try:
+                    while remaining > 0:
+                        data = chunk[:remaining]
+                        self.wfile.write(data)
+                        remaining -= len(data)
+                        with server._lock:
+                            server.bytes_sent += len(data)
+                except (BrokenPipeError, ConnectionResetError, ssl.SSLError):
+                    self.close_connection = True
+
+        return Handler
+
+
+def openssl_available():
+    '''
+    Returns True, if the openssl command is available.
+    '''
+    return shutil.which('openssl') is not None
+
+
+def self_signed_certificate():
+    '''
+    Creates a self-signed certificate for localhost and returns the paths of the certificate
+    and the key file.
+    '''
+    directory = tempfile.mkdtemp()
+    certificate = os.path.join(directory, 'cert.pem')
+    key = os.path.join(directory, 'key.pem')
+    subprocess.check_call(
+        ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+         '-subj', '/CN=localhost', '-keyout', key, '-out', certificate],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return certificate, key
@@ -1,10 +1,15 @@
 #!/usr/bin/python
 # -*- coding: utf8 -*-
+import logging
+import time
 import unittest
 
 from nose.tools import raises
 
 from ckanext.govdatade.extras import Extras
+from ckanext.govdatade.tests.benchmark import benchmark
+
+LOGGER = logging.getLogger(__name__)
 
 
 class TestExtras(unittest.TestCase):
@@ -378,3 +383,51 @@ class TestExtras(unittest.TestCase):
         ])
         self.assertTrue(extras.remove('two'))
         self.assertEqual(1, extras.len())
+
+    def test_index_after_upsert_and_remove(self):
+        extras = Extras([
+            {'key': 'one', 'value': 1},
+            {'key': 'two', 'value': 2},
+            {'key': 'one', 'value': 'duplicate'},
+        ])
+
+        self.assertTrue(extras.update('three', 3, True))
+        self.assertTrue(extras.remove('one'))
+
+        self.assertEqual('duplicate', extras.value('one'))
+        self.assertEqual(2, extras.value('two'))
+        self.assertEqual(3, extras.value('three'))
+        self.assertTrue(extras.remove('two'))
+        self.assertEqual(3, extras.value('three'))
+        self.assertFalse(extras.key('two'))
+
+    def test_index_after_changes_of_the_list(self):
+        extras = Extras([
+            {'key': 'one', 'value': 1},
+            {'key': 'two', 'value': 2},
+        ])
+        self.assertEqual(2, extras.value('two'))
+
+        extras.get().insert(0, {'key': 'zero', 'value': 0})
+        self.assertEqual(2, extras.value('two'))
+        self.assertEqual(0, extras.value('zero'))
+
+        extras.get()[0] = {'key': 'new', 'value': 'new-value'}
+        self.assertFalse(extras.key('zero'))
+        self.assertEqual('new-value', extras.value('new'))
+
+    @benchmark
+    def test_lookups_with_many_extras(self):
+        extras_list = [{'key': 'key-%s' % index, 'value': ' value '} for index in range(250)]
+        keys = [extra['key'] for extra in extras_list]
+
+        starttime = time.time()
+        for dummy_dataset in range(200):
+            extras = Extras([dict(extra) for extra in extras_list])
+            for key in keys:
+                extras.key(key, disallow_empty=True)
+                extras.update(key, extras.value(key).strip())
+        elapsed = time.time() - starttime
+
+        LOGGER.info('Looked up and updated 250 extras of 200 datasets in %.3fs', elapsed)
+        self.assertLess(elapsed, 1.0)
@@ -0,0 +1,72 @@
+import time
+import unittest
+
+import pytest
+from ckan import model
+from ckan.tests import factories
+from ckanext.govdatade.tests.benchmark import benchmark
+from ckanext.govdatade.util import iterate_local_datasets
+from ckanext.govdatade.util import iterate_local_link_check_datasets
+from ckanext.govdatade.util import normalize_action_dataset
+
+
+@pytest.mark.usefixtures('clean_db', 'clean_index')
+class TestLinkCheckDatasets(unittest.TestCase):
+
+    NUM_DATASETS = 20
+    NUM_RESOURCES = 3
+
+    def setUp(self):
+        organization = factories.Organization()
+        for index in range(self.NUM_DATASETS):
+            factories.Dataset(
+                owner_org=organization['id'],
+                maintainer='maintainer %s' % index,
+                maintainer_email='maintainer%s@example.com' % index,
+                extras=[{'key': 'metadata_harvested_portal', 'value': 'http://portal.example.com'}],
+                resources=[{'url': 'http://example.com/%s/%s' % (index, number)}
+                           for number in range(self.NUM_RESOURCES)])
+        self.context = {'model': model, 'session': model.Session, 'ignore_auth': True}
+
+    def _iterate_normalized_local_datasets(self):
+        for dataset in iterate_local_datasets(self.context):
+            normalize_action_dataset(dataset)
+            yield dataset
+
+    @staticmethod
+    def _link_check_fields(dataset):
+        return (dataset['id'], dataset['name'], dataset['maintainer'], dataset['maintainer_email'],
+                sorted(resource['url'] for resource in dataset['resources']),
+                dataset['extras'].get('metadata_harvested_portal'))
+
+    def test_search_index_matches_package_show(self):
+        # execute
+        package_show_datasets = list(self._iterate_normalized_local_datasets())
+        search_datasets = list(iterate_local_link_check_datasets(self.context, rows=5))
+
+        # verify
+        self.assertEqual(len(search_datasets), self.NUM_DATASETS)
+        self.assertEqual(sorted(self._link_check_fields(d) for d in search_datasets),
+                         sorted(self._link_check_fields(d) for d in package_show_datasets))
+
+
+@benchmark
+class TestLinkCheckDatasetsBenchmark(TestLinkCheckDatasets):
+
+    NUM_DATASETS = 200
+
+    @staticmethod
+    def _time(iterator):
+        starttime = time.time()
+        datasets = list(iterator)
+        return datasets, time.time() - starttime
+
+    def test_search_index_is_faster_than_package_show(self):
+        # execute
+        dummy_datasets, package_show_time = self._time(self._iterate_normalized_local_datasets())
+        search_datasets, search_time = self._time(
+            iterate_local_link_check_datasets(self.context, rows=50))
+
+        # verify
+        self.assertEqual(len(search_datasets), self.NUM_DATASETS)
+        self.assertLess(search_time, package_show_time / 5)
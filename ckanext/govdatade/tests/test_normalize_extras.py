@@ -2,8 +2,14 @@
 # -*- coding: utf-8 -*-
 
 import json
+import logging
+import time
 
-from ckanext.govdatade.util import normalize_extras
+from mock import patch
+from ckanext.govdatade.tests.benchmark import benchmark
+from ckanext.govdatade.util import is_valid, normalize_extras
+
+LOGGER = logging.getLogger(__name__)
 
 
 def test_simple_json_object():
@@ -50,3 +56,94 @@ def test_string_encoded_boolean():
 def test_string_encoded_string():
     source = json.dumps({'a': '"string"'})
     assert normalize_extras(source) == {'a': 'string'}
+
+
+def test_string_encoded_json_with_whitespace():
+    source = json.dumps({'a': ' [1, 2]', 'b': '\n{"c": "3"}'})
+    assert normalize_extras(source) == {'a': [1, 2], 'b': {'c': '3'}}
+
+
+def test_string_encoded_null():
+    source = json.dumps({'a': 'null', 'b': ''})
+    assert normalize_extras(source) == {'a': 'null', 'b': ''}
+
+
+def test_strings_parsed_once():
+    source = {'a': json.dumps({'b': json.dumps(['1'])}), 'c': 'text', 'd': '3.5'}
+
+    with patch('ckanext.govdatade.util.json.loads', side_effect=json.loads) as mock_loads, \
+            patch('ckanext.govdatade.util._ORJSON_LOADS', None):
+        assert normalize_extras(source) == {'a': {'b': ['1']}, 'c': 'text', 'd': '3.5'}
+
+    # the strings 'text' and '3.5' cannot be JSON objects, arrays or strings
+    assert mock_loads.call_count == 2
+
+
+def test_fast_json_backend_errors():
+    def strict_loads(source):
+        raise ValueError('not supported: %s' % source)
+
+    with patch('ckanext.govdatade.util._ORJSON_LOADS', strict_loads):
+        assert normalize_extras('["\\ud800"]') == ['\ud800']
+
+
+def test_same_as_parsing_twice():
+    for extras in _extras_of_datasets(10):
+        assert normalize_extras(extras) == _normalize_extras_parsing_twice(extras)
+
+
+@benchmark
+def test_normalize_extras_benchmark():
+    extras = _extras_of_datasets(5000)
+
+    starttime = time.time()
+    for dataset_extras in extras:
+        _normalize_extras_parsing_twice(dataset_extras)
+    elapsed_twice = time.time() - starttime
+    starttime = time.time()
+    for dataset_extras in extras:
+        normalize_extras(dataset_extras)
+    elapsed = time.time() - starttime
+
+    LOGGER.info('Normalized the extras of %s datasets in %.3fs, parsing twice %.3fs',
+                len(extras), elapsed, elapsed_twice)
+    assert elapsed < elapsed_twice
+
+
+def _extras_of_datasets(count):
+    '''
+    Returns the extras of the given number of datasets like the harvested DCAT-AP.de datasets.
+    '''
+    extras = []
+    for index in range(count):
+        polygon = [[[6.0 + point * 0.01, 50.0 + point * 0.01] for point in range(200)]]
+        extras.append({
+            'contributorID': json.dumps(['http://dcat-ap.de/def/contributors/land%s' % index]),
+            'contact_email': 'kontakt-%s@example.com' % index,
+            'geocodingText': json.dumps(['Land %s' % index]),
+            'politicalGeocodingLevelURI': 'http://dcat-ap.de/def/politicalGeocoding/Level/state',
+            'spatial': json.dumps({'type': 'Polygon', 'coordinates': polygon}),
+            'temporal_start': '2020-01-01T00:00:00',
+            'temporal_granularity_factor': 1,
+            'metadata_original_portal': 'http://example.com/portal/%s' % (index % 10),
+            'metadata_harvested_portal': 'example',
+            'originator_contacts': json.dumps([
+                {'name': 'Stelle %s' % contact, 'email': 'stelle-%s@example.com' % contact,
+                 'url': 'http://example.com/%s' % contact} for contact in range(10)]),
+            'used_datasets': json.dumps([json.dumps('dataset-%s' % index)]),
+            'licenseAttributionByText': 'Datenquelle: Land %s' % index
+        })
+    return extras
+
+
+def _normalize_extras_parsing_twice(source):
+    '''
+    The normalization validating and parsing each string separately.
+    '''
+    if isinstance(source, dict):
+        return {key: _normalize_extras_parsing_twice(value) for key, value in source.items()}
+    if isinstance(source, list):
+        return [_normalize_extras_parsing_twice(item) for item in source]
+    if isinstance(source, str) and is_valid(source):
+        return _normalize_extras_parsing_twice(json.loads(source))
+    return source
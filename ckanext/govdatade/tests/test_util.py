@@ -3,18 +3,70 @@
 
 import datetime
 import json
+import re
+import threading
+import time
 import unittest
+import uuid
 
 from ckan.plugins import toolkit as tk
 from ckanext.govdatade.extras import Extras
+from ckanext.govdatade.tests.benchmark import benchmark
 from ckanext.govdatade.util import amend_portal
 from ckanext.govdatade.util import fix_group_dict_list
 from ckanext.govdatade.util import generate_link_checker_data
 from ckanext.govdatade.util import get_group_dict
+from ckanext.govdatade.util import iterate_local_link_check_datasets
+from ckanext.govdatade.util import iterate_remote_datasets
+from ckanext.govdatade.util import LINK_CHECK_FIELDS
 from ckanext.govdatade.util import normalize_action_dataset
 from ckanext.govdatade.util import normalize_api_dataset
 from ckanext.govdatade.util import remove_group_dict
 from ckanext.govdatade.validators.link_checker import LinkChecker
+from mock import patch
+import requests
+
+
+class FakeRemoteCKAN(object):
+
+    '''
+    Serves package_search of the given dataset IDs with the ID range filter queries of
+    iterate_remote_datasets.
+    '''
+
+    FQ_PATTERN = re.compile(r'^id:([\[{])(\*|"[^"]*") TO (\*|"[^"]*")([\]}])$')
+
+    def __init__(self, dataset_ids, failures=0, delay=0, count_failures=0):
+        self.dataset_ids = sorted(dataset_ids)
+        self.failures = failures
+        self.count_failures = count_failures
+        self.delay = delay
+        self.calls = []
+        self.lock = threading.Lock()
+        self.action = self
+
+    def __call__(self, endpoint):
+        return self
+
+    def package_search(self, **kwargs):
+        with self.lock:
+            self.calls.append(kwargs)
+            if 'fq' not in kwargs:
+                if self.count_failures > 0:
+                    self.count_failures -= 1
+                    raise requests.exceptions.ConnectionError('connection reset')
+                return {'count': len(self.dataset_ids), 'results': []}
+            if self.failures > 0:
+                self.failures -= 1
+                raise requests.exceptions.ConnectionError('connection reset')
+        time.sleep(self.delay)
+        lower_type, lower, upper, upper_type = self.FQ_PATTERN.match(kwargs['fq']).groups()
+        results = [{'id': dataset_id} for dataset_id in self.dataset_ids
+                   if (lower == '*' or dataset_id > lower.strip('"')
+                       or (lower_type == '[' and dataset_id == lower.strip('"')))
+                   and (upper == '*' or dataset_id < upper.strip('"')
+                        or (upper_type == ']' and dataset_id == upper.strip('"')))]
+        return {'count': len(results), 'results': results[:kwargs['rows']]}
 
 
 class UtilTest(unittest.TestCase):
@@ -252,6 +304,7 @@ class UtilTest(unittest.TestCase):
            'metadata_original_portal': portal
         }
         self.link_checker.redis_client.set(dataset_id, serializer_function(initial_record))
+        self.link_checker.migrate_legacy_records()
         data = {}
 
         # execute
@@ -280,5 +333,149 @@ class UtilTest(unittest.TestCase):
         self._run_test_generate_data(json.dumps)
 
     def test_link_checker_data_legacy(self):
-        # older entries are just direct strings of dicts, they should be supported as well
-        self._run_test_generate_data(str)
\ No newline at end of file
+        # older entries are just direct strings of dicts, they should be migrated as well
+        self._run_test_generate_data(str)
+
+    @patch('ckan.logic.get_action')
+    def test_iterate_local_link_check_datasets(self, mock_get_action):
+        # prepare
+        results = [{'id': 'id1', 'name': 'dataset1', 'maintainer': 'maintainer',
+                    'maintainer_email': 'maintainer@example.com',
+                    'res_url': ['http://example.com/1', 'http://example.com/2'],
+                    'metadata_harvested_portal': '"http://portal.example.com"'},
+                   {'id': 'id2', 'name': 'dataset2'},
+                   {'id': 'id3', 'name': 'dataset3'}]
+        mock_get_action.return_value.side_effect = [
+            {'results': results[:2]}, {'results': results[2:]}]
+        context = {'ignore_auth': True}
+
+        # execute
+        datasets = list(iterate_local_link_check_datasets(context, rows=2))
+
+        # verify
+        mock_get_action.assert_called_once_with('package_search')
+        data_dicts = [args[1] for args, dummy_kwargs in mock_get_action.return_value.call_args_list]
+        self.assertEqual(data_dicts, [
+            {'q': '*:*', 'fl': LINK_CHECK_FIELDS, 'rows': 2, 'sort': 'id asc'},
+            {'q': '*:*', 'fl': LINK_CHECK_FIELDS, 'rows': 2, 'sort': 'id asc',
+             'fq_list': ['id:{"id2" TO *]']}])
+        self.assertEqual([dataset['id'] for dataset in datasets], ['id1', 'id2', 'id3'])
+        self.assertEqual(datasets[0], {
+            'id': 'id1',
+            'name': 'dataset1',
+            'maintainer': 'maintainer',
+            'maintainer_email': 'maintainer@example.com',
+            'resources': [{'url': 'http://example.com/1'}, {'url': 'http://example.com/2'}],
+            'extras': {'metadata_harvested_portal': 'http://portal.example.com'}
+        })
+        self.assertEqual(datasets[1]['resources'], [])
+        self.assertEqual(datasets[1]['extras'], {})
+
+    def test_iterate_remote_datasets(self):
+        # prepare
+        dataset_ids = [str(uuid.uuid4()) for dummy_index in range(2500)] + ['Z-custom', '~custom']
+        remote_ckan = FakeRemoteCKAN(dataset_ids)
+
+        # execute
+        with patch('ckanapi.RemoteCKAN', remote_ckan):
+            datasets = list(iterate_remote_datasets('http://remote.example.com', max_rows=100))
+
+        # verify
+        self.assertEqual(sorted(dataset['id'] for dataset in datasets), sorted(dataset_ids))
+        page_calls = [kwargs for kwargs in remote_ckan.calls if 'fq' in kwargs]
+        self.assertTrue(all('start' not in kwargs and kwargs['sort'] == 'id asc'
+                            for kwargs in page_calls))
+        self.assertLess(len(page_calls), 2500 / 100 + 2 * 16)
+
+    def test_iterate_remote_datasets_retries_failed_pages(self):
+        # prepare
+        dataset_ids = [str(uuid.uuid4()) for dummy_index in range(200)]
+        remote_ckan = FakeRemoteCKAN(dataset_ids, failures=3)
+
+        # execute
+        with patch('ckanapi.RemoteCKAN', remote_ckan):
+            datasets = list(iterate_remote_datasets('http://remote.example.com', backoff=0))
+
+        # verify
+        self.assertEqual(sorted(dataset['id'] for dataset in datasets), sorted(dataset_ids))
+
+    def test_iterate_remote_datasets_retries_total_number(self):
+        # prepare
+        dataset_ids = [str(uuid.uuid4()) for dummy_index in range(20)]
+        remote_ckan = FakeRemoteCKAN(dataset_ids, count_failures=2)
+
+        # execute
+        with patch('ckanapi.RemoteCKAN', remote_ckan):
+            datasets = list(iterate_remote_datasets('http://remote.example.com', backoff=0))
+
+        # verify
+        self.assertEqual(sorted(dataset['id'] for dataset in datasets), sorted(dataset_ids))
+
+    def test_iterate_remote_datasets_fails_after_retries(self):
+        # prepare
+        remote_ckan = FakeRemoteCKAN([str(uuid.uuid4())], failures=100)
+
+        # execute
+        with patch('ckanapi.RemoteCKAN', remote_ckan):
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                list(iterate_remote_datasets('http://remote.example.com', retries=1, backoff=0))
+
+        # verify: the total number and at least one page with one retry
+        self.assertGreaterEqual(len(remote_ckan.calls), 3)
+
+    def test_iterate_remote_datasets_prefetch_is_bounded(self):
+        # prepare
+        dataset_ids = ['%x%07d' % (index % 16, index) for index in range(1600)]
+        remote_ckan = FakeRemoteCKAN(dataset_ids)
+
+        # execute: the consumer stops after the first page
+        with patch('ckanapi.RemoteCKAN', remote_ckan):
+            iterator = iterate_remote_datasets('http://remote.example.com', max_rows=10,
+                                               workers=2, prefetch_pages=3)
+            next(iterator)
+            time.sleep(0.5)
+            num_calls = len(remote_ckan.calls)
+            iterator.close()
+
+        # verify: the pages in the queue, the page taken and a page per blocked worker
+        self.assertLessEqual(num_calls, 1 + 3 + 1 + 2)
+        time.sleep(0.3)
+        self.assertEqual(len(remote_ckan.calls), num_calls)
+
+    def test_iterate_remote_datasets_streams_pages(self):
+        # prepare
+        dataset_ids = ['%x%07d' % (index % 16, index) for index in range(320)]
+        remote_ckan = FakeRemoteCKAN(dataset_ids, delay=0.05)
+
+        # execute
+        with patch('ckanapi.RemoteCKAN', remote_ckan):
+            iterator = iterate_remote_datasets('http://remote.example.com', max_rows=10)
+            next(iterator)
+            num_calls = len(remote_ckan.calls)
+            num_datasets = 1 + sum(1 for dummy_dataset in iterator)
+
+        # verify: the first dataset is yielded before the 16 ranges with 2 pages and an empty
+        # page are retrieved
+        self.assertEqual(num_datasets, 320)
+        self.assertLess(num_calls, 1 + 16 * 3)
+
+    @benchmark
+    def test_iterate_remote_datasets_streams_pages_concurrently(self):
+        # prepare
+        dataset_ids = ['%x%07d' % (index % 16, index) for index in range(320)]
+        remote_ckan = FakeRemoteCKAN(dataset_ids, delay=0.05)
+
+        # execute
+        with patch('ckanapi.RemoteCKAN', remote_ckan):
+            starttime = time.time()
+            iterator = iterate_remote_datasets('http://remote.example.com', max_rows=10)
+            next(iterator)
+            first_dataset_time = time.time() - starttime
+            num_datasets = 1 + sum(1 for dummy_dataset in iterator)
+            total_time = time.time() - starttime
+
+        # verify: 16 ranges with 2 pages and an empty page are retrieved by 4 workers
+        # concurrently
+        self.assertEqual(num_datasets, 320)
+        self.assertLess(first_dataset_time, total_time / 4)
+        self.assertLess(total_time, 16 * 3 * 0.05 / 2)
@@ -0,0 +1,126 @@
+import json
+import unittest
+
+from ckan.plugins import toolkit as tk
+from ckanext.govdatade.tests.http_stub_server import StubServer
+from ckanext.govdatade.validators.backends import create_link_checker
+from ckanext.govdatade.validators.link_checker import LinkChecker
+from mock import patch
+import requests
+
+try:
+    from ckanext.govdatade.validators.async_link_checker import AsyncLinkChecker
+except ImportError:
+    AsyncLinkChecker = None
+
+
+@unittest.skipIf(AsyncLinkChecker is None, 'aiohttp not installed')
+class TestAsyncLinkChecker(unittest.TestCase):
+
+    def setUp(self):
+        self.link_checker = AsyncLinkChecker(tk.config)
+        self.link_checker.default_timeout = 0.5
+        self.link_checker.redis_client.flushdb()
+        self.server = StubServer().start()
+
+    def tearDown(self):
+        self.server.stop()
+        self.link_checker.redis_client.flushdb()
+
+    def _register_urls(self):
+        return [
+            self.server.register('/ok'),
+            self.server.register('/not-found', status=404),
+            self.server.register('/head-not-allowed', methods=['GET']),
+            self.server.register('/moved', status=301, headers={'Location': '/ok'}),
+            self.server.register('/moved-to-404', status=302, headers={'Location': '/404.html'}),
+            self.server.register('/loop', status=302, headers={'Location': '/loop'}),
+            self.server.register('/slow', delay=1.0),
+            'http://127.0.0.1:1/refused',
+        ]
+
+    def _check(self, link_checker, urls):
+        dataset = {'id': '1', 'name': 'example', 'resources': [{'url': url} for url in urls]}
+        results = list(link_checker.process_records(iter([dataset]), workers=4))
+        self.assertIsNone(results[0][1])
+        return link_checker.records.load('1')
+
+    def test_check_url_results(self):
+        # prepare
+        urls = self._register_urls()
+
+        # execute
+        record = self._check(self.link_checker, urls)
+
+        # verify
+        statuses = dict((url, entry['status']) for url, entry in record['urls'].items())
+        self.assertEqual(statuses[self.server.url('/not-found')], 404)
+        self.assertEqual(statuses[self.server.url('/moved-to-404')], 404)
+        self.assertEqual(statuses[self.server.url('/loop')], 'Redirect Loop')
+        self.assertEqual(statuses[self.server.url('/slow')], 'Timeout')
+        self.assertIn('http://127.0.0.1:1/refused', statuses)
+        self.assertNotIn(self.server.url('/ok'), statuses)
+        self.assertNotIn(self.server.url('/head-not-allowed'), statuses)
+        self.assertNotIn(self.server.url('/moved'), statuses)
+
+    def test_check_url_results_equal_to_requests_backend(self):
+        # prepare
+        urls = self._register_urls()
+        sync_link_checker = LinkChecker(tk.config)
+        sync_link_checker.default_timeout = 0.5
+
+        # execute
+        async_record = self._check(self.link_checker, urls)
+        self.link_checker.redis_client.flushdb()
+        sync_record = self._check(sync_link_checker, urls)
+
+        # verify
+        self.assertEqual(async_record['urls'], sync_record['urls'])
+        self.assertEqual(async_record['urls']['http://127.0.0.1:1/refused']['status'],
+                         'Connection Error')
+
+    def test_get_probe(self):
+        # prepare
+        urls = [self.server.register('/data.csv', methods=['GET'], body_size=1024,
+                                     accept_ranges=True),
+                self.server.register('/empty.csv', methods=['GET'], accept_ranges=True)]
+
+        # execute
+        self._check(self.link_checker, urls + [self.server.url('/not-found')])
+
+        # verify
+        ranges = [(path, headers.get('Range')) for method, path, headers in self.server.requests
+                  if method == 'GET']
+        self.assertCountEqual(ranges, [('/data.csv', 'bytes=0-0'), ('/empty.csv', None),
+                                       ('/empty.csv', 'bytes=0-0')])
+
+    @patch.dict("ckan.plugins.toolkit.config", {'ckanext.govdata.validators.linkchecker.backend': 'asyncio'})
+    def test_create_link_checker_asyncio(self):
+        self.assertIsInstance(create_link_checker(tk.config), AsyncLinkChecker)
+
+    @patch.dict("ckan.plugins.toolkit.config", {'ckanext.govdata.validators.linkchecker.backend': 'unknown'})
+    def test_create_link_checker_unknown_backend(self):
+        link_checker = create_link_checker(tk.config)
+        self.assertIs(type(link_checker), LinkChecker)
+
+
+class TestCreateLinkChecker(unittest.TestCase):
+
+    @patch.dict("ckan.plugins.toolkit.config", {'ckanext.govdata.validators.linkchecker.backend': 'asyncio'})
+    @patch.dict('sys.modules', {'ckanext.govdatade.validators.async_link_checker': None})
+    def test_create_link_checker_without_aiohttp(self):
+        link_checker = create_link_checker(tk.config)
+        self.assertIs(type(link_checker), LinkChecker)
+
+    def test_describe_error(self):
+        link_checker = LinkChecker(tk.config)
+        self.assertEqual(link_checker.describe_error(requests.exceptions.ConnectTimeout()), 'Timeout')
+        self.assertEqual(link_checker.describe_error(requests.exceptions.SSLError()), 'SSL Error')
+        self.assertEqual(link_checker.describe_error(requests.exceptions.ConnectionError()),
+                         'Connection Error')
+        self.assertEqual(link_checker.describe_error(requests.exceptions.MissingSchema()),
+                         'Invalid URL')
+        self.assertEqual(link_checker.describe_error(requests.exceptions.ChunkedEncodingError()),
+                         'Request Error')
+        self.assertIsNone(link_checker.describe_error(ValueError()))
+        self.assertEqual(link_checker.describe_error(KeyError()), 'Unknown Error')
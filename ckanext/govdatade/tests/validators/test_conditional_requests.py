@@ -0,0 +1,113 @@
+import json
+import time
+import unittest
+from datetime import date, timedelta
+
+from ckan.plugins import toolkit as tk
+from ckanext.govdatade.tests.benchmark import benchmark
+from ckanext.govdatade.tests.http_stub_server import StubServer
+from ckanext.govdatade.validators.link_checker import LinkChecker
+
+
+class TestConditionalRequests(unittest.TestCase):
+
+    # larger than the socket buffers of the loopback interface
+    SMALL_BODY_SIZE = 32 * 1024 * 1024
+    BODY_SIZE = 256 * 1024 * 1024
+
+    def setUp(self):
+        self.link_checker = LinkChecker(tk.config)
+        self.link_checker.redis_client.flushdb()
+        self.server = StubServer().start()
+        self.day = date(2024, 1, 1)
+
+    def tearDown(self):
+        self.server.stop()
+        self.link_checker.redis_client.flushdb()
+
+    def _run(self, urls):
+        schedule = self.link_checker.enable_url_schedule()
+        schedule.today = lambda: self.day
+        self.server.requests = []
+        dataset = {'id': '1', 'name': 'example', 'resources': [{'url': url} for url in urls]}
+        for dummy_dataset, error in self.link_checker.process_records(iter([dataset]), 2):
+            self.assertIsNone(error)
+        self.day += timedelta(days=1)
+        return schedule
+
+    def _request_headers(self, path):
+        return [headers for dummy_method, request_path, headers in self.server.requests
+                if request_path == path]
+
+    def test_is_available_304(self):
+        self.assertTrue(self.link_checker.is_available(304))
+
+    def test_etag_is_sent_on_recheck(self):
+        # prepare
+        url = self.server.register('/data.csv', methods=['GET'], body_size=1024, etag='"v1"')
+
+        # execute
+        self._run([url])
+        schedule = self._run([url])
+
+        # verify
+        headers = self._request_headers('/data.csv')
+        self.assertEqual([h.get('If-None-Match') for h in headers], ['"v1"', '"v1"'])
+        self.assertIsNone(self.link_checker.records.load('1'))
+        entry = schedule.load([url])[url]
+        self.assertEqual(entry['etag'], '"v1"')
+        self.assertEqual(entry['interval'], 2)
+
+    def test_last_modified_is_sent_on_recheck(self):
+        # prepare
+        last_modified = 'Wed, 21 Oct 2015 07:28:00 GMT'
+        url = self.server.register('/data.csv', headers={'Last-Modified': last_modified})
+
+        # execute
+        self._run([url])
+        self._run([url])
+
+        # verify
+        headers = self._request_headers('/data.csv')
+        self.assertEqual([h.get('If-Modified-Since') for h in headers], [last_modified])
+
+    def test_validators_of_broken_url_are_dropped(self):
+        # prepare
+        url = self.server.register('/data.csv', etag='"v1"')
+        self._run([url])
+        self.server.register('/data.csv', status=404)
+
+        # execute
+        schedule = self._run([url])
+
+        # verify
+        self.assertNotIn('etag', schedule.load([url])[url])
+        record = self.link_checker.records.load('1')
+        self.assertEqual(record['urls'][url]['status'], 404)
+
+    def test_validators_without_schedule_are_not_remembered(self):
+        url = self.server.register('/data.csv', etag='"v1"')
+
+        self.assertEqual(self.link_checker.validate(url), 200)
+
+        self.assertEqual(self.link_checker._received_validators, {})
+
+    def test_get_fallback_does_not_consume_body(self):
+        self._assert_body_not_consumed(self.SMALL_BODY_SIZE)
+
+    @benchmark
+    def test_get_fallback_does_not_consume_large_body(self):
+        self._assert_body_not_consumed(self.BODY_SIZE)
+
+    def _assert_body_not_consumed(self, body_size):
+        # prepare
+        url = self.server.register('/large.csv', methods=['GET'], body_size=body_size)
+
+        # execute
+        status = self.link_checker.validate(url)
+        # give the server the time to notice the closed connection
+        time.sleep(0.5)
+
+        # verify: only what fits into the socket buffers was sent
+        self.assertEqual(status, 200)
+        self.assertLess(self.server.bytes_sent, body_size)
@@ -0,0 +1,100 @@
+import time
+import tracemalloc
+import unittest
+
+from ckan.plugins import toolkit as tk
+from ckanext.govdatade.tests.benchmark import benchmark
+from ckanext.govdatade.tests.http_stub_server import StubServer
+from ckanext.govdatade.validators.link_checker import LinkChecker
+
+
+class TestGetProbe(unittest.TestCase):
+
+    # larger than the socket buffers of the loopback interface
+    SMALL_BODY_SIZE = 32 * 1024 * 1024
+    BODY_SIZE = 4 * 1024 * 1024 * 1024
+    MAX_MEMORY = 4 * 1024 * 1024
+
+    def setUp(self):
+        self.link_checker = LinkChecker(tk.config)
+        self.server = StubServer().start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def _get_requests(self):
+        return [(path, headers) for method, path, headers in self.server.requests
+                if method == 'GET']
+
+    def test_probe_requests_first_byte(self):
+        # prepare
+        url = self.server.register('/data.csv', methods=['GET'], body_size=1024,
+                                   accept_ranges=True)
+
+        # execute
+        status = self.link_checker.validate(url)
+
+        # verify
+        self.assertEqual(status, 206)
+        self.assertTrue(self.link_checker.is_available(status))
+        dummy_path, headers = self._get_requests()[0]
+        self.assertEqual(headers['Range'], 'bytes=0-0')
+        self.assertEqual(headers['Connection'], 'close')
+
+    def test_probe_without_range_on_416(self):
+        # prepare
+        url = self.server.register('/empty.csv', methods=['GET'], accept_ranges=True)
+
+        # execute
+        status = self.link_checker.validate(url)
+
+        # verify
+        self.assertEqual(status, 200)
+        headers = [headers for dummy_path, headers in self._get_requests()]
+        self.assertEqual([h.get('Range') for h in headers], ['bytes=0-0', None])
+
+    def test_probe_does_not_read_redirect_body(self):
+        # prepare
+        target = self.server.register('/data.csv', methods=['GET'])
+        url = self.server.register('/redirect', status=302, headers={'Location': target},
+                                   body_size=self.SMALL_BODY_SIZE)
+
+        # execute
+        status = self.link_checker.validate(url)
+        time.sleep(0.5)
+
+        # verify
+        self.assertEqual(status, 200)
+        self.assertLess(self.server.bytes_sent, self.SMALL_BODY_SIZE)
+
+    def test_probe_does_not_read_body(self):
+        # prepare: the server ignores the range
+        url = self.server.register('/data.bin', methods=['GET'], body_size=self.SMALL_BODY_SIZE)
+
+        # execute
+        status = self.link_checker.validate(url)
+        time.sleep(0.5)
+
+        # verify
+        self.assertEqual(status, 200)
+        self.assertLess(self.server.bytes_sent, self.SMALL_BODY_SIZE)
+
+    @benchmark
+    def test_probe_memory_with_large_body(self):
+        # prepare: the server ignores the range and sends a body of 4 GB
+        url = self.server.register('/large.bin', methods=['GET'], body_size=self.BODY_SIZE)
+        tracemalloc.start()
+
+        # execute
+        starttime = time.time()
+        status = self.link_checker.validate(url)
+        elapsed = time.time() - starttime
+        dummy_current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        time.sleep(0.5)
+
+        # verify
+        self.assertEqual(status, 200)
+        self.assertLess(peak, self.MAX_MEMORY)
+        self.assertLess(elapsed, 5)
+        self.assertLess(self.server.bytes_sent, self.BODY_SIZE / 100)
@@ -0,0 +1,170 @@
+import json
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+from ckan.plugins import toolkit as tk
+from ckanext.govdatade.tests.http_stub_server import StubServer
+from ckanext.govdatade.validators.host_scheduler import HostScheduler, RetryAfter
+from ckanext.govdatade.validators.link_checker import LinkChecker
+
+
+class TestHostScheduler(unittest.TestCase):
+
+    def test_host(self):
+        self.assertEqual(HostScheduler.host('https://Example.com:8443/a?b=c'), 'example.com:8443')
+        self.assertEqual(HostScheduler.host(b'http://example.com/a'), 'example.com')
+        self.assertEqual(HostScheduler.host('no url'), '')
+
+    def test_parse_retry_after(self):
+        self.assertEqual(HostScheduler.parse_retry_after('120'), 120)
+        self.assertIsNone(HostScheduler.parse_retry_after(None))
+        self.assertIsNone(HostScheduler.parse_retry_after('soon'))
+        retry_date = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=60), usegmt=True)
+        self.assertAlmostEqual(HostScheduler.parse_retry_after(retry_date), 60, delta=2)
+        retry_date = format_datetime(datetime.now(timezone.utc) - timedelta(seconds=60), usegmt=True)
+        self.assertEqual(HostScheduler.parse_retry_after(retry_date), 0)
+
+    def test_max_per_host(self):
+        # prepare
+        lock = threading.Lock()
+        active = {}
+        max_active = {}
+
+        def task(host):
+            with lock:
+                active[host] = active.get(host, 0) + 1
+                max_active[host] = max(max_active.get(host, 0), active[host])
+            time.sleep(0.05)
+            with lock:
+                active[host] -= 1
+            return host
+
+        # execute
+        with HostScheduler(workers=8, max_per_host=2) as scheduler:
+            futures = [scheduler.submit('http://%s/%s' % (host, index), task, host)
+                       for index in range(6) for host in ('a.example', 'b.example')]
+            results = [future.result() for future in futures]
+
+        # verify
+        self.assertEqual(results, ['a.example', 'b.example'] * 6)
+        self.assertEqual(max_active, {'a.example': 2, 'b.example': 2})
+
+    def test_requests_per_second(self):
+        # prepare
+        starttime = time.monotonic()
+
+        # execute
+        with HostScheduler(workers=4, requests_per_second=20) as scheduler:
+            futures = [scheduler.submit('http://a.example/%s' % index, time.monotonic)
+                       for index in range(5)]
+            times = [future.result() for future in futures]
+
+        # verify: 5 requests with 20 requests per second take at least 0.2 seconds
+        self.assertGreaterEqual(max(times) - starttime, 0.19)
+
+    def test_hosts_are_interleaved(self):
+        # prepare
+        order = []
+
+        # execute
+        with HostScheduler(workers=1) as scheduler:
+            futures = [scheduler.submit('http://%s/%s' % (host, index), order.append, host)
+                       for host in ('a', 'b', 'c') for index in range(2)]
+            for future in futures:
+                future.result()
+
+        # verify
+        self.assertEqual(order, ['a', 'b', 'c', 'a', 'b', 'c'])
+
+    def test_retry_after(self):
+        # prepare
+        calls = []
+
+        def task():
+            calls.append(time.monotonic())
+            if len(calls) == 1:
+                raise RetryAfter(0.2, 503)
+            return 200
+
+        # execute
+        with HostScheduler(workers=2) as scheduler:
+            result = scheduler.submit('http://a.example/', task).result()
+            metrics = scheduler.metrics()
+
+        # verify
+        self.assertEqual(result, 200)
+        self.assertGreaterEqual(calls[1] - calls[0], 0.2)
+        self.assertEqual(metrics['a.example']['retries'], 1)
+        self.assertEqual(metrics['a.example']['requests'], 2)
+        self.assertEqual(metrics['a.example']['queue_depth'], 0)
+        self.assertEqual(metrics['a.example']['max_queue_depth'], 1)
+        self.assertGreaterEqual(metrics['a.example']['wait_time'], 0.2)
+
+    def test_retry_after_exhausted(self):
+        def task():
+            raise RetryAfter(0, 429)
+
+        with HostScheduler(workers=1, max_retries=2) as scheduler:
+            result = scheduler.submit('http://a.example/', task).result()
+            metrics = scheduler.metrics()
+
+        self.assertEqual(result, HostScheduler.NOT_CHECKED)
+        self.assertEqual(metrics['a.example']['requests'], 3)
+
+    def test_retry_after_too_long(self):
+        def task():
+            raise RetryAfter(3600, 503)
+
+        with HostScheduler(workers=1, max_retry_after=300) as scheduler:
+            result = scheduler.submit('http://a.example/', task).result()
+
+        self.assertEqual(result, HostScheduler.NOT_CHECKED)
+
+    def test_exception(self):
+        def task():
+            raise KeyError('key')
+
+        with HostScheduler(workers=1) as scheduler:
+            future = scheduler.submit('http://a.example/', task)
+
+        with self.assertRaises(KeyError):
+            future.result()
+
+
+class TestLinkCheckerRetryAfter(unittest.TestCase):
+
+    def setUp(self):
+        self.link_checker = LinkChecker(tk.config)
+        self.link_checker.redis_client.flushdb()
+        self.server = StubServer().start()
+
+    def tearDown(self):
+        self.server.stop()
+        self.link_checker.redis_client.flushdb()
+
+    def test_too_many_requests_is_retried(self):
+        # prepare
+        url = self.server.register('/busy', status=429, headers={'Retry-After': '0'})
+        dataset = {'id': '1', 'name': 'example', 'resources': [{'url': url}]}
+        entry = {'status': 404, 'date': '2024-01-01', 'strikes': 2}
+        self.link_checker.records.save('1', {'id': '1', 'name': 'example', 'urls': {url: entry}})
+
+        # execute
+        results = list(self.link_checker.process_records(iter([dataset]), workers=2))
+
+        # verify: the URL was not checked, so the record keeps its strikes
+        self.assertIsNone(results[0][1])
+        self.assertEqual(len(self.server.requests), 3)
+        record = self.link_checker.records.load('1')
+        self.assertEqual(record['urls'][url], entry)
+        metrics = self.link_checker.host_metrics[HostScheduler.host(url)]
+        self.assertEqual(metrics['retries'], 2)
+
+    def test_retry_after_is_ignored_without_scheduler(self):
+        url = self.server.register('/busy', status=503, headers={'Retry-After': '0'})
+
+        self.assertEqual(self.link_checker.check_url(url), 503)
+        self.assertEqual(len(self.server.requests), 1)
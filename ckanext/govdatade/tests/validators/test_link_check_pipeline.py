@@ -0,0 +1,149 @@
+import itertools
+import time
+import unittest
+
+from ckan.plugins import toolkit as tk
+from ckanext.govdatade.tests.benchmark import benchmark
+from ckanext.govdatade.tests.http_stub_server import StubServer
+from ckanext.govdatade.validators.link_checker import LinkChecker
+
+
+class TestLinkCheckPipeline(unittest.TestCase):
+
+    DELAY = 0.1
+
+    def setUp(self):
+        self.link_checker = LinkChecker(tk.config)
+        self.link_checker.max_requests_per_host = 8
+        self.link_checker.redis_client.flushdb()
+        self.server = StubServer().start()
+
+    def tearDown(self):
+        self.server.stop()
+        self.link_checker.redis_client.flushdb()
+
+    def _slow_source(self, count):
+        for index in range(count):
+            # e.g. reading a batch from the search index
+            time.sleep(self.DELAY)
+            url = self.server.register('/%s/broken' % index, status=404, delay=self.DELAY)
+            yield {'id': str(index), 'name': 'dataset-%s' % index, 'resources': [{'url': url}]}
+
+    def test_stages_overlap(self):
+        # prepare
+        num_datasets = 10
+        read = []
+
+        def source():
+            for index in range(num_datasets):
+                read.append(index)
+                url = self.server.register('/%s/broken' % index, status=404, delay=3 * self.DELAY)
+                yield {'id': str(index), 'name': 'dataset-%s' % index, 'resources': [{'url': url}]}
+
+        # execute
+        results = self.link_checker.process_records(source(), 4)
+        next(results)
+        num_read = len(read)
+        results = list(results)
+
+        # verify: further datasets are read while the first one is checked
+        self.assertGreater(num_read, 1)
+        self.assertEqual([dataset['id'] for dataset, error in results],
+                         [str(index) for index in range(1, num_datasets)])
+        self.assertTrue(all(error is None for dummy_dataset, error in results))
+        self.assertEqual(self.link_checker.records.load('9')['urls'].popitem()[1]['status'], 404)
+
+    @benchmark
+    def test_stages_overlap_wall_clock(self):
+        # prepare
+        num_datasets = 10
+
+        # execute
+        starttime = time.time()
+        results = list(self.link_checker.process_records(self._slow_source(num_datasets), 4))
+        elapsed = time.time() - starttime
+
+        # verify: reading and checking take 2 * 10 * 0.1s one after the other
+        self.assertEqual(len(results), num_datasets)
+        self.assertLess(elapsed, 2 * num_datasets * self.DELAY * 0.75)
+
+    def test_stage_counters(self):
+        # prepare
+        datasets = [{'id': str(index), 'name': 'dataset', 'resources': []} for index in range(5)]
+
+        # execute
+        results = list(self.link_checker.process_records(iter(datasets), 2))
+
+        # verify
+        self.assertEqual(len(results), 5)
+        metrics = self.link_checker.pipeline_metrics
+        self.assertEqual(sorted(metrics), ['fanout', 'normalize', 'source', 'writer'])
+        self.assertTrue(all(stage['items'] == 5 for stage in metrics.values()))
+
+    def test_back_pressure(self):
+        # prepare
+        self.link_checker.pipeline_queue_size = 2
+        read = []
+
+        def endless_source():
+            for index in itertools.count():
+                read.append(index)
+                yield {'id': str(index), 'name': 'dataset', 'resources': []}
+
+        # execute: the consumer stops after the first result
+        results = self.link_checker.process_records(endless_source(), 2)
+        next(results)
+        time.sleep(0.5)
+        num_read = len(read)
+        results.close()
+
+        # verify: the queues of 2 and 8 pending datasets and a dataset per stage
+        self.assertLessEqual(num_read, 2 + 2 + 8 + 2 + 4 + 1)
+        self.assertEqual(self.link_checker.pipeline_metrics['source']['items'], num_read)
+
+    def test_normalize_errors(self):
+        # prepare
+        datasets = [{'id': '1', 'name': 'dataset', 'resources': []},
+                    {'id': '2', 'name': 'dataset', 'resources': []}]
+
+        def normalize(dataset):
+            if dataset['id'] == '1':
+                raise ValueError('invalid dataset')
+            dataset['normalized'] = True
+            return dataset
+
+        # execute
+        results = list(self.link_checker.process_records(iter(datasets), 2, normalize))
+
+        # verify
+        self.assertIsInstance(results[0][1], ValueError)
+        self.assertIsNone(results[1][1])
+        self.assertTrue(results[1][0]['normalized'])
+
+    def test_source_errors_abort(self):
+        # prepare
+        def failing_source():
+            yield {'id': '1', 'name': 'dataset', 'resources': []}
+            raise IOError('search index not available')
+
+        # execute
+        results = self.link_checker.process_records(failing_source(), 2)
+
+        # verify
+        self.assertEqual(next(results)[0]['id'], '1')
+        with self.assertRaises(IOError):
+            next(results)
+
+    def test_source_base_exceptions_abort(self):
+        # prepare
+        def interrupted_source():
+            yield {'id': '1', 'name': 'dataset', 'resources': []}
+            raise KeyboardInterrupt()
+
+        # execute
+        results = self.link_checker.process_records(interrupted_source(), 2)
+
+        # verify: the consumer gets the exception instead of waiting forever
+        self.assertEqual(next(results)[0]['id'], '1')
+        with self.assertRaises(KeyboardInterrupt):
+            next(results)
@@ -0,0 +1,73 @@
+import time
+import unittest
+
+from ckan.plugins import toolkit as tk
+from ckanext.govdatade.validators.link_check_queue import LinkCheckQueue
+from ckanext.govdatade.validators.link_checker import LinkChecker
+
+
+class TestLinkCheckQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.redis_client = LinkChecker(tk.config).redis_client
+        self.redis_client.flushdb()
+        self.queue = LinkCheckQueue(self.redis_client, 'test:')
+        self.datasets = [{'id': str(index), 'name': 'dataset-%s' % index} for index in range(5)]
+
+    def tearDown(self):
+        self.redis_client.flushdb()
+
+    def test_claim_and_ack(self):
+        # prepare
+        self.assertEqual(self.queue.start(iter(self.datasets), batch_size=2), 5)
+
+        # execute
+        claimed = []
+        acks = []
+        for dataset in self.queue.claims('worker'):
+            claimed.append(dataset)
+            acks.append(self.queue.ack(dataset['id'], 'worker', dataset['id'] != '4'))
+
+        # verify: the generator ends, when the round is drained
+        self.assertEqual(claimed, self.datasets)
+        self.assertEqual(acks, [True] * 5)
+        self.assertTrue(self.queue.is_drained())
+        self.assertCountEqual(self.queue.iterate_processed(), ['0', '1', '2', '3'])
+
+    def test_start_while_active(self):
+        self.queue.start(iter(self.datasets))
+
+        self.assertIsNone(self.queue.start(iter(self.datasets)))
+        self.assertEqual(self.redis_client.llen(self.queue.pending_key), 5)
+
+    def test_expired_claim_is_claimed_again(self):
+        # prepare
+        self.queue.visibility_timeout = 0.1
+        self.queue.start(iter(self.datasets[:1]))
+        self.assertEqual(self.queue.claim('worker-1'), self.datasets[0])
+        self.assertIsNone(self.queue.claim('worker-2'))
+
+        # execute
+        time.sleep(0.2)
+        dataset = self.queue.claim('worker-2')
+
+        # verify: only the worker holding the claim acknowledges the dataset
+        self.assertEqual(dataset, self.datasets[0])
+        self.assertFalse(self.queue.ack('0', 'worker-1'))
+        self.assertFalse(self.queue.is_drained())
+        self.assertTrue(self.queue.ack('0', 'worker-2'))
+        self.assertTrue(self.queue.is_drained())
+
+    def test_finish_once(self):
+        # prepare
+        self.queue.start(iter(self.datasets[:1]))
+        self.assertFalse(self.queue.finish())
+        self.queue.ack(self.queue.claim('worker')['id'], 'worker')
+
+        # execute
+        finished = [self.queue.finish(), self.queue.finish()]
+
+        # verify
+        self.assertEqual(finished, [True, False])
+        self.assertFalse(self.queue.is_active())
+        self.assertEqual(self.queue.num_processed(), 1)
@@ -5,13 +5,15 @@ import unittest
 import httpretty
 from ckan.plugins import toolkit as tk
 from ckanext.govdatade.validators.link_checker import LinkChecker
-from mock import Mock, patch
+from mock import patch
 
 class TestLinkChecker(unittest.TestCase):
 
     def setUp(self):
         self.link_checker = LinkChecker(tk.config)
         self.link_checker.redis_client.flushdb()
+        # connect before httpretty intercepts new sockets
+        self.link_checker.binary_redis_client.ping()
 
     def tearDown(self):
         self.link_checker.redis_client.flushdb()
@@ -66,19 +68,21 @@ class TestLinkChecker(unittest.TestCase):
 
         self.link_checker.record_success(dataset_id, url)
 
-        entry = self.link_checker.redis_client.get(dataset_id)
+        entry = self.link_checker.records.load(dataset_id)
         assert entry is None
 
     def test_dataset_beginning_with_harvest_object_id_is_filtered(self):
         self.link_checker.redis_client.set('harvest_object_id:b6d207e2-8e28-472a-95b0-2c79405ecc1f', '2015-12-02 14:15:34.793933')
 
-        records = self.link_checker.get_records()
+        self.assertEqual(self.link_checker.migrate_legacy_records(), 0)
+        records = list(self.link_checker.get_records())
 
         self.assertEqual(records, [])
 
-        self.link_checker.redis_client.set('key_for_json_structure', '{"abc": "def"}')
+        self.link_checker.redis_client.set('key_for_json_structure', '{"abc": "def", "urls": {"x": {}}}')
 
-        records = self.link_checker.get_records()
+        self.assertEqual(self.link_checker.migrate_legacy_records(), 1)
+        records = list(self.link_checker.get_records())
         self.assertTrue(len(records) == 1)
 
     @httpretty.activate
@@ -97,7 +101,7 @@ class TestLinkChecker(unittest.TestCase):
         }
 
         self.link_checker.process_record(dataset)
-        record = json.loads(self.link_checker.redis_client.get(dataset_id))
+        record = self.link_checker.records.load(dataset_id)
 
         self.assertNotIn(url1, record['urls'])
         self.assertEqual(record['urls'][url2]['strikes'], 1)
@@ -122,7 +126,7 @@ class TestLinkChecker(unittest.TestCase):
         self.link_checker.process_record(dataset)
         
         # verify (1)
-        record = json.loads(self.link_checker.redis_client.get(dataset_id))
+        record = self.link_checker.records.load(dataset_id)
         self.assertEqual(record['urls'][url1]['strikes'], 1)
         self.assertEqual(record['urls'][url1]['status'], 404)
         self.assertEqual(record['urls'][url2]['strikes'], 1)
@@ -135,7 +139,7 @@ class TestLinkChecker(unittest.TestCase):
         self.link_checker.process_record(dataset)
         
         # verify (1)
-        record = json.loads(self.link_checker.redis_client.get(dataset_id))
+        record = self.link_checker.records.load(dataset_id)
         self.assertNotIn(url1, record['urls'])
         # Comment within method record_failure in link_checker.py:
         # Record and URL are known, increment Strike counter if 1+ day(s) have
@@ -161,7 +165,7 @@ class TestLinkChecker(unittest.TestCase):
         self.link_checker.process_record(dataset)
         
         # verify
-        record = self.link_checker.redis_client.get(dataset_id)
+        record = self.link_checker.records.load(dataset_id)
         self.assertIsNone(record)
 
     @httpretty.activate
@@ -182,16 +186,15 @@ class TestLinkChecker(unittest.TestCase):
         initial_record = {
             'id': dataset_id,
             'name': dataset_name,
-            'schema': {}
+            'urls': {'http://example.com/dataset/2': {'status': 404, 'date': '2014-01-01', 'strikes': 1}}
         }
-        self.link_checker.redis_client.set(dataset_id, json.dumps(initial_record))
+        self.link_checker.records.save(dataset_id, initial_record)
 
         # execute
         self.link_checker.process_record(dataset)
         
         # verify
-        record_actual = json.loads(self.link_checker.redis_client.get(dataset_id))
-        self.assertDictEqual(record_actual, initial_record)
+        self.assertIsNone(self.link_checker.records.load(dataset_id))
 
     @httpretty.activate
     def test_check_url_200(self):
@@ -287,7 +290,7 @@ class TestLinkChecker(unittest.TestCase):
         date_string = date.strftime("%Y-%m-%d")
 
         self.link_checker.record_failure(dataset, url, status, date=date)
-        actual_record = json.loads(self.link_checker.redis_client.get(dataset_id))
+        actual_record = self.link_checker.records.load(dataset_id)
 
         expected_record = {
             'id': dataset_id,
@@ -319,7 +322,7 @@ class TestLinkChecker(unittest.TestCase):
         # Second time to test that the strikes counter has not incremented
         self.link_checker.record_failure(dataset, url, status, date=date)
 
-        actual_record = json.loads(self.link_checker.redis_client.get(dataset_id))
+        actual_record = self.link_checker.records.load(dataset_id)
 
         expected_record = {
             'metadata_original_portal': None, 'id': dataset_id, 'maintainer': '', 'maintainer_email': '',
@@ -345,7 +348,7 @@ class TestLinkChecker(unittest.TestCase):
 
         self.link_checker.record_failure(dataset, url, status, date=date)
 
-        actual_record = json.loads(self.link_checker.redis_client.get(dataset_id))
+        actual_record = self.link_checker.records.load(dataset_id)
 
         expected_record = {
             'metadata_original_portal': portal,
@@ -375,7 +378,7 @@ class TestLinkChecker(unittest.TestCase):
 
         self.link_checker.record_failure(dataset, url, status, date=date)
 
-        actual_record = json.loads(self.link_checker.redis_client.get(dataset_id))
+        actual_record = self.link_checker.records.load(dataset_id)
 
         expected_record = {
             'metadata_original_portal': None,
@@ -395,10 +398,8 @@ class TestLinkChecker(unittest.TestCase):
         self.assertEqual(actual_record, expected_record)
 
         self.link_checker.record_success(dataset_id, url)
-        # Expected after record success
-        expected_record.get('urls').pop(url, None)
-        actual_record = json.loads(self.link_checker.redis_client.get(dataset_id))
-        self.assertEqual(actual_record, expected_record)
+        # Records without broken URLs are deleted
+        self.assertIsNone(self.link_checker.records.load(dataset_id))
 
     def test_url_success_after_failure(self):
         dataset_id = '1'
@@ -413,7 +414,7 @@ class TestLinkChecker(unittest.TestCase):
         self.link_checker.record_failure(dataset, url1, 404, date=date)
         self.link_checker.record_failure(dataset, url2, 404, date=date)
 
-        actual_record = json.loads(self.link_checker.redis_client.get(dataset_id))
+        actual_record = self.link_checker.records.load(dataset_id)
 
         expected_record = {
             'metadata_original_portal': portal,
@@ -438,7 +439,7 @@ class TestLinkChecker(unittest.TestCase):
         self.assertEqual(actual_record, expected_record)
         self.link_checker.record_success(dataset_id, url1)
 
-        actual_record = json.loads(self.link_checker.redis_client.get(dataset_id))
+        actual_record = self.link_checker.records.load(dataset_id)
 
         expected_record = {
             'metadata_original_portal': portal,
@@ -459,28 +460,37 @@ class TestLinkChecker(unittest.TestCase):
 
     def test_get_records_works_as_expected(self):
         # (1)
-        self.assertEqual(self.link_checker.get_records(), [])
+        self.assertEqual(list(self.link_checker.get_records()), [])
 
         # (2)
-        self.link_checker.redis_client.keys = Mock(return_value=['general'])
-        self.assertEqual(self.link_checker.get_records(), [])
-        self.link_checker.redis_client.keys.assert_called_once_with('*')
+        self.link_checker.redis_client.set('general', json.dumps({'num_datasets': 1}))
+        self.assertEqual(list(self.link_checker.get_records()), [])
 
         # (3)
-        self.link_checker.redis_client.keys = Mock(return_value=['general', 'abc'])
-        test_dict = {'metadata_original_portal': u'http://suche.transparenz.hamburg.de/'}
-        self.link_checker.redis_client.get = Mock(
-            return_value=json.dumps(test_dict)
-        )
+        test_dict = {
+            'id': 'abc',
+            'metadata_original_portal': u'http://suche.transparenz.hamburg.de/',
+            'urls': {'http://example.com': {'status': 404, 'date': '2014-01-01', 'strikes': 1}}
+        }
+        self.link_checker.records.save('abc', test_dict)
 
-        self.assertEqual(self.link_checker.get_records(), [test_dict])
-        self.link_checker.redis_client.keys.assert_called_once_with('*')
-        self.link_checker.redis_client.get.assert_called_once_with('abc')
+        self.assertEqual(list(self.link_checker.get_records()), [test_dict])
 
         # (4)
-        self.link_checker.redis_client.keys = Mock(return_value=['general'])
-        self.link_checker.redis_client.get.reset_mock()
+        self.link_checker.records.delete(['abc'])
+
+        self.assertEqual(list(self.link_checker.get_records()), [])
+
+    def test_get_records_in_batches(self):
+        # prepare
+        self.link_checker.SCAN_BATCH_SIZE = 2
+        for dataset_id in range(5):
+            self.link_checker.records.save(str(dataset_id), {'id': str(dataset_id), 'urls': {
+                'http://example.com/%s' % dataset_id: {'status': 404, 'strikes': dataset_id}}})
+
+        # execute
+        records = list(self.link_checker.get_records())
 
-        self.assertEqual(self.link_checker.get_records(), [])
-        self.link_checker.redis_client.keys.assert_called_once_with('*')
-        self.link_checker.redis_client.get.assert_not_called()
+        # verify
+        self.assertEqual(sorted(record['id'] for record in records), ['0', '1', '2', '3', '4'])
+        self.assertEqual(self.link_checker.records.top_broken(2), [('4', 4), ('3', 3)])
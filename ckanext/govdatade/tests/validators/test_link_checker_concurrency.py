@@ -0,0 +1,115 @@
+import json
+import time
+import unittest
+
+from ckan.plugins import toolkit as tk
+from ckanext.govdatade.tests.benchmark import benchmark
+from ckanext.govdatade.tests.http_stub_server import StubServer
+from ckanext.govdatade.validators.link_checker import LinkChecker
+from mock import patch
+
+
+class TestLinkCheckerConcurrency(unittest.TestCase):
+
+    DELAY = 0.2
+
+    def setUp(self):
+        self.link_checker = LinkChecker(tk.config)
+        # all URLs are served by the same local host
+        self.link_checker.max_requests_per_host = 8
+        self.link_checker.redis_client.flushdb()
+        self.server = StubServer().start()
+
+    def tearDown(self):
+        self.server.stop()
+        self.link_checker.redis_client.flushdb()
+
+    def _datasets(self, count):
+        datasets = []
+        for index in range(count):
+            ok_url = self.server.register('/%s/ok' % index, delay=self.DELAY)
+            broken_url = self.server.register('/%s/broken' % index, status=404, delay=self.DELAY)
+            datasets.append({
+                'id': str(index),
+                'name': 'dataset-%s' % index,
+                'resources': [{'url': ok_url}, {'url': broken_url}]
+            })
+        return datasets
+
+    def _run(self, datasets, workers):
+        starttime = time.time()
+        results = list(self.link_checker.process_records(iter(datasets), workers))
+        return results, time.time() - starttime
+
+    def test_process_records_records_each_dataset(self):
+        # prepare
+        datasets = self._datasets(6)
+
+        # execute
+        results, dummy_elapsed = self._run(datasets, workers=4)
+
+        # verify
+        self.assertEqual([dataset['id'] for dataset, error in results], [d['id'] for d in datasets])
+        self.assertTrue(all(error is None for dummy_dataset, error in results))
+        for dataset in datasets:
+            ok_url = dataset['resources'][0]['url']
+            broken_url = dataset['resources'][1]['url']
+            record = self.link_checker.records.load(dataset['id'])
+            self.assertNotIn(ok_url, record['urls'])
+            self.assertEqual(record['urls'][broken_url]['status'], 404)
+            self.assertEqual(record['urls'][broken_url]['strikes'], 1)
+
+    def test_process_records_checks_concurrently(self):
+        # prepare
+        datasets = self._datasets(4)
+
+        # execute
+        dummy_results, dummy_elapsed = self._run(datasets, workers=1)
+        serial_max_active = self.server.max_active_requests
+        self.server.max_active_requests = 0
+        self.link_checker.redis_client.flushdb()
+        dummy_results, dummy_elapsed = self._run(datasets, workers=8)
+
+        # verify
+        self.assertEqual(serial_max_active, 1)
+        self.assertGreater(self.server.max_active_requests, 1)
+
+    @patch.dict("ckan.plugins.toolkit.config",
+                {'ckanext.govdata.validators.linkchecker.pool.max_connections': '2'})
+    def test_process_records_max_connections(self):
+        # prepare
+        link_checker = LinkChecker(tk.config)
+        link_checker.max_requests_per_host = 8
+        datasets = self._datasets(4)
+
+        # execute
+        results = list(link_checker.process_records(iter(datasets), 8))
+
+        # verify: the global cap applies below the limit per host
+        self.assertTrue(all(error is None for dummy_dataset, error in results))
+        self.assertEqual(self.server.max_active_requests, 2)
+
+    @benchmark
+    def test_process_records_wall_clock_scales_with_workers(self):
+        # prepare
+        datasets = self._datasets(8)
+
+        # execute
+        dummy_results, serial = self._run(datasets, workers=1)
+        self.link_checker.redis_client.flushdb()
+        dummy_results, concurrent = self._run(datasets, workers=8)
+
+        # verify: 16 URLs with a delay of 0.2s each
+        self.assertGreaterEqual(serial, 16 * self.DELAY)
+        self.assertLess(concurrent, serial / 2)
+
+    def test_process_records_reports_dataset_errors(self):
+        # prepare
+        datasets = [{'id': '1', 'name': 'without-resources'}]
+
+        # execute
+        results, dummy_elapsed = self._run(datasets, workers=2)
+
+        # verify
+        self.assertEqual(len(results), 1)
+        self.assertIsInstance(results[0][1], KeyError)
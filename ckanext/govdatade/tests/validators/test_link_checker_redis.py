@@ -0,0 +1,183 @@
+import datetime
+import json
+import tracemalloc
+import unittest
+
+import redis
+from ckan.plugins import toolkit as tk
+from ckanext.govdatade.tests.benchmark import benchmark
+import ckanext.govdatade.commands.command_util as command_util
+from ckanext.govdatade.validators.link_checker import LinkChecker
+from mock import patch
+
+
+class TestLinkCheckerRedis(unittest.TestCase):
+
+    def setUp(self):
+        self.link_checker = LinkChecker(tk.config)
+        self.link_checker.redis_client.flushdb()
+        self.dataset = {'id': '1', 'name': 'example'}
+        self.urls = ['http://example.com/%s' % index for index in range(5)]
+        self.results = list(zip(self.urls, [200, 404, 500, None, 'Timeout']))
+
+    def tearDown(self):
+        self.link_checker.redis_client.flushdb()
+
+    def _round_trips(self, function, *args):
+        original = redis.connection.Connection.send_packed_command
+        with patch.object(redis.connection.Connection, 'send_packed_command', autospec=True,
+                          side_effect=original) as send:
+            result = function(*args)
+        return result, send.call_count
+
+    def _set_record(self, record):
+        self.link_checker.records.save(self.dataset['id'], record)
+
+    def _get_record(self):
+        return self.link_checker.records.load(self.dataset['id'])
+
+    def test_record_results_round_trips(self):
+        # prepare
+        self._set_record({'id': '1', 'name': 'example', 'urls': {
+            'http://example.com/deprecated': {'status': 404, 'date': '2024-01-01', 'strikes': 3},
+            self.urls[0]: {'status': 404, 'date': '2024-01-01', 'strikes': 1}}})
+
+        # execute
+        delete, round_trips = self._round_trips(
+            self.link_checker.record_results, self.dataset, self.results)
+
+        # verify: WATCH, HGETALL and MULTI/EXEC instead of 2 * (5 + 1) GET and SET commands
+        self.assertFalse(delete)
+        self.assertLessEqual(round_trips, 3)
+        record = self._get_record()
+        self.assertEqual(sorted(record['urls']), [self.urls[1], self.urls[2], self.urls[4]])
+        self.assertEqual(record['urls'][self.urls[4]]['status'], 'Timeout')
+
+    def test_record_results_retries_on_concurrent_change(self):
+        # prepare
+        self._set_record({'id': '1', 'name': 'example', 'urls': {
+            self.urls[1]: {'status': 404, 'date': '2024-01-01', 'strikes': 1}}})
+        other_client = redis.StrictRedis(connection_pool=self.link_checker.redis_client.connection_pool)
+        add_failure = self.link_checker._add_failure
+        calls = []
+
+        def add_failure_and_change(record, dataset, url, status, date):
+            calls.append(url)
+            if len(calls) == 1:
+                # another link checker process changes the record after it was read
+                other_client.hset(self.link_checker.records.urls_key('1'), url, json.dumps(
+                    {'status': 404, 'date': '2024-01-01', 'strikes': 50}))
+            return add_failure(record, dataset, url, status, date)
+
+        # execute
+        with patch.object(self.link_checker, '_add_failure', side_effect=add_failure_and_change):
+            self.link_checker.record_results(self.dataset, self.results)
+
+        # verify: the update was repeated with the changed record
+        self.assertEqual(calls.count(self.urls[1]), 2)
+        record = self._get_record()
+        self.assertEqual(record['urls'][self.urls[1]]['strikes'], 51)
+        self.assertEqual(len(record['urls']), 3)
+
+    def test_record_results_without_changes(self):
+        # prepare
+        results = [(url, 200) for url in self.urls]
+
+        # execute
+        with patch.object(redis.client.Pipeline, 'multi') as multi:
+            delete = self.link_checker.record_results(self.dataset, results)
+
+        # verify: no transaction is executed for a dataset without broken URLs
+        self.assertFalse(delete)
+        multi.assert_not_called()
+        self.assertEqual(self.link_checker.redis_client.keys('*'), [])
+
+    def test_record_results_writes_index_and_ranking_once(self):
+        # prepare
+        self.link_checker.record_results(self.dataset, self.results)
+        records = self.link_checker.records
+
+        # execute
+        with patch.object(redis.client.Pipeline, 'sadd') as sadd, \
+                patch.object(redis.client.Pipeline, 'zadd') as zadd:
+            self.link_checker.record_results(self.dataset, self.results)
+
+        # verify: a check on the same day does not add a strike
+        sadd.assert_not_called()
+        zadd.assert_not_called()
+        self.assertEqual(list(records.iterate_dataset_ids()), ['1'])
+        self.assertEqual(records.top_broken(), [('1', 1)])
+
+    def test_record_results_delete(self):
+        # prepare
+        date = datetime.date.today() - datetime.timedelta(days=1)
+        self._set_record({'id': '1', 'name': 'example', 'urls': {
+            self.urls[1]: {'status': 404, 'date': date.strftime('%Y-%m-%d'), 'strikes': 99}}})
+
+        # execute
+        delete = self.link_checker.record_results(self.dataset, self.results)
+
+        # verify
+        self.assertTrue(delete)
+        self.assertEqual(self._get_record()['urls'][self.urls[1]]['strikes'], 100)
+
+
+class TestLinkCheckerRedisKeyspace(unittest.TestCase):
+
+    NUM_KEYS = 2000
+    MAX_MEMORY = 16 * 1024 * 1024
+
+    def setUp(self):
+        self.link_checker = LinkChecker(tk.config)
+        self.redis_client = self.link_checker.redis_client
+        self.redis_client.flushdb()
+        records = self.link_checker.records
+        url_entry = json.dumps({'status': 404, 'date': '2024-01-01', 'strikes': 1})
+        for start in range(0, self.NUM_KEYS, 10000):
+            dataset_ids = ['%036d' % index for index in range(start, min(start + 10000, self.NUM_KEYS))]
+            pipe = self.redis_client.pipeline(transaction=False)
+            for dataset_id in dataset_ids:
+                pipe.hset(records.urls_key(dataset_id), 'http://example.com/1', url_entry)
+            pipe.sadd(records.index_key, *dataset_ids)
+            pipe.zadd(records.strikes_key, dict((dataset_id, 1) for dataset_id in dataset_ids))
+            pipe.execute()
+        self.redis_client.set('general', json.dumps({'num_datasets': self.NUM_KEYS}))
+
+    def tearDown(self):
+        self.redis_client.flushdb()
+
+    def test_get_records_streams_without_keys(self):
+        # prepare
+        tracemalloc.start()
+
+        # execute
+        with patch.object(redis.StrictRedis, 'keys', side_effect=AssertionError('KEYS used')):
+            num_records = sum(1 for dummy_record in self.link_checker.get_records())
+        dummy_current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        # verify: a dataset can be returned twice by SSCAN, if Redis resizes the set
+        self.assertGreaterEqual(num_records, self.NUM_KEYS)
+        self.assertLess(peak, self.MAX_MEMORY)
+
+    def test_delete_deprecated_datasets_without_keys(self):
+        # prepare
+        active_datasets = ['%036d' % index for index in range(0, self.NUM_KEYS, 2)]
+
+        # execute
+        with patch.object(redis.StrictRedis, 'keys', side_effect=AssertionError('KEYS used')):
+            command_util.delete_deprecated_datasets(active_datasets)
+
+        # verify
+        records = self.link_checker.records
+        self.assertEqual(self.redis_client.scard(records.index_key), self.NUM_KEYS // 2)
+        self.assertEqual(self.redis_client.zcard(records.strikes_key), self.NUM_KEYS // 2)
+        self.assertIsNotNone(self.redis_client.get('general'))
+        self.assertIsNotNone(records.load('%036d' % 0))
+        self.assertIsNone(records.load('%036d' % 1))
+
+
+@benchmark
+class TestLinkCheckerRedisKeyspaceBenchmark(TestLinkCheckerRedisKeyspace):
+
+    NUM_KEYS = 500000
@@ -0,0 +1,71 @@
+import logging
+import time
+import unittest
+
+from ckan.plugins import toolkit as tk
+from ckanext.govdatade.tests.http_stub_server import StubServer, openssl_available
+from ckanext.govdatade.validators.link_checker import LinkChecker
+from mock import patch
+
+LOGGER = logging.getLogger(__name__)
+
+
+@unittest.skipUnless(openssl_available(), 'openssl is required for the TLS stub server')
+class TestLinkCheckerSession(unittest.TestCase):
+
+    NUM_URLS = 50
+
+    def setUp(self):
+        self.server = StubServer(tls=True).start()
+        self.urls = [self.server.register('/dataset/%s' % index) for index in range(self.NUM_URLS)]
+        self.datasets = [{'id': str(index), 'name': 'dataset-%s' % index, 'resources': [{'url': url}]}
+                         for index, url in enumerate(self.urls)]
+
+    def tearDown(self):
+        self.server.stop()
+
+    def _run(self, link_checker, workers):
+        connections_before = self.server.connections
+        starttime = time.time()
+        for dummy_dataset, error in link_checker.process_records(iter(self.datasets), workers):
+            self.assertIsNone(error)
+        return self.server.connections - connections_before, time.time() - starttime
+
+    def test_connections_are_reused(self):
+        # prepare
+        pooled_link_checker = LinkChecker(tk.config)
+        with patch.dict("ckan.plugins.toolkit.config",
+                        {'ckanext.govdata.validators.linkchecker.pool.keep_alive': 'false'}):
+            fresh_link_checker = LinkChecker(tk.config)
+        pooled_link_checker.redis_client.flushdb()
+
+        # execute
+        pooled_handshakes, pooled_time = self._run(pooled_link_checker, workers=4)
+        fresh_handshakes, fresh_time = self._run(fresh_link_checker, workers=4)
+
+        # verify: at most one connection per concurrent request to the host
+        LOGGER.info('%d URLs: %d TLS handshakes in %.3fs with pooling, %d in %.3fs without',
+                    self.NUM_URLS, pooled_handshakes, pooled_time, fresh_handshakes, fresh_time)
+        self.assertLessEqual(pooled_handshakes, pooled_link_checker.max_requests_per_host)
+        self.assertEqual(fresh_handshakes, self.NUM_URLS)
+        pooled_link_checker.redis_client.flushdb()
+
+    @patch.dict("ckan.plugins.toolkit.config", {'ckanext.govdata.validators.linkchecker.pool.maxsize': '2'})
+    def test_pool_maxsize(self):
+        link_checker = LinkChecker(tk.config)
+        link_checker.max_requests_per_host = 8
+        link_checker.redis_client.flushdb()
+
+        handshakes, dummy_time = self._run(link_checker, workers=8)
+
+        # surplus connections are not kept in the pool
+        self.assertGreater(handshakes, 2)
+        self.assertEqual(link_checker.session.get_adapter(self.urls[0])._pool_maxsize, 2)
+        link_checker.redis_client.flushdb()
+
+    def test_check_dataset_uses_session(self):
+        link_checker = LinkChecker(tk.config)
+        dataset = {'id': '1', 'name': 'example', 'resources': [{'url': url} for url in self.urls[:10]]}
+
+        self.assertEqual(link_checker.check_dataset(dataset), [200] * 10)
+        self.assertEqual(self.server.connections, 1)
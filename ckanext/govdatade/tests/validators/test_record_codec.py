@@ -0,0 +1,210 @@
+import ast
+import json
+import timeit
+import unittest
+
+from ckan.plugins import toolkit as tk
+from ckanext.govdatade.tests.benchmark import benchmark
+from ckanext.govdatade.validators.link_checker import LinkChecker
+from ckanext.govdatade.validators.link_check_records import LinkCheckRecords
+from ckanext.govdatade.validators.record_codec import JsonCodec, MsgpackCodec, RecordCodec, \
+    create_record_codec
+from mock import patch
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+
+def realistic_record(num_urls=20):
+    return {
+        'id': 'b6d207e2-8e28-472a-95b0-2c79405ecc1f',
+        'name': 'verkehrsdaten-hamburg-2024',
+        'maintainer': 'Landesbetrieb Geoinformation und Vermessung',
+        'maintainer_email': 'info@example.com',
+        'metadata_original_portal': 'http://suche.transparenz.hamburg.de/',
+        'urls': dict(('https://daten.example.com/resource/%s/download.csv' % index,
+                      {'status': 404 if index % 3 else 'Timeout', 'date': '2024-01-01',
+                       'strikes': index})
+                     for index in range(num_urls))
+    }
+
+
+class TestRecordCodec(unittest.TestCase):
+
+    def test_json_round_trip(self):
+        codec = RecordCodec(JsonCodec())
+        record = realistic_record()
+
+        data = codec.encode(record)
+
+        self.assertTrue(data.startswith(b'\x01J'))
+        self.assertEqual(codec.decode(data), record)
+        self.assertTrue(codec.is_current(data))
+
+    @unittest.skipIf(msgpack is None, 'msgpack not installed')
+    def test_msgpack_round_trip(self):
+        codec = RecordCodec(MsgpackCodec())
+        record = realistic_record()
+
+        data = codec.encode(record)
+
+        self.assertTrue(data.startswith(b'\x01M'))
+        self.assertEqual(codec.decode(data), record)
+        self.assertLess(len(data), len(json.dumps(record)))
+        # values of other codecs can still be decoded
+        self.assertEqual(codec.decode(RecordCodec(JsonCodec()).encode(record)), record)
+        self.assertFalse(codec.is_current(RecordCodec(JsonCodec()).encode(record)))
+
+    def test_compression(self):
+        codec = RecordCodec(JsonCodec(), compress_min_size=1024)
+        small_value = {'status': 404, 'date': '2024-01-01', 'strikes': 1}
+        record = realistic_record(100)
+
+        data = codec.encode(record)
+
+        self.assertTrue(data.startswith(b'\x01ZJ'))
+        self.assertLess(len(data), len(json.dumps(record)) / 4)
+        self.assertEqual(codec.decode(data), record)
+        self.assertTrue(codec.is_current(data))
+        self.assertTrue(codec.encode(small_value).startswith(b'\x01J'))
+
+    def test_untagged_json(self):
+        codec = RecordCodec(JsonCodec())
+
+        self.assertEqual(codec.decode(b'{"status": 404}'), {'status': 404})
+        self.assertFalse(codec.is_current(b'{"status": 404}'))
+
+    def test_unknown_tag(self):
+        with self.assertRaises(ValueError):
+            RecordCodec(JsonCodec()).decode(b'\x01X{}')
+
+    def test_create_record_codec(self):
+        self.assertIsInstance(create_record_codec('json').codec, JsonCodec)
+        self.assertIsInstance(create_record_codec('unknown').codec, JsonCodec)
+        self.assertEqual(create_record_codec('json', 10).compress_min_size, 10)
+        if msgpack is not None:
+            self.assertIsInstance(create_record_codec('msgpack').codec, MsgpackCodec)
+
+    @unittest.skipIf(msgpack is None, 'msgpack not installed')
+    def test_msgpack_values_size(self):
+        # prepare
+        record = realistic_record()
+        values = list(record['urls'].values()) + [record['name']]
+        json_codec = RecordCodec(JsonCodec())
+        msgpack_codec = RecordCodec(MsgpackCodec())
+
+        # execute
+        sizes = dict((codec.codec.name, sum(len(codec.encode(value)) for value in values))
+                     for codec in (json_codec, msgpack_codec))
+        decoded = [msgpack_codec.decode(msgpack_codec.encode(value)) for value in values]
+
+        # verify: the old format was JSON with the default separators
+        legacy_size = sum(len(json.dumps(value)) for value in values)
+        self.assertEqual(decoded, values)
+        self.assertLess(sizes['msgpack'], sizes['json'])
+        self.assertLess(sizes['json'], legacy_size)
+
+
+@benchmark
+class TestRecordCodecBenchmark(unittest.TestCase):
+
+    NUMBER = 2000
+
+    def setUp(self):
+        self.record = realistic_record()
+        self.values = list(self.record['urls'].values()) + [self.record['name']]
+
+    def _time(self, function):
+        return min(timeit.repeat(function, number=self.NUMBER, repeat=3))
+
+    def test_decode_is_faster_than_literal_eval(self):
+        # prepare
+        codec = RecordCodec(JsonCodec())
+        legacy = str(self.record)
+        data = codec.encode(self.record)
+
+        # execute
+        literal_eval_time = self._time(lambda: ast.literal_eval(legacy))
+        decode_time = self._time(lambda: codec.decode(data))
+
+        # verify
+        self.assertLess(decode_time, literal_eval_time / 2)
+
+    @unittest.skipIf(msgpack is None, 'msgpack not installed')
+    def test_msgpack_values(self):
+        # prepare
+        json_codec = RecordCodec(JsonCodec())
+        msgpack_codec = RecordCodec(MsgpackCodec())
+
+        # execute
+        times = dict((codec.codec.name, self._time(
+            lambda codec=codec: [codec.decode(codec.encode(value)) for value in self.values]))
+            for codec in (json_codec, msgpack_codec))
+
+        # verify
+        self.assertLess(times['msgpack'], times['json'] * 2)
+
+
+class TestLinkCheckRecordsCodec(unittest.TestCase):
+
+    def setUp(self):
+        self.link_checker = LinkChecker(tk.config)
+        self.link_checker.redis_client.flushdb()
+        self.redis_client = self.link_checker.binary_redis_client
+
+    def tearDown(self):
+        self.link_checker.redis_client.flushdb()
+
+    @unittest.skipIf(msgpack is None, 'msgpack not installed')
+    def test_upgrade(self):
+        # prepare: untagged JSON of the previous version and a JSON encoded record
+        record = realistic_record(3)
+        json_records = LinkCheckRecords(self.redis_client, 'test:')
+        json_records.save('1', record)
+        url = next(iter(record['urls']))
+        self.redis_client.hset(json_records.urls_key('1'), url, json.dumps(record['urls'][url]))
+        records = LinkCheckRecords(self.redis_client, 'test:', codec=RecordCodec(MsgpackCodec()))
+
+        # execute
+        num_values = records.upgrade('1')
+
+        # verify
+        self.assertEqual(num_values, 3 + 5)
+        self.assertEqual(records.upgrade('1'), 0)
+        self.assertEqual(records.load('1'), record)
+        values = list(self.redis_client.hgetall(records.urls_key('1')).values())
+        self.assertTrue(all(value.startswith(b'\x01M') for value in values))
+
+    def test_configured_codec(self):
+        # prepare
+        dataset = {'id': '1', 'name': 'example'}
+        self.link_checker.codec.compress_min_size = 1
+
+        # execute
+        self.link_checker.record_failure(dataset, 'http://example.com', 404)
+
+        # verify
+        value = self.redis_client.hget(self.link_checker.records.urls_key('1'), 'http://example.com')
+        self.assertTrue(value.startswith(b'\x01ZJ'))
+        self.assertEqual(self.link_checker.records.load('1')['urls']['http://example.com']['status'], 404)
+        self.assertEqual(self.link_checker.upgrade_records(), 0)
+
+    @unittest.skipIf(msgpack is None, 'msgpack not installed')
+    def test_ensure_record_layout_after_codec_change(self):
+        # prepare
+        self.link_checker.records.save('1', realistic_record(3))
+        self.assertEqual(self.link_checker.ensure_record_layout(), (0, 0))
+        with patch.dict("ckan.plugins.toolkit.config",
+                        {'ckanext.govdata.validators.linkchecker.codec': 'msgpack'}):
+            link_checker = LinkChecker(tk.config)
+
+        # execute
+        num_records, num_values = link_checker.ensure_record_layout()
+
+        # verify: the values are rewritten once
+        self.assertEqual(num_records, 0)
+        self.assertEqual(num_values, 3 + 5)
+        self.assertEqual(link_checker.ensure_record_layout(), (0, 0))
+        self.assertEqual(link_checker.records.load('1'), realistic_record(3))
@@ -0,0 +1,104 @@
+import json
+import time
+import unittest
+
+from ckan.plugins import toolkit as tk
+from ckanext.govdatade.tests.http_stub_server import StubServer
+from ckanext.govdatade.validators.link_checker import LinkChecker
+from ckanext.govdatade.validators.url_cache import UrlResultCache
+
+
+class TestUrlResultCache(unittest.TestCase):
+
+    def test_normalize_url(self):
+        self.assertEqual(UrlResultCache.normalize_url('HTTP://Example.COM:80/Path?a=B#top'),
+                         'http://example.com/Path?a=B')
+        self.assertEqual(UrlResultCache.normalize_url('https://example.com:8443'),
+                         'https://example.com:8443/')
+        self.assertEqual(UrlResultCache.normalize_url(' https://user:pw@example.com/a '),
+                         'https://user:pw@example.com/a')
+        self.assertEqual(UrlResultCache.normalize_url('http://[::1]:8080/a'), 'http://[::1]:8080/a')
+        self.assertEqual(UrlResultCache.normalize_url(None), None)
+
+    def test_get_and_put(self):
+        cache = UrlResultCache(10, 60)
+        self.assertIsNone(cache.get('http://example.com/a'))
+
+        cache.put('http://example.com/a', 404)
+
+        self.assertEqual(cache.get('http://EXAMPLE.com/a#fragment'), 404)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        self.assertEqual(cache.hit_ratio(), 0.5)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = UrlResultCache(2, 60)
+        cache.put('http://example.com/a', 1)
+        cache.put('http://example.com/b', 2)
+        cache.get('http://example.com/a')
+
+        cache.put('http://example.com/c', 3)
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNone(cache.get('http://example.com/b'))
+        self.assertEqual(cache.get('http://example.com/a'), 1)
+        self.assertEqual(cache.get('http://example.com/c'), 3)
+
+    def test_entries_expire(self):
+        cache = UrlResultCache(10, 0.05)
+        cache.put('http://example.com/a', 1)
+
+        time.sleep(0.1)
+
+        self.assertIsNone(cache.get('http://example.com/a'))
+        self.assertEqual(len(cache), 0)
+
+    def test_hit_ratio_without_lookups(self):
+        self.assertEqual(UrlResultCache(10, 60).hit_ratio(), 0.0)
+
+
+class TestLinkCheckerUrlCache(unittest.TestCase):
+
+    def setUp(self):
+        self.link_checker = LinkChecker(tk.config)
+        self.link_checker.redis_client.flushdb()
+        self.server = StubServer().start()
+        self.shared_url = self.server.register('/license.pdf', status=404)
+        self.datasets = [{
+            'id': str(index),
+            'name': 'dataset-%s' % index,
+            'resources': [{'url': self.shared_url},
+                          {'url': self.server.register('/%s' % index)}]
+        } for index in range(5)]
+
+    def tearDown(self):
+        self.server.stop()
+        self.link_checker.redis_client.flushdb()
+
+    def _verify(self, cache):
+        self.assertEqual(len(self.server.requests), 6)
+        self.assertEqual((cache.hits, cache.misses), (4, 6))
+        for dataset in self.datasets:
+            record = self.link_checker.records.load(dataset['id'])
+            self.assertEqual(list(record['urls']), [self.shared_url])
+
+    def test_process_records_serial(self):
+        cache = self.link_checker.enable_url_cache()
+
+        for dummy_dataset, error in self.link_checker.process_records(iter(self.datasets)):
+            self.assertIsNone(error)
+
+        self._verify(cache)
+
+    def test_process_records_concurrent(self):
+        cache = self.link_checker.enable_url_cache()
+
+        for dummy_dataset, error in self.link_checker.process_records(iter(self.datasets), 4):
+            self.assertIsNone(error)
+
+        self._verify(cache)
+
+    def test_process_records_without_cache(self):
+        for dummy_dataset, error in self.link_checker.process_records(iter(self.datasets)):
+            self.assertIsNone(error)
+
+        self.assertEqual(len(self.server.requests), 10)
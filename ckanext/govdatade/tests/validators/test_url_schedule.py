@@ -0,0 +1,139 @@
+import json
+import unittest
+from datetime import date, timedelta
+
+from ckan.plugins import toolkit as tk
+import ckanext.govdatade.commands.command_util as command_util
+from ckanext.govdatade.tests.http_stub_server import StubServer
+from ckanext.govdatade.validators.link_checker import LinkChecker
+from ckanext.govdatade.validators.url_schedule import UrlSchedule
+
+
+class TestUrlSchedule(unittest.TestCase):
+
+    def setUp(self):
+        self.link_checker = LinkChecker(tk.config)
+        self.link_checker.redis_client.flushdb()
+        self.schedule = UrlSchedule(self.link_checker.redis_client, LinkChecker.SCHEDULE_KEY, 7)
+        self.day = date(2024, 1, 1)
+        self.schedule.today = lambda: self.day
+
+    def tearDown(self):
+        self.link_checker.redis_client.flushdb()
+
+    def _next_day(self, days=1):
+        self.day = self.day + timedelta(days=days)
+
+    def test_unknown_url_is_due(self):
+        self.assertTrue(self.schedule.is_due(None))
+        self.assertEqual(self.schedule.load(['http://example.com/']), {})
+
+    def test_available_url_backs_off(self):
+        url = 'http://example.com/a'
+        intervals = []
+        for dummy_run in range(5):
+            while not self.schedule.is_due(self.schedule.load([url]).get(url)):
+                self._next_day()
+            self.schedule.update([(url, True)])
+            intervals.append(self.schedule.load([url])[url]['interval'])
+            self._next_day()
+
+        self.assertEqual(intervals, [1, 2, 4, 7, 7])
+
+    def test_not_available_url_is_due_daily(self):
+        url = 'http://example.com/a'
+        self.schedule.update([(url, True)])
+        self._next_day()
+        self.schedule.update([(url, True)])
+
+        self._next_day()
+        self.schedule.update([(url, False)])
+
+        entry = self.schedule.load([url])[url]
+        self.assertEqual(entry, {'checked': '2024-01-03', 'next': '2024-01-04', 'interval': 1,
+                                 'available': False})
+        self._next_day()
+        self.assertTrue(self.schedule.is_due(entry))
+
+    def test_url_checked_today_remains_due_and_unchanged(self):
+        url = 'http://example.com/a'
+        self.schedule.update([(url, True)])
+        entry = self.schedule.load([url])[url]
+
+        self.assertTrue(self.schedule.is_due(entry))
+        self.schedule.update([(url, False)])
+        self.assertEqual(self.schedule.load([url])[url], entry)
+
+    def test_urls_are_normalized(self):
+        self.schedule.update([('HTTP://Example.com/a#top', True)])
+
+        self.assertIn('http://example.com/a', self.schedule.load(['http://example.com/a']))
+
+    def test_prune(self):
+        self.schedule.update([('http://example.com/old', True)])
+        self._next_day(10)
+        self.schedule.update([('http://example.com/new', True)])
+
+        self.assertEqual(self.schedule.prune(7), 1)
+
+        self.assertEqual(list(self.schedule.load(['http://example.com/old', 'http://example.com/new'])),
+                         ['http://example.com/new'])
+
+    def test_schedule_is_ignored_by_records_and_deprecated_datasets(self):
+        self.schedule.update([('http://example.com/a', True)])
+
+        self.assertEqual(list(self.link_checker.get_records()), [])
+        command_util.delete_deprecated_datasets([])
+        self.assertEqual(self.link_checker.redis_client.hlen(LinkChecker.SCHEDULE_KEY), 1)
+
+
+class TestIncrementalLinkCheck(unittest.TestCase):
+
+    def setUp(self):
+        self.link_checker = LinkChecker(tk.config)
+        self.link_checker.redis_client.flushdb()
+        self.server = StubServer().start()
+        self.ok_url = self.server.register('/ok')
+        self.broken_url = self.server.register('/broken', status=404)
+        self.dataset = {'id': '1', 'name': 'example',
+                        'resources': [{'url': self.ok_url}, {'url': self.broken_url}]}
+        self.day = date(2024, 1, 1)
+
+    def tearDown(self):
+        self.server.stop()
+        self.link_checker.redis_client.flushdb()
+
+    def _run(self, incremental):
+        schedule = self.link_checker.enable_url_schedule(incremental)
+        schedule.today = lambda: self.day
+        self.server.requests = []
+        for dummy_dataset, error in self.link_checker.process_records(iter([self.dataset]), 2):
+            self.assertIsNone(error)
+        return [path for dummy_method, path, dummy_headers in self.server.requests]
+
+    def test_only_due_urls_are_checked(self):
+        # the first runs check all URLs, the available URL backs off to 2 days
+        self.assertEqual(sorted(self._run(incremental=True)), ['/broken', '/ok'])
+        self.day += timedelta(days=1)
+        self.assertEqual(sorted(self._run(incremental=True)), ['/broken', '/ok'])
+
+        # next day only the broken URL is due
+        self.day += timedelta(days=1)
+        self.assertEqual(self._run(incremental=True), ['/broken'])
+        record = self.link_checker.records.load('1')
+        self.assertEqual(list(record['urls']), [self.broken_url])
+
+        # a full run checks all URLs
+        self.assertEqual(sorted(self._run(incremental=False)), ['/broken', '/ok'])
+
+    def test_not_due_urls_are_not_deprecated(self):
+        self._run(incremental=True)
+        self.day += timedelta(days=1)
+        self._run(incremental=True)
+        self.day += timedelta(days=1)
+        self.dataset['resources'].reverse()
+
+        self.assertEqual(self._run(incremental=True), ['/broken'])
+
+        record = self.link_checker.records.load('1')
+        self.assertEqual(list(record['urls']), [self.broken_url])
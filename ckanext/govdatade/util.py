@@ -3,52 +3,149 @@ Util methods
 '''
 import json
 import logging
+import multiprocessing
 import os
+import queue
+import threading
+import time
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import distutils.dir_util
-from math import ceil
 
 import ckanapi
+import requests
 import ckan.logic as logic
 from ckan.plugins import toolkit as tk
 from ckanext.govdatade.validators import link_checker
 
 LOGGER = logging.getLogger(__name__)
 
+# search index fields of a dataset used by the link checker
+LINK_CHECK_FIELDS = ['id', 'name', 'maintainer', 'maintainer_email', 'res_url',
+                     'extras_metadata_harvested_portal']
 
-def iterate_remote_datasets(endpoint, max_rows=1000):
-    '''
-    Iterates over a set of remote datasets
-    '''
-    ckan_api_client = ckanapi.RemoteCKAN(endpoint)
-
-    LOGGER.info('Retrieve total number of datasets')
+# first characters of the dataset IDs splitting the remote datasets into ranges
+REMOTE_ID_PARTITIONS = '123456789abcdef'
 
-    total = ckan_api_client.action.package_search(rows=1)['count']
+# first characters of a JSON object, array or string including leading whitespace
+JSON_VALUE_STARTS = frozenset('{["' + ' \t\n\r')
 
-    steps = int(ceil(total / float(max_rows)))
-    rows = max_rows
 
-    for i in range(0, steps):
-        if i == steps - 1:
-            rows = total - (i * rows)
+def iterate_remote_datasets(endpoint, max_rows=1000, *, workers=4, prefetch_pages=8,
+                            retries=3, backoff=1.0):
+    '''
+    Iterates over the datasets of a remote CKAN. The ID space is split into ranges by the first
+    character of the IDs, which are paged concurrently by the given number of workers. Each
+    range is paged by ID, a page starts after the last ID of the previous page. At most
+    prefetch_pages pages are buffered, so that the datasets can be processed while further
+    pages are downloaded. A failed request is retried with exponential backoff.
+    '''
+    LOGGER.info('Retrieve total number of datasets')
+    total = _call_with_retries(ckanapi.RemoteCKAN(endpoint).action.package_search, retries,
+                               backoff, rows=1)['count']
+    LOGGER.info('Retrieve %s datasets', total)
+
+    bounds = [None] + list(REMOTE_ID_PARTITIONS) + [None]
+    partitions = list(zip(bounds[:-1], bounds[1:]))
+    pages = queue.Queue(maxsize=prefetch_pages)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                pages.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def page_partition(partition):
+        if stop.is_set():
+            return
+        try:
+            ckan_api_client = ckanapi.RemoteCKAN(endpoint)
+            for records in _iterate_remote_pages(ckan_api_client, partition, max_rows,
+                                                 retries, backoff):
+                if not put(records):
+                    return
+            put(None)
+        except Exception as ex:
+            put(ex)
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        for partition in partitions:
+            executor.submit(page_partition, partition)
+        num_completed = 0
+        while num_completed < len(partitions):
+            records = pages.get()
+            if records is None:
+                num_completed += 1
+            elif isinstance(records, Exception):
+                raise records
+            else:
+                yield from records
+    finally:
+        stop.set()
+        executor.shutdown(wait=True)
+
+
+def _iterate_remote_pages(ckan_api_client, partition, rows, retries, backoff):
+    '''
+    Iterates over the pages of the given ID range (lower, upper), each bound is a prefix of an ID
+    or None.
+    '''
+    lower, upper = partition
+    last_id = None
+    while True:
+        if last_id is not None:
+            lower_bound = '{"%s"' % last_id
+        elif lower is not None:
+            lower_bound = '["%s"' % lower
+        else:
+            lower_bound = '[*'
+        upper_bound = '"%s"}' % upper if upper is not None else '*]'
+        filter_query = 'id:%s TO %s' % (lower_bound, upper_bound)
+        records = _call_with_retries(
+            ckan_api_client.action.package_search, retries, backoff,
+            q='*:*', fq=filter_query, sort='id asc', rows=rows)['results']
+        if records:
+            LOGGER.info('Retrieved %s datasets with IDs %s - %s', len(records),
+                        records[0]['id'], records[-1]['id'])
+            yield records
+        if len(records) < rows:
+            break
+        last_id = records[-1]['id']
+
+
+def _call_with_retries(function, retries, backoff, **kwargs):
+    '''
+    Calls the given CKAN API function with the given arguments. Retries failed requests with a
+    delay of backoff, 2 * backoff, ... seconds.
+    '''
+    for attempt in range(retries):
+        try:
+            return function(**kwargs)
+        except (ckanapi.CKANAPIError, requests.exceptions.RequestException) as ex:
+            LOGGER.warning('Request with %s failed, retry in %s seconds: %s',
+                           kwargs, backoff * 2 ** attempt, ex)
+            time.sleep(backoff * 2 ** attempt)
+    return function(**kwargs)
 
-        min_range = (i * 1000) + 1
-        max_range = min_range + rows - 1
-        info_message = 'Retrieve datasets {min} - {max}'.format(
-            min=min_range,
-            max=max_range
-        )
-        LOGGER.info(info_message)
 
-        records = ckan_api_client.action.package_search(
-            rows=rows,
-            start=rows * i
-        )
-        records = records['results']
-        for record in records:
-            yield record
+def map_in_processes(function, items, processes=1, chunksize=1):
+    '''
+    Applies the given function to the given items in a pool of the given number of processes and
+    yields the results in the order of the items. The items are sent to the processes in chunks
+    of chunksize items. With a single process the items are mapped in the current process. The
+    function, the items and the results have to be picklable.
+    '''
+    if processes <= 1:
+        yield from (function(item) for item in items)
+        return
+    with multiprocessing.Pool(processes) as pool:
+        yield from pool.imap(function, items, chunksize)
 
 
 def iterate_local_datasets(context):
@@ -66,6 +163,53 @@ def iterate_local_datasets(context):
             print(u'Did not found dataset with ID {}'.format(dataset_name))
 
 
+def iterate_local_link_check_datasets(context, rows=1000):
+    '''
+    Iterates over the local datasets normalized for the link check.
+    '''
+    for result in iterate_local_link_check_results(context, rows):
+        yield link_check_dataset(result)
+
+
+def iterate_local_link_check_results(context, rows=1000):
+    '''
+    Iterates over the package_search results of the local datasets with only the fields
+    LINK_CHECK_FIELDS. The datasets are read from the search index in batches of the given
+    rows ordered by ID, each batch starts after the last ID of the previous batch.
+    '''
+    package_search = logic.get_action('package_search')
+    last_id = None
+    while True:
+        data_dict = {'q': '*:*', 'fl': LINK_CHECK_FIELDS, 'rows': rows, 'sort': 'id asc'}
+        if last_id is not None:
+            data_dict['fq_list'] = ['id:{"%s" TO *]' % last_id]
+        results = package_search(context.copy(), data_dict)['results']
+        yield from results
+        if len(results) < rows:
+            break
+        last_id = results[-1]['id']
+
+
+def link_check_dataset(result):
+    '''
+    Creates the normalized dataset for the link check from the given package_search result
+    with the fields LINK_CHECK_FIELDS.
+    '''
+    extras = {}
+    # package_search returns the requested extras_* fields without the prefix
+    portal = result.get('metadata_harvested_portal')
+    if portal is not None:
+        extras['metadata_harvested_portal'] = portal
+    return {
+        'id': result['id'],
+        'name': result['name'],
+        'maintainer': result.get('maintainer'),
+        'maintainer_email': result.get('maintainer_email'),
+        'resources': [{'url': url} for url in result.get('res_url', [])],
+        'extras': normalize_extras(extras)
+    }
+
+
 def normalize_api_dataset(dataset):
     '''
     Normalizes the given API version 1 dataset
@@ -117,19 +261,51 @@ def normalize_action_dataset(dataset):
 
 def normalize_extras(source):
     '''
-    Normalizes the extras key, values
+    Normalizes the extras key, values. Strings containing a JSON object, array or string are
+    replaced by their normalized value, each string is parsed once.
     '''
     if isinstance(source, dict):
-        result = {}
-        for key, value in source.items():
-            result[key] = normalize_extras(value)
-        return result
-    elif isinstance(source, list):
+        return {key: normalize_extras(value) for key, value in source.items()}
+    if isinstance(source, list):
         return [normalize_extras(item) for item in source]
-    elif isinstance(source, str) and is_valid(source):
-        return normalize_extras(json.loads(source))
+    # other strings cannot be a JSON object, array or string
+    if isinstance(source, str) and source[:1] in JSON_VALUE_STARTS:
+        value = _parse_json(source)
+        if isinstance(value, (dict, list, str)):
+            return normalize_extras(value)
     return source
 
+
+def _parse_json(source):
+    '''
+    Parses the given JSON string with orjson, if installed, otherwise with json. Returns None, if
+    the string is not valid JSON.
+    '''
+    if _ORJSON_LOADS is not None:
+        try:
+            return _ORJSON_LOADS(source)
+        except ValueError:
+            # e.g. lone surrogates or large integers, which json accepts
+            pass
+    try:
+        return json.loads(source)
+    except ValueError:
+        return None
+
+
+def _orjson_loads():
+    '''
+    Returns the function loads of the package orjson or None, if orjson is not installed.
+    '''
+    try:
+        import orjson  # pylint: disable=import-outside-toplevel
+        return orjson.loads
+    except ImportError:
+        return None
+
+
+_ORJSON_LOADS = _orjson_loads()
+
 def get_group_dict(group_name):
     '''
     Creates a group dict with the given name and returns this.
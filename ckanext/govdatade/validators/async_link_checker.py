@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+'''
+Module for checking link availability of CKAN resources with an asyncio HTTP client.
+'''
+from contextlib import contextmanager
+import asyncio
+import threading
+
+import aiohttp
+import requests
+
+from ckanext.govdatade.validators.link_checker import LinkChecker
+
+
+class AsyncLinkChecker(LinkChecker):
+
+    '''
+    Link checker keeping all URL checks in flight on a single event loop. The checks
+    result in the same status codes and error descriptions as the checks of the LinkChecker.
+    '''
+
+    ERROR_DESCRIPTIONS = (
+        (asyncio.TimeoutError, 'Timeout'),
+        (aiohttp.TooManyRedirects, 'Redirect Loop'),
+        (aiohttp.ClientSSLError, 'SSL Error'),
+        (aiohttp.ClientConnectionError, 'Connection Error'),
+        (aiohttp.InvalidURL, 'Invalid URL'),
+        (aiohttp.ClientError, 'Request Error'),
+    )
+
+    def process_records(self, datasets, workers=1, normalize=None):
+        '''
+        Checks the URLs of the given datasets on the event loop and yields a tuple
+        (dataset, error) for each processed dataset. The number of workers is the maximum
+        number of URL checks in flight, with one worker the URLs are checked one after another
+        on the event loop as well.
+        '''
+        return self._process_concurrently(datasets, max(workers, 1), normalize)
+
+    @contextmanager
+    def _url_executor(self, workers):
+        '''
+        Runs an event loop in a background thread and provides a function submitting a URL
+        check to this loop.
+        '''
+        loop = asyncio.new_event_loop()
+        thread = threading.Thread(target=loop.run_forever, name='linkchecker-event-loop')
+        thread.daemon = True
+        thread.start()
+
+        session, semaphore = asyncio.run_coroutine_threadsafe(
+            self._create_session(workers), loop).result()
+        try:
+            yield lambda url: asyncio.run_coroutine_threadsafe(
+                self.check_url_async(session, semaphore, url), loop)
+        finally:
+            asyncio.run_coroutine_threadsafe(session.close(), loop).result()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+    async def _create_session(self, workers):
+        '''
+        Creates the HTTP client session and the semaphore limiting the checks in flight.
+        Has to be called on the event loop.
+        '''
+        # Analogous to the timeout of requests the timeout applies to connecting and reading,
+        # not to the time waiting for a free connection.
+        timeout = aiohttp.ClientTimeout(
+            total=None, sock_connect=self.default_timeout, sock_read=self.default_timeout)
+        limit = min(workers, self.max_connections) if self.max_connections > 0 else workers
+        connector = aiohttp.TCPConnector(
+            limit=limit, limit_per_host=self.max_requests_per_host, ssl=False)
+        session = aiohttp.ClientSession(
+            connector=connector, timeout=timeout, headers=self.HEADERS)
+        return session, asyncio.Semaphore(workers)
+
+    async def check_url_async(self, session, semaphore, url):
+        '''
+        Checks a single URL and returns the HTTP status code or an error description. None is
+        returned, if the URL has to be considered as available anyway.
+        '''
+        try:
+            async with semaphore:
+                code = await self.validate_async(session, url)
+            self.logger.debug(u'HTTP status code for %s: %s', url, code)
+            return code
+        except Exception as exception:
+            return self.describe_error(exception)
+
+    async def validate_async(self, session, url):
+        '''
+        Validates a given URL by making a request against it
+        and returning it's HTTP status code.
+        '''
+        self.logger.debug(u'URL: %s', url)
+
+        headers = self.request_headers(url)
+        self.logger.debug(u'Calling with HEAD method...')
+        async with session.head(url, allow_redirects=True, headers=headers,
+                                max_redirects=self.MAX_REDIRECTS) as response:
+            status_code = response.status
+            response_headers = response.headers
+            redirection_to_404_page = self.has_redirection_to_404_page(response)
+
+        if redirection_to_404_page:
+            self.logger.debug(
+                'Redirect ends in HTTP status code %s', str(requests.codes.not_found)
+            )
+            return requests.codes.not_found
+        # if method HEAD is not allowed try again with http method GET
+        if self.is_method_not_allowed(status_code):
+            self.logger.debug(u'HEAD method seems is not supported. Calling with GET method...')
+            status_code, response_headers = await self.probe_async(session, url, headers)
+
+        self.logger.debug(
+            'HTTP status code: %s', str(status_code)
+        )
+        self.remember_validators(url, status_code, response_headers)
+        return status_code
+
+    async def probe_async(self, session, url, headers):
+        '''
+        Requests the given URL with GET as bounded probe like LinkChecker.probe and returns
+        the HTTP status code and the response headers.
+        '''
+        probe_headers = dict(headers, **self.PROBE_HEADERS)
+        for request_headers in (probe_headers, dict(headers, Connection='close')):
+            # the body is never read, the connection is closed when leaving the context
+            async with session.get(url, allow_redirects=True, headers=request_headers,
+                                   max_redirects=self.MAX_REDIRECTS) as response:
+                status_code = response.status
+                response_headers = response.headers
+            if status_code != requests.codes.requested_range_not_satisfiable:
+                break
+            self.logger.debug(u'Range not satisfiable. Calling without range...')
+        return status_code, response_headers
@@ -0,0 +1,29 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+'''
+Module for creating the link checker of the configured HTTP backend.
+'''
+import logging
+
+from ckanext.govdatade.validators.link_checker import LinkChecker
+
+
+def create_link_checker(config):
+    '''
+    Creates the link checker for the HTTP backend configured with
+    ckanext.govdata.validators.linkchecker.backend ('requests' or 'asyncio'). The asyncio
+    backend requires the package aiohttp, without it the backend requests is used.
+    '''
+    logger = logging.getLogger(__name__)
+    backend = config.get('ckanext.govdata.validators.linkchecker.backend', 'requests')
+    if backend == 'asyncio':
+        try:
+            # imported here, because the asyncio backend requires aiohttp
+            from ckanext.govdatade.validators.async_link_checker import \
+                AsyncLinkChecker  # pylint: disable=import-outside-toplevel
+            return AsyncLinkChecker(config)
+        except ImportError:
+            logger.warning('LinkChecker: Package aiohttp not installed, using backend requests.')
+    elif backend != 'requests':
+        logger.warning('LinkChecker: Unknown backend %s, using backend requests.', backend)
+    return LinkChecker(config)
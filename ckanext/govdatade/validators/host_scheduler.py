@@ -0,0 +1,283 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+'''
+Module for scheduling URL checks politely per host.
+'''
+from collections import deque
+from concurrent.futures import Future
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+import logging
+import threading
+import time
+
+
+class RetryAfter(Exception):
+
+    '''
+    Raised by a scheduled function, if the host asks to retry the request later.
+    '''
+
+    def __init__(self, delay, status_code):
+        super(RetryAfter, self).__init__(
+            'Retry after %s seconds (HTTP status code %s)' % (delay, status_code))
+        self.delay = delay
+        self.status_code = status_code
+
+
+class _Task(object):
+
+    '''
+    A scheduled function call.
+    '''
+
+    def __init__(self, function, args):
+        self.function = function
+        self.args = args
+        self.future = Future()
+        self.enqueued = time.monotonic()
+        self.retries = 0
+
+
+class _Host(object):
+
+    '''
+    Queue and state of a single host.
+    '''
+
+    def __init__(self, name):
+        self.name = name
+        self.queue = deque()
+        self.active = 0
+        self.next_request = 0.0
+        self.blocked_until = 0.0
+        self.requests = 0
+        self.retries = 0
+        self.max_queue_depth = 0
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+
+class HostScheduler(object):
+
+    '''
+    Executes functions for URLs in a pool of worker threads. The pending URLs are grouped by
+    host and the hosts are served round robin, so that each host sees at most
+    max_per_host concurrent requests and requests_per_second requests per second (0 means
+    unlimited), while the workers keep busy with the other hosts. A function raising
+    RetryAfter is rescheduled after the given delay, during which the host is paused. If the
+    retries are exhausted or the delay is too long, the result of the task is NOT_CHECKED.
+    '''
+
+    DEFAULT_RETRY_AFTER = 30
+    # result of a task, which was not executed because the host asked to retry later
+    NOT_CHECKED = 'not checked'
+
+    def __init__(self, workers, max_per_host=4, requests_per_second=0, max_retries=2,
+                 max_retry_after=300):
+        self.logger = logging.getLogger(__name__)
+        self.max_per_host = max(max_per_host, 1)
+        self.interval = 1.0 / requests_per_second if requests_per_second > 0 else 0.0
+        self.max_retries = max_retries
+        self.max_retry_after = max_retry_after
+
+        self._hosts = {}
+        self._pending_hosts = deque()
+        self._condition = threading.Condition()
+        self._shutdown = False
+        self._threads = []
+        for index in range(max(workers, 1)):
+            thread = threading.Thread(target=self._work, name='linkchecker-worker-%s' % index)
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+    @staticmethod
+    def host(url):
+        '''
+        Returns the host (network location) of the given URL.
+        '''
+        if isinstance(url, bytes):
+            url = url.decode('utf-8', 'replace')
+        try:
+            return urlsplit(url).netloc.lower()
+        except ValueError:
+            return ''
+
+    @staticmethod
+    def parse_retry_after(value):
+        '''
+        Returns the delay in seconds of the given Retry-After header value, which is either a
+        number of seconds or a HTTP date. Returns None for an invalid value.
+        '''
+        if value is None:
+            return None
+        value = value.strip()
+        if value.isdigit():
+            return int(value)
+        try:
+            retry_date = parsedate_to_datetime(value)
+        except (TypeError, ValueError, IndexError):
+            return None
+        if retry_date is None:
+            return None
+        if retry_date.tzinfo is None:
+            retry_date = retry_date.replace(tzinfo=timezone.utc)
+        return max((retry_date - datetime.now(timezone.utc)).total_seconds(), 0)
+
+    def submit(self, url, function, *args):
+        '''
+        Schedules the call of function with the given arguments for the host of the given URL
+        and returns a future of its result.
+        '''
+        task = _Task(function, args)
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError('Cannot schedule new tasks after shutdown')
+            host = self._host_state(self.host(url))
+            self._enqueue(host, task)
+            self._condition.notify()
+        return task.future
+
+    def shutdown(self, wait=True):
+        '''
+        Stops the workers after all scheduled tasks were executed.
+        '''
+        with self._condition:
+            self._shutdown = True
+            self._condition.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def metrics(self):
+        '''
+        Returns the metrics per host: number of requests and retries, current and maximum
+        queue depth and the total and maximum time (s) the tasks have waited in the queue.
+        '''
+        with self._condition:
+            return dict((host.name, {
+                'requests': host.requests,
+                'retries': host.retries,
+                'queue_depth': len(host.queue),
+                'max_queue_depth': host.max_queue_depth,
+                'wait_time': host.wait_time,
+                'max_wait_time': host.max_wait_time
+            }) for host in self._hosts.values())
+
+    def _host_state(self, name):
+        '''
+        Returns the state of the host with the given name, which is created if necessary.
+        '''
+        host = self._hosts.get(name)
+        if host is None:
+            host = _Host(name)
+            self._hosts[name] = host
+        return host
+
+    def _enqueue(self, host, task, first=False):
+        '''
+        Appends the task to the queue of the given host or puts it first and marks the host
+        as pending.
+        '''
+        if not host.queue:
+            self._pending_hosts.append(host)
+        if first:
+            host.queue.appendleft(task)
+        else:
+            host.queue.append(task)
+        host.max_queue_depth = max(host.max_queue_depth, len(host.queue))
+
+    def _next_task(self, now):
+        '''
+        Takes the next task of the first eligible host in round robin order. Returns the task
+        and its host or None, None and the time (s) until a paused host gets eligible again.
+        '''
+        wait = None
+        for dummy_index in range(len(self._pending_hosts)):
+            host = self._pending_hosts.popleft()
+            if host.active >= self.max_per_host:
+                self._pending_hosts.append(host)
+                continue
+            ready_at = max(host.next_request, host.blocked_until)
+            if ready_at > now:
+                self._pending_hosts.append(host)
+                wait = ready_at - now if wait is None else min(wait, ready_at - now)
+                continue
+
+            task = host.queue.popleft()
+            if host.queue:
+                self._pending_hosts.append(host)
+            host.active += 1
+            host.next_request = now + self.interval
+            waited = now - task.enqueued
+            host.wait_time += waited
+            host.max_wait_time = max(host.max_wait_time, waited)
+            return task, host, None
+        return None, None, wait
+
+    def _work(self):
+        '''
+        Runs the tasks of the eligible hosts until the scheduler is shut down and all tasks
+        are done.
+        '''
+        while True:
+            with self._condition:
+                while True:
+                    task, host, wait = self._next_task(time.monotonic())
+                    if task is not None:
+                        break
+                    if self._shutdown and not self._pending_hosts and \
+                            not any(state.active for state in self._hosts.values()):
+                        self._condition.notify_all()
+                        return
+                    self._condition.wait(wait)
+            self._run(task, host)
+
+    def _run(self, task, host):
+        '''
+        Runs the given task and sets the result of its future or reschedules it, if the
+        function raised RetryAfter.
+        '''
+        retry = None
+        # a retried task is already running
+        if task.retries > 0 or task.future.set_running_or_notify_cancel():
+            try:
+                task.future.set_result(task.function(*task.args))
+            except RetryAfter as retry_after:
+                retry = retry_after
+            except BaseException as ex:
+                task.future.set_exception(ex)
+
+        with self._condition:
+            host.active -= 1
+            host.requests += 1
+            if retry is not None:
+                self._retry(task, host, retry)
+            self._condition.notify_all()
+
+    def _retry(self, task, host, retry):
+        '''
+        Reschedules the given task after the delay of the given RetryAfter and pauses the host
+        for this time. The result of the task is NOT_CHECKED, if the retries are exhausted or
+        the delay exceeds max_retry_after.
+        '''
+        delay = retry.delay if retry.delay is not None else self.DEFAULT_RETRY_AFTER
+        if task.retries >= self.max_retries or delay > self.max_retry_after:
+            self.logger.debug('Host %s answered with HTTP status code %s, giving up after %s '
+                              'retries.', host.name, retry.status_code, task.retries)
+            task.future.set_result(self.NOT_CHECKED)
+            return
+        self.logger.debug('Host %s asks to retry after %s seconds.', host.name, delay)
+        task.retries += 1
+        host.retries += 1
+        host.blocked_until = max(host.blocked_until, time.monotonic() + delay)
+        task.enqueued = time.monotonic()
+        self._enqueue(host, task, first=True)
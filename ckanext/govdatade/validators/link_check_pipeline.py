@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+'''
+Module for running the link check of datasets as a pipeline of concurrent stages.
+'''
+import queue
+import threading
+import time
+
+# marks the end of the items of a stage
+_END = object()
+
+
+class _Failure(object):
+
+    '''
+    Passes an exception of a stage, which aborts the pipeline, to the consumer.
+    '''
+
+    def __init__(self, exception):
+        self.exception = exception
+
+
+class StageCounter(object):
+
+    '''
+    Throughput counters of a pipeline stage. The busy time is the time spent processing items,
+    the wait time is the time spent waiting for input or for space in the output queue.
+    '''
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy_time = 0.0
+        self.wait_time = 0.0
+
+    def metrics(self):
+        '''
+        Returns the counters as dict.
+        '''
+        busy_time = self.busy_time
+        return {
+            'items': self.items,
+            'busy_time': busy_time,
+            'wait_time': self.wait_time,
+            'items_per_second': self.items / busy_time if busy_time > 0 else 0.0
+        }
+
+
+class LinkCheckPipeline(object):
+
+    '''
+    Checks the URLs of datasets in stages running in their own threads: The source reads the
+    datasets, the normalization prepares them for the link check, the fan-out submits the
+    checks of their URLs to the HTTP workers and the writer records the results in Redis. The
+    stages are connected by bounded queues, so a slow stage blocks the stages before it, while
+    reading datasets, checking URLs and writing the results overlap. The writer records the
+    datasets in the order of the source.
+    '''
+
+    STAGES = ('source', 'normalize', 'fanout', 'writer')
+    POLL_INTERVAL = 0.1
+
+    def __init__(self, link_checker, submit, queue_size, pending_datasets, normalize=None):
+        self.link_checker = link_checker
+        self.submit = submit
+        self.normalize = normalize
+        self.queue_sizes = {'source': queue_size, 'normalize': queue_size,
+                            'fanout': pending_datasets, 'writer': queue_size}
+        self.counters = dict((name, StageCounter(name)) for name in self.STAGES)
+        self._stop = threading.Event()
+
+    def run(self, datasets):
+        '''
+        Runs the pipeline with the given datasets and yields a tuple (dataset, error) for each
+        processed dataset. The stages are stopped, when the generator is closed.
+        '''
+        queues = dict((name, queue.Queue(maxsize=size)) for name, size in self.queue_sizes.items())
+        threads = [
+            self._start('source', self._read, iter(datasets), queues['source']),
+            self._start('normalize', self._stage, queues['source'], queues['normalize'],
+                        self._normalize),
+            self._start('fanout', self._stage, queues['normalize'], queues['fanout'],
+                        self._fan_out),
+            self._start('writer', self._stage, queues['fanout'], queues['writer'], self._write)
+        ]
+        try:
+            while True:
+                item = self._next_result(queues['writer'], threads[-1])
+                if item is _END:
+                    break
+                if isinstance(item, _Failure):
+                    raise item.exception
+                dataset, dummy_futures, error = item
+                yield dataset, error
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+
+    def metrics(self):
+        '''
+        Returns the counters of the stages as dict of dicts.
+        '''
+        return dict((name, counter.metrics()) for name, counter in self.counters.items())
+
+    def _next_result(self, results, writer):
+        '''
+        Returns the next item of the results queue. Raises a RuntimeError, if the writer thread
+        ended without passing the end of the items on.
+        '''
+        while True:
+            try:
+                return results.get(timeout=self.POLL_INTERVAL)
+            except queue.Empty:
+                if not writer.is_alive() and results.empty():
+                    raise RuntimeError('LinkCheckPipeline: A stage ended unexpectedly') from None
+
+    def _start(self, name, target, *args):
+        '''
+        Starts a thread running the given stage function with its counter and the given
+        arguments.
+        '''
+        thread = threading.Thread(
+            target=target, args=(self.counters[name],) + args, name='linkchecker-' + name)
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def _read(self, counter, datasets, output_queue):
+        '''
+        Puts the datasets of the source into the output queue.
+        '''
+        while True:
+            starttime = time.time()
+            try:
+                dataset = next(datasets)
+            except StopIteration:
+                break
+            except BaseException as ex:
+                # e.g. KeyboardInterrupt, the consumer raises it again
+                self._put(counter, output_queue, _Failure(ex))
+                return
+            counter.busy_time += time.time() - starttime
+            counter.items += 1
+            if not self._put(counter, output_queue, (dataset, None, None)):
+                return
+        self._put(counter, output_queue, _END)
+
+    def _stage(self, counter, input_queue, output_queue, function):
+        '''
+        Applies the given function to the items of the input queue and puts the results into
+        the output queue. Items and failures are passed on in order.
+        '''
+        while True:
+            item = self._get(counter, input_queue)
+            if item is None:
+                return
+            if item is not _END and not isinstance(item, _Failure):
+                starttime = time.time()
+                try:
+                    item = function(*item)
+                except BaseException as ex:
+                    item = _Failure(ex)
+                counter.busy_time += time.time() - starttime
+                counter.items += 1
+            if not self._put(counter, output_queue, item) or item is _END \
+                    or isinstance(item, _Failure):
+                return
+
+    def _normalize(self, dataset, futures, error):
+        '''
+        Returns the dataset returned by the normalize function. The original dataset is
+        returned with the error of the normalization.
+        '''
+        if error is None and self.normalize is not None:
+            try:
+                dataset = self.normalize(dataset)
+            except Exception as ex:
+                error = ex
+        return dataset, futures, error
+
+    def _fan_out(self, dataset, futures, error):
+        '''
+        Submits the URL checks of the dataset and returns the futures of their results.
+        '''
+        if error is None:
+            try:
+                futures = self.link_checker.submit_dataset(dataset, self.submit)
+            except Exception as ex:
+                error = ex
+        return dataset, futures, error
+
+    def _write(self, dataset, futures, error):
+        '''
+        Waits for the URL checks of the dataset and records the results.
+        '''
+        if error is None:
+            dummy_dataset, error = self.link_checker.complete_record(dataset, futures)
+        return dataset, futures, error
+
+    def _put(self, counter, output_queue, item):
+        '''
+        Puts the item into the output queue and returns True or False, if the pipeline was
+        stopped while waiting for space in the queue.
+        '''
+        starttime = time.time()
+        try:
+            while not self._stop.is_set():
+                try:
+                    output_queue.put(item, timeout=self.POLL_INTERVAL)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+        finally:
+            counter.wait_time += time.time() - starttime
+
+    def _get(self, counter, input_queue):
+        '''
+        Returns the next item of the input queue or None, if the pipeline was stopped while
+        waiting for an item.
+        '''
+        starttime = time.time()
+        try:
+            while not self._stop.is_set():
+                try:
+                    return input_queue.get(timeout=self.POLL_INTERVAL)
+                except queue.Empty:
+                    pass
+            return None
+        finally:
+            counter.wait_time += time.time() - starttime
@@ -0,0 +1,192 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+'''
+Module for distributing the link check of datasets to workers through Redis.
+'''
+from datetime import datetime
+import json
+import time
+
+# result of a claim of a dataset, which is no longer enqueued
+_STALE = object()
+
+
+class LinkCheckQueue(object):
+
+    '''
+    Work queue of a link check round in Redis, so that workers on several hosts check the
+    datasets. The coordinator enqueues the dataset IDs into the list <prefix>queue:pending
+    and the datasets into the hash <prefix>queue:datasets. A worker claims a dataset by
+    moving it into the sorted set <prefix>queue:claims, scored by the deadline after
+    visibility_timeout seconds, and acknowledges it after the check. A dataset not
+    acknowledged before its deadline, e.g. because the worker died, is claimed again by
+    another worker. The IDs of the successfully checked datasets are collected in the set
+    <prefix>queue:processed, the hash <prefix>queue:state marks the round as active and holds
+    the number of datasets, once all are enqueued.
+    '''
+
+    def __init__(self, redis_client, prefix, visibility_timeout=600):
+        self.redis_client = redis_client
+        self.pending_key = prefix + 'queue:pending'
+        self.datasets_key = prefix + 'queue:datasets'
+        self.claims_key = prefix + 'queue:claims'
+        self.owners_key = prefix + 'queue:owners'
+        self.processed_key = prefix + 'queue:processed'
+        self.state_key = prefix + 'queue:state'
+        self.visibility_timeout = visibility_timeout
+
+    def start(self, datasets, batch_size=1000):
+        '''
+        Starts a round with the given datasets, which are dicts with at least an id, and
+        returns the number of enqueued datasets. Returns None, if the previous round is still
+        active.
+        '''
+        if self.is_active():
+            return None
+        self.clear()
+        self.redis_client.hset(self.state_key, 'started', datetime.now().isoformat())
+        num_datasets = 0
+        batch = {}
+        for dataset in datasets:
+            batch[dataset['id']] = json.dumps(dataset)
+            if len(batch) >= batch_size:
+                num_datasets += self._enqueue(batch)
+                batch = {}
+        num_datasets += self._enqueue(batch)
+        self.redis_client.hset(self.state_key, 'num_datasets', num_datasets)
+        return num_datasets
+
+    def is_active(self):
+        '''
+        Checks if a round was started and not finished yet.
+        '''
+        return self.redis_client.exists(self.state_key) > 0
+
+    def claim(self, worker_id):
+        '''
+        Claims the next pending dataset or a dataset, whose deadline expired, for the given
+        worker and returns it. Returns None, if there is no dataset to claim.
+        '''
+        def transaction(pipe):
+            now = time.time()
+            expired = pipe.zrangebyscore(self.claims_key, '-inf', now, start=0, num=1)
+            dataset_id = expired[0] if expired else pipe.lindex(self.pending_key, 0)
+            if dataset_id is None:
+                pipe.unwatch()
+                return None
+            data = pipe.hget(self.datasets_key, dataset_id)
+            pipe.multi()
+            if not expired:
+                pipe.lpop(self.pending_key)
+            if data is None:
+                # the dataset of a cleared round
+                pipe.zrem(self.claims_key, dataset_id)
+                pipe.hdel(self.owners_key, dataset_id)
+                return _STALE
+            pipe.zadd(self.claims_key, {dataset_id: now + self.visibility_timeout})
+            pipe.hset(self.owners_key, dataset_id, worker_id)
+            return json.loads(data)
+
+        while True:
+            dataset = self.redis_client.transaction(
+                transaction, self.pending_key, self.claims_key, value_from_callable=True)
+            if dataset is not _STALE:
+                return dataset
+
+    def claims(self, worker_id, poll_interval=1.0):
+        '''
+        Yields the datasets claimed for the given worker until the round is drained. While
+        the datasets claimed by other workers are not acknowledged yet, the queue is polled
+        for expired claims.
+        '''
+        while True:
+            dataset = self.claim(worker_id)
+            if dataset is not None:
+                yield dataset
+            elif self.is_drained():
+                return
+            else:
+                time.sleep(poll_interval)
+
+    def ack(self, dataset_id, worker_id, processed=True):
+        '''
+        Acknowledges the check of the given dataset by the given worker. Returns False, if the
+        claim expired and the dataset was claimed by another worker in the meantime. With
+        processed the dataset is an active dataset of the round.
+        '''
+        def transaction(pipe):
+            if pipe.hget(self.owners_key, dataset_id) != worker_id:
+                pipe.unwatch()
+                return False
+            pipe.multi()
+            pipe.zrem(self.claims_key, dataset_id)
+            pipe.hdel(self.owners_key, dataset_id)
+            pipe.hdel(self.datasets_key, dataset_id)
+            if processed:
+                pipe.sadd(self.processed_key, dataset_id)
+            return True
+
+        return self.redis_client.transaction(
+            transaction, self.owners_key, value_from_callable=True)
+
+    def is_drained(self):
+        '''
+        Checks if all datasets of the round were enqueued and acknowledged or if there is no
+        active round.
+        '''
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.llen(self.pending_key)
+        pipe.zcard(self.claims_key)
+        pipe.hget(self.state_key, 'started')
+        pipe.hget(self.state_key, 'num_datasets')
+        num_pending, num_claims, started, num_datasets = pipe.execute()
+        return not num_pending and not num_claims and (started is None or num_datasets is not None)
+
+    def finish(self):
+        '''
+        Ends the drained round and returns True for exactly one of the workers calling it, so
+        that this worker completes the round.
+        '''
+        def transaction(pipe):
+            if pipe.llen(self.pending_key) or pipe.zcard(self.claims_key) \
+                    or pipe.hget(self.state_key, 'num_datasets') is None:
+                pipe.unwatch()
+                return False
+            pipe.multi()
+            pipe.delete(self.state_key)
+            return True
+
+        return self.redis_client.transaction(
+            transaction, self.pending_key, self.claims_key, self.state_key,
+            value_from_callable=True)
+
+    def num_processed(self):
+        '''
+        Returns the number of successfully checked datasets of the round.
+        '''
+        return self.redis_client.scard(self.processed_key)
+
+    def iterate_processed(self, batch_size=1000):
+        '''
+        Iterates over the IDs of the successfully checked datasets with SSCAN.
+        '''
+        return self.redis_client.sscan_iter(self.processed_key, count=batch_size)
+
+    def clear(self):
+        '''
+        Removes the keys of the queue.
+        '''
+        self.redis_client.delete(self.pending_key, self.datasets_key, self.claims_key,
+                                 self.owners_key, self.processed_key, self.state_key)
+
+    def _enqueue(self, batch):
+        '''
+        Enqueues the given dict of encoded datasets by ID and returns their number.
+        '''
+        if not batch:
+            return 0
+        pipe = self.redis_client.pipeline()
+        pipe.hset(self.datasets_key, mapping=batch)
+        pipe.rpush(self.pending_key, *batch)
+        pipe.execute()
+        return len(batch)
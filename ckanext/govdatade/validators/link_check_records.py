@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+'''
+Module for storing the link check records of datasets in Redis.
+'''
+import copy
+
+from ckanext.govdatade.validators.record_codec import JsonCodec, RecordCodec
+
+
+class LinkCheckRecords(object):
+
+    '''
+    Stores the link check record of a dataset in two Redis hashes below the given prefix: The
+    hash <prefix>urls:<dataset id> with a field per broken URL and the hash
+    <prefix>dataset:<dataset id> with the dataset fields, e.g. name and maintainer. The set
+    <prefix>datasets indexes the dataset IDs and the sorted set <prefix>strikes ranks the
+    datasets by the maximum strikes of their URLs. Only datasets with broken URLs are stored.
+    The hash values are encoded with the given RecordCodec, so the Redis client must not
+    decode the responses.
+    '''
+
+    def __init__(self, redis_client, prefix, urls_field='urls', codec=None):
+        self.redis_client = redis_client
+        self.prefix = prefix
+        self.urls_field = urls_field
+        self.codec = codec or RecordCodec(JsonCodec())
+        self.index_key = prefix + 'datasets'
+        self.strikes_key = prefix + 'strikes'
+
+    def urls_key(self, dataset_id):
+        '''
+        Returns the key of the hash with the broken URLs of the given dataset.
+        '''
+        return '%surls:%s' % (self.prefix, dataset_id)
+
+    def dataset_key(self, dataset_id):
+        '''
+        Returns the key of the hash with the dataset fields of the given dataset.
+        '''
+        return '%sdataset:%s' % (self.prefix, dataset_id)
+
+    def load(self, dataset_id):
+        '''
+        Returns the record of the given dataset as dict or None.
+        '''
+        pipe = self.redis_client.pipeline(transaction=False)
+        self._queue_load(pipe, dataset_id)
+        return self._record(dataset_id, *pipe.execute())
+
+    def save(self, dataset_id, record):
+        '''
+        Replaces the record of the given dataset.
+        '''
+        pipe = self.redis_client.pipeline()
+        self._queue_delete(pipe, dataset_id)
+        self._queue_write(pipe, dataset_id, record, {})
+        pipe.execute()
+
+    def update(self, dataset_id, update_function):
+        '''
+        Reads the broken URLs of the given dataset, applies the update function and writes
+        the changes. The update function gets the record or None and returns the updated
+        record and a result, which is returned. The record passed contains only the URLs,
+        the dataset fields of the returned record are written. Uses WATCH, so that the
+        update is repeated if the URLs are changed by another process in the meantime. If the
+        URLs are unchanged, nothing is written.
+        '''
+        urls_key = self.urls_key(dataset_id)
+
+        def transaction(pipe):
+            urls = self._decode(pipe.hgetall(urls_key))
+            # the update function changes the URL entries in place
+            record = {self.urls_field: copy.deepcopy(urls)} if urls else None
+            record, result = update_function(record)
+            if ((record or {}).get(self.urls_field) or {}) == urls:
+                pipe.unwatch()
+                return result
+            pipe.multi()
+            self._queue_write(pipe, dataset_id, record, urls)
+            return result
+
+        return self.redis_client.transaction(transaction, urls_key, value_from_callable=True)
+
+    def iterate_dataset_ids(self, batch_size=1000):
+        '''
+        Iterates over the IDs of the stored datasets with SSCAN.
+        '''
+        for dataset_id in self.redis_client.sscan_iter(self.index_key, count=batch_size):
+            yield dataset_id.decode('utf-8')
+
+    def iterate_records(self, dataset_ids, batch_size=1000):
+        '''
+        Yields the records of the given dataset IDs, which are loaded in pipelined batches.
+        '''
+        pipe = self.redis_client.pipeline(transaction=False)
+        batch = []
+        for dataset_id in dataset_ids:
+            self._queue_load(pipe, dataset_id)
+            batch.append(dataset_id)
+            if len(batch) >= batch_size:
+                yield from self._execute_load(pipe, batch)
+                batch = []
+        yield from self._execute_load(pipe, batch)
+
+    def delete(self, dataset_ids):
+        '''
+        Deletes the records of the given dataset IDs.
+        '''
+        dataset_ids = list(dataset_ids)
+        if not dataset_ids:
+            return
+        pipe = self.redis_client.pipeline()
+        for dataset_id in dataset_ids:
+            pipe.delete(self.urls_key(dataset_id), self.dataset_key(dataset_id))
+        pipe.srem(self.index_key, *dataset_ids)
+        pipe.zrem(self.strikes_key, *dataset_ids)
+        pipe.execute()
+
+    def top_broken(self, count=10):
+        '''
+        Returns a list of (dataset ID, strikes) tuples of the datasets with the most strikes.
+        '''
+        return [(dataset_id.decode('utf-8'), int(strikes)) for dataset_id, strikes
+                in self.redis_client.zrevrange(self.strikes_key, 0, count - 1, withscores=True)]
+
+    def upgrade(self, dataset_id):
+        '''
+        Rewrites the values of the given dataset, which are not encoded with the current
+        codec, e.g. untagged JSON of previous versions. Returns the number of rewritten values.
+        '''
+        keys = (self.urls_key(dataset_id), self.dataset_key(dataset_id))
+
+        def transaction(pipe):
+            outdated = [(key, dict((field, self.codec.encode(self.codec.decode(value)))
+                                   for field, value in pipe.hgetall(key).items()
+                                   if not self.codec.is_current(value)))
+                        for key in keys]
+            pipe.multi()
+            for key, mapping in outdated:
+                if mapping:
+                    pipe.hset(key, mapping=mapping)
+            return sum(len(mapping) for dummy_key, mapping in outdated)
+
+        return self.redis_client.transaction(transaction, *keys, value_from_callable=True)
+
+    def _queue_load(self, pipe, dataset_id):
+        '''
+        Queues the commands reading the record of the given dataset.
+        '''
+        pipe.hgetall(self.dataset_key(dataset_id))
+        pipe.hgetall(self.urls_key(dataset_id))
+
+    def _execute_load(self, pipe, dataset_ids):
+        '''
+        Executes the queued reads of the given datasets and returns the records found.
+        '''
+        if not dataset_ids:
+            return []
+        results = pipe.execute()
+        records = (self._record(dataset_id, *results[index * 2:index * 2 + 2])
+                   for index, dataset_id in enumerate(dataset_ids))
+        return [record for record in records if record is not None]
+
+    def _record(self, dataset_id, fields, urls):
+        '''
+        Returns the record of the given encoded hashes or None, if there are no broken URLs.
+        '''
+        if not urls:
+            return None
+        record = self._decode(fields)
+        record.setdefault('id', dataset_id)
+        record[self.urls_field] = self._decode(urls)
+        return record
+
+    def _queue_write(self, pipe, dataset_id, record, stored_urls):
+        '''
+        Queues the commands writing the changes of the given record, stored_urls are the
+        decoded URL entries currently stored. The dataset fields are written together with
+        changed URL entries, the index and the ranking only if they change.
+        '''
+        urls = (record or {}).get(self.urls_field) or {}
+        if not urls:
+            if stored_urls:
+                self._queue_delete(pipe, dataset_id)
+            return
+
+        removed = [url for url in stored_urls if url not in urls]
+        if removed:
+            pipe.hdel(self.urls_key(dataset_id), *removed)
+        changed = dict((url, self.codec.encode(entry)) for url, entry in urls.items()
+                       if stored_urls.get(url) != entry)
+        if changed:
+            pipe.hset(self.urls_key(dataset_id), mapping=changed)
+        fields = dict((name, self.codec.encode(value)) for name, value in record.items()
+                      if name != self.urls_field)
+        if fields and (removed or changed):
+            pipe.hset(self.dataset_key(dataset_id), mapping=fields)
+        if not stored_urls:
+            pipe.sadd(self.index_key, dataset_id)
+        strikes = self.strikes(urls)
+        if not stored_urls or strikes != self.strikes(stored_urls):
+            pipe.zadd(self.strikes_key, {dataset_id: strikes})
+
+    def _queue_delete(self, pipe, dataset_id):
+        '''
+        Queues the commands deleting the record of the given dataset.
+        '''
+        pipe.delete(self.urls_key(dataset_id), self.dataset_key(dataset_id))
+        pipe.srem(self.index_key, dataset_id)
+        pipe.zrem(self.strikes_key, dataset_id)
+
+    @staticmethod
+    def strikes(urls):
+        '''
+        Returns the maximum strikes of the given URL entries.
+        '''
+        return max(entry.get('strikes', 0) for entry in urls.values())
+
+    def _decode(self, fields):
+        '''
+        Returns the given hash with decoded field names and values.
+        '''
+        return dict((name.decode('utf-8'), self.codec.decode(value))
+                    for name, value in fields.items())
@@ -0,0 +1,175 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+'''
+Module for persisting the progress of a link checker run in Redis.
+'''
+from datetime import datetime
+import hashlib
+
+
+class LinkCheckRun(object):
+
+    '''
+    Persists the IDs of the datasets processed by a run of the link checker in the Redis set
+    <prefix>run:processed and the state of the run in the hash <prefix>run:state. The IDs are
+    written in checkpoints of checkpoint_size datasets, so that an interrupted run can be
+    resumed without checking the datasets processed before the last checkpoint again. The
+    processed datasets are the active datasets of the run.
+    '''
+
+    def __init__(self, redis_client, prefix, checkpoint_size=100):
+        self.redis_client = redis_client
+        self.processed_key = prefix + 'run:processed'
+        self.state_key = prefix + 'run:state'
+        self.checkpoint_size = checkpoint_size
+        self.resumed = False
+        self._pending = []
+
+    def start(self, resume=False):
+        '''
+        Starts a new run or resumes the interrupted run, if resume is set and a run was
+        started before. Returns True, if a run is resumed.
+        '''
+        self.resumed = resume and self.redis_client.exists(self.state_key) > 0
+        if not self.resumed:
+            pipe = self.redis_client.pipeline()
+            pipe.delete(self.processed_key, self.state_key)
+            pipe.hset(self.state_key, 'started', datetime.now().isoformat())
+            pipe.execute()
+        return self.resumed
+
+    def pending(self, datasets, batch_size=1000):
+        '''
+        Yields the given datasets, which were not processed yet.
+        '''
+        if not self.resumed:
+            yield from datasets
+            return
+        batch = []
+        for dataset in datasets:
+            batch.append(dataset)
+            if len(batch) >= batch_size:
+                yield from self._pending_batch(batch)
+                batch = []
+        yield from self._pending_batch(batch)
+
+    def processed(self, dataset_id):
+        '''
+        Marks the given dataset as processed and writes a checkpoint every checkpoint_size
+        datasets.
+        '''
+        self._pending.append(dataset_id)
+        if len(self._pending) >= self.checkpoint_size:
+            self.checkpoint()
+
+    def checkpoint(self):
+        '''
+        Writes the datasets processed since the last checkpoint.
+        '''
+        if not self._pending:
+            return
+        pipe = self.redis_client.pipeline()
+        pipe.sadd(self.processed_key, *self._pending)
+        pipe.hset(self.state_key, 'checkpoint', datetime.now().isoformat())
+        pipe.execute()
+        self._pending = []
+
+    def num_processed(self):
+        '''
+        Returns the number of processed datasets of the run including the last checkpoint.
+        '''
+        return self.redis_client.scard(self.processed_key) + len(self._pending)
+
+    def iterate_processed(self, batch_size=1000):
+        '''
+        Iterates over the IDs of the processed datasets with SSCAN.
+        '''
+        self.checkpoint()
+        return self.redis_client.sscan_iter(self.processed_key, count=batch_size)
+
+    def finish(self):
+        '''
+        Removes the progress of the completed run.
+        '''
+        self._pending = []
+        self.redis_client.delete(self.processed_key, self.state_key)
+
+    def _pending_batch(self, datasets):
+        '''
+        Returns the datasets of the given batch, which were not processed in the resumed run.
+        '''
+        if not datasets:
+            return datasets
+        pipe = self.redis_client.pipeline(transaction=False)
+        for dataset in datasets:
+            pipe.sismember(self.processed_key, dataset['id'])
+        return [dataset for dataset, processed in zip(datasets, pipe.execute()) if not processed]
+
+
+def dataset_shard(dataset_id, num_shards):
+    '''
+    Returns the shard 1 ... num_shards of the given dataset ID by the MD5 hash of the ID.
+    '''
+    return int(hashlib.md5(dataset_id.encode('utf-8')).hexdigest(), 16) % num_shards + 1
+
+
+class LinkCheckShards(object):
+
+    '''
+    Merges the active datasets of the runs of num_shards shards, which check the datasets of
+    their shard independently. A completed run of a shard moves its processed datasets into
+    the set <prefix>shards:<num_shards>:active:<shard> and marks the shard as completed.
+    The run completing the last shard completes the link check of all shards with the union
+    of the active datasets.
+    '''
+
+    def __init__(self, redis_client, prefix, num_shards):
+        self.redis_client = redis_client
+        self.num_shards = num_shards
+        self.key_prefix = '%sshards:%s:' % (prefix, num_shards)
+        self.completed_key = self.key_prefix + 'completed'
+
+    def active_key(self, shard):
+        '''
+        Returns the key of the set with the active datasets of the given shard.
+        '''
+        return '%sactive:%s' % (self.key_prefix, shard)
+
+    def complete(self, shard, run):
+        '''
+        Moves the processed datasets of the completed run of the given shard into the active
+        datasets of the shard. Returns True, if all shards are completed, for exactly one of
+        the runs completing the shards.
+        '''
+        run.checkpoint()
+        pipe = self.redis_client.pipeline()
+        pipe.sunionstore(self.active_key(shard), [run.processed_key])
+        pipe.sadd(self.completed_key, shard)
+        pipe.execute()
+
+        def transaction(pipe):
+            if pipe.scard(self.completed_key) < self.num_shards:
+                pipe.unwatch()
+                return False
+            pipe.multi()
+            pipe.delete(self.completed_key)
+            return True
+
+        return self.redis_client.transaction(
+            transaction, self.completed_key, value_from_callable=True)
+
+    def num_active(self):
+        '''
+        Returns the number of active datasets of all shards.
+        '''
+        pipe = self.redis_client.pipeline(transaction=False)
+        for shard in range(1, self.num_shards + 1):
+            pipe.scard(self.active_key(shard))
+        return sum(pipe.execute())
+
+    def iterate_active(self, batch_size=1000):
+        '''
+        Iterates over the IDs of the active datasets of all shards with SSCAN.
+        '''
+        for shard in range(1, self.num_shards + 1):
+            yield from self.redis_client.sscan_iter(self.active_key(shard), count=batch_size)
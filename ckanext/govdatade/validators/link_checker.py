@@ -3,14 +3,26 @@
 '''
 Module for checking link availability of CKAN resources.
 '''
+from concurrent.futures import Future
+from contextlib import contextmanager
 from datetime import datetime
+from itertools import islice
 import ast
 import ckan.plugins.toolkit as tk
 import json
 import logging
 import socket
+import threading
 import redis
 import requests
+from requests.adapters import HTTPAdapter
+
+from ckanext.govdatade.validators.host_scheduler import HostScheduler, RetryAfter
+from ckanext.govdatade.validators.link_check_pipeline import LinkCheckPipeline
+from ckanext.govdatade.validators.link_check_records import LinkCheckRecords
+from ckanext.govdatade.validators.record_codec import JsonCodec, create_record_codec
+from ckanext.govdatade.validators.url_cache import UrlResultCache
+from ckanext.govdatade.validators.url_schedule import UrlSchedule
 
 
 class LinkChecker(object):
@@ -20,7 +32,39 @@ class LinkChecker(object):
     '''
 
     HEADERS = {'User-Agent': 'govdata-linkchecker'}
+    PROBE_HEADERS = {'Range': 'bytes=0-0', 'Connection': 'close'}
+    MAX_REDIRECTS = requests.models.DEFAULT_REDIRECT_LIMIT
     SCHEMA_RECORD_KEY = 'urls'
+    PENDING_DATASETS_PER_WORKER = 4
+    SCAN_BATCH_SIZE = 1000
+    DEFAULT_MAX_REQUESTS_PER_HOST = 4
+    DEFAULT_POOL_HOSTS = 100
+    DEFAULT_PIPELINE_QUEUE_SIZE = 100
+    DEFAULT_URL_CACHE_SIZE = 100000
+    DEFAULT_URL_CACHE_TTL = 86400
+    DEFAULT_MAX_CHECK_INTERVAL = 7
+    DEFAULT_COMPRESS_MIN_SIZE = 1024
+    DEFAULT_QUEUE_VISIBILITY_TIMEOUT = 600
+    # namespace of the Redis keys not being dataset records
+    KEY_PREFIX = 'linkchecker:'
+    SCHEDULE_KEY = KEY_PREFIX + 'schedule'
+    # version of the storage layout of the records, see ensure_record_layout
+    LAYOUT_KEY = KEY_PREFIX + 'layout'
+    LAYOUT_VERSION = '2'
+    # descriptions of the errors of a check, the first matching exception type applies
+    ERROR_DESCRIPTIONS = (
+        ((requests.exceptions.Timeout, socket.timeout), 'Timeout'),
+        (requests.exceptions.TooManyRedirects, 'Redirect Loop'),
+        (requests.exceptions.SSLError, 'SSL Error'),
+        (requests.exceptions.ConnectionError, 'Connection Error'),
+        ((requests.exceptions.InvalidURL, requests.exceptions.MissingSchema,
+          requests.exceptions.InvalidSchema), 'Invalid URL'),
+        (requests.exceptions.RequestException, 'Request Error'),
+    )
+    # result of a URL which is not due in an incremental link check
+    NOT_DUE = 'not due'
+    # result of a URL, which was not checked because its host asked to retry later
+    NOT_CHECKED = HostScheduler.NOT_CHECKED
     default_timeout = 15.0
 
     def __init__(self, config):
@@ -29,81 +73,331 @@ class LinkChecker(object):
             'ckanext.govdatade.reports.validators.linkchecker'
         )
 
-        self.redis_client = redis.StrictRedis(
+        redis_settings = dict(
             host=config.get('ckanext.govdata.validators.redis.host'),
             port=tk.asint(config.get('ckanext.govdata.validators.redis.port')),
-            db=tk.asint(config.get('ckanext.govdata.validators.redis.database')),
-            decode_responses=True
+            db=tk.asint(config.get('ckanext.govdata.validators.redis.database'))
         )
-
+        self.redis_client = redis.StrictRedis(decode_responses=True, **redis_settings)
+        # the record values are encoded as bytes
+        self.binary_redis_client = redis.StrictRedis(**redis_settings)
+
+        self.default_timeout = self._config_value(config, 'timeout', self.default_timeout)
+        # politeness per host of concurrent link checks
+        self.max_requests_per_host = self._config_value(
+            config, 'host.max_concurrency', self.DEFAULT_MAX_REQUESTS_PER_HOST)
+        self.requests_per_second_per_host = self._config_value(
+            config, 'host.requests_per_second', 0, float)
+        self.host_metrics = {}
+        # size of the queues between the stages of concurrent link checks
+        self.pipeline_queue_size = self._config_value(
+            config, 'pipeline.queue_size', self.DEFAULT_PIPELINE_QUEUE_SIZE)
+        self.pipeline_metrics = {}
+        # seconds until a dataset claimed by a worker of the distributed link check is claimed
+        # again, if its check is not acknowledged
+        self.queue_visibility_timeout = self._config_value(
+            config, 'queue.visibility_timeout', self.DEFAULT_QUEUE_VISIBILITY_TIMEOUT)
+        # connection pooling
+        self.pool_hosts = self._config_value(config, 'pool.hosts', self.DEFAULT_POOL_HOSTS)
+        self.pool_maxsize = self._config_value(config, 'pool.maxsize', self.max_requests_per_host)
+        self.keep_alive = self._config_value(config, 'pool.keep_alive', True, tk.asbool)
+        # global cap of the connections in use, 0 = bounded by the workers only
+        self.max_connections = self._config_value(config, 'pool.max_connections', 0)
+        self._connection_slots = threading.BoundedSemaphore(self.max_connections) \
+            if self.max_connections > 0 else None
+        self.session = self.create_session()
+        # run-scoped cache of the results per URL, see enable_url_cache
+        self.url_cache_size = self._config_value(
+            config, 'url_cache.size', self.DEFAULT_URL_CACHE_SIZE)
+        self.url_cache_ttl = self._config_value(config, 'url_cache.ttl', self.DEFAULT_URL_CACHE_TTL)
+        self.url_cache = None
+        # schedule of the next check per URL, see enable_url_schedule
+        self.max_check_interval = self._config_value(
+            config, 'incremental.max_interval', self.DEFAULT_MAX_CHECK_INTERVAL)
+        self.url_schedule = None
+        self.incremental = False
+        # link check records of the datasets
+        self.codec = create_record_codec(
+            self._config_value(config, 'codec', JsonCodec.name, str),
+            self._config_value(config, 'codec.compress_min_size', self.DEFAULT_COMPRESS_MIN_SIZE))
+        self.records = LinkCheckRecords(
+            self.binary_redis_client, self.KEY_PREFIX, self.SCHEMA_RECORD_KEY, self.codec)
+        # HTTP validators (ETag, Last-Modified) per URL for conditional requests
+        self._known_validators = {}
+        self._received_validators = {}
+
+    def _config_value(self, config, name, default, converter=tk.asint):
+        '''
+        Returns the converted value of the given link checker configuration option or the
+        default, if the option is not set or invalid.
+        '''
+        option = 'ckanext.govdata.validators.linkchecker.' + name
         try:
-            timeout_config = tk.asint(config.get('ckanext.govdata.validators.linkchecker.timeout'))
-            self.default_timeout = timeout_config
-            self.logger.debug('Using timeout (s): %s', self.default_timeout)
+            value = config.get(option)
+            if value is None:
+                raise TypeError('%s is not set' % option)
+            value = converter(value)
+            self.logger.debug('Using %s: %s', option, value)
+            return value
         except (TypeError, ValueError) as ex:
-            self.logger.debug('LinkChecker: Error while retrieving timeout from configuration: %s', str(ex))
-            self.logger.debug('Using default timeout (s): %s', self.default_timeout)
+            self.logger.debug('LinkChecker: Error while retrieving %s from configuration: %s',
+                              option, str(ex))
+            self.logger.debug('Using default %s: %s', option, default)
+            return default
+
+    def create_session(self):
+        '''
+        Creates the HTTP session shared by all checks. The session keeps a pool of up to
+        pool_maxsize connections for each of the last pool_hosts hosts, so that the
+        connections are reused for further URLs of the same host.
+        '''
+        session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=self.pool_hosts, pool_maxsize=self.pool_maxsize)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        if not self.keep_alive:
+            session.headers['Connection'] = 'close'
+        return session
+
+    def enable_url_cache(self):
+        '''
+        Enables the cache of the check results per URL, so that each distinct URL is checked
+        only once and its result is recorded for every dataset containing the URL.
+        '''
+        self.url_cache = UrlResultCache(self.url_cache_size, self.url_cache_ttl)
+        return self.url_cache
+
+    def enable_url_schedule(self, incremental=False):
+        '''
+        Enables the persisted schedule of the next check per URL. In incremental mode only the
+        URLs being due are checked.
+        '''
+        self.url_schedule = UrlSchedule(self.redis_client, self.SCHEDULE_KEY, self.max_check_interval)
+        self.incremental = incremental
+        return self.url_schedule
 
     def process_record(self, dataset):
         '''
         Checking a single datasets URLs for availability
         '''
+        self.logger.debug('Dataset id: %s', dataset['id'])
+        futures = self.submit_dataset(dataset, self._check_url_now)
+        return self.record_results(dataset, [(url, future.result()) for url, future in futures])
+
+    def process_records(self, datasets, workers=1, normalize=None):
+        '''
+        Checks the URLs of the given datasets and yields a tuple (dataset, error) for each
+        processed dataset. The optional normalize function returns the dataset prepared for the
+        check, e.g. from a search result.
+        With more than one worker the datasets run through a LinkCheckPipeline, so that
+        reading the datasets, checking the URLs in a thread pool and recording the results
+        overlap, while the results are still recorded dataset by dataset.
+        '''
+        if workers <= 1:
+            for dataset in datasets:
+                try:
+                    if normalize is not None:
+                        dataset = normalize(dataset)
+                    self.process_record(dataset)
+                    yield dataset, None
+                except Exception as ex:
+                    yield dataset, ex
+            return
+
+        yield from self._process_concurrently(datasets, workers, normalize)
+
+    def _process_concurrently(self, datasets, workers, normalize=None):
+        '''
+        Runs the given datasets through a LinkCheckPipeline submitting the URLs to the URL
+        executor.
+        '''
+        # back-pressure: do not read further datasets while too many are in flight
+        max_pending = workers * self.PENDING_DATASETS_PER_WORKER
+        with self._url_executor(workers) as submit:
+            pipeline = LinkCheckPipeline(
+                self, submit, self.pipeline_queue_size, max_pending, normalize)
+            try:
+                yield from pipeline.run(datasets)
+            finally:
+                self.pipeline_metrics = pipeline.metrics()
+                self.log_pipeline_metrics()
+
+    def submit_dataset(self, dataset, submit):
+        '''
+        Submits the checks of the URLs of the given dataset and returns a list of tuples
+        (url, future). In incremental mode the future of a URL not being due results in NOT_DUE.
+        '''
+        urls = [resource['url'] for resource in dataset['resources']]
+        entries = {}
+        if self.url_schedule is not None:
+            entries = self.url_schedule.load(urls)
+
+        futures = []
+        for url in urls:
+            self.logger.debug(u'Resource URL: %s', url)
+            entry = entries.get(url)
+            if self.incremental and not self.url_schedule.is_due(entry):
+                self.logger.debug(u'Resource URL %s is not due', url)
+                future = Future()
+                future.set_result(self.NOT_DUE)
+            else:
+                validators = UrlSchedule.validators(entry)
+                if validators:
+                    self._known_validators[url] = validators
+                future = self._submit_cached(submit, url)
+            futures.append((url, future))
+        return futures
+
+    def _submit_cached(self, submit, url):
+        '''
+        Submits the check of the given URL, unless the URL is in the URL cache, and returns the
+        future of its result.
+        '''
+        if self.url_cache is None:
+            return submit(url)
+        future = self.url_cache.get(url)
+        if future is None:
+            future = submit(url)
+            self.url_cache.put(url, future)
+        return future
+
+    def _check_url_now(self, url):
+        '''
+        Checks the given URL and returns the result as completed future.
+        '''
+        future = Future()
+        future.set_result(self.check_url(url))
+        return future
+
+    @contextmanager
+    def _url_executor(self, workers):
+        '''
+        Provides a function submitting a URL check and returning a future of its result. The
+        checks are scheduled politely per host.
+        '''
+        scheduler = HostScheduler(
+            workers, self.max_requests_per_host, self.requests_per_second_per_host)
+        try:
+            with scheduler:
+                yield lambda url: scheduler.submit(url, self.check_url, url, True)
+        finally:
+            self.host_metrics = scheduler.metrics()
+            self.log_host_metrics()
+
+    def log_host_metrics(self, limit=10):
+        '''
+        Logs the metrics of the hosts with the longest waiting times of the last concurrent
+        link check.
+        '''
+        hosts = sorted(self.host_metrics.items(), key=lambda item: item[1]['wait_time'],
+                       reverse=True)
+        for host, metrics in hosts[:limit]:
+            self.logger.info(
+                'Host %s: %d requests, %d retries, max queue depth %d, '
+                'total wait time %.1fs, max wait time %.1fs', host, metrics['requests'],
+                metrics['retries'], metrics['max_queue_depth'], metrics['wait_time'],
+                metrics['max_wait_time'])
+
+    def log_pipeline_metrics(self):
+        '''
+        Logs the counters of the stages of the last concurrent link check. The busy time of
+        the writer includes waiting for the URL checks.
+        '''
+        for name in LinkCheckPipeline.STAGES:
+            metrics = self.pipeline_metrics[name]
+            self.logger.info(
+                'Stage %s: %d datasets, %.1f datasets/s, busy time %.1fs, wait time %.1fs',
+                name, metrics['items'], metrics['items_per_second'], metrics['busy_time'],
+                metrics['wait_time'])
+
+    def complete_record(self, dataset, futures):
+        '''
+        Waits for the URL checks of the given dataset and records the results.
+        '''
+        try:
+            self.record_results(dataset, [(url, future.result()) for url, future in futures])
+            return dataset, None
+        except Exception as ex:
+            return dataset, ex
+
+    def check_url(self, url, honour_retry_after=False):
+        '''
+        Checks a single URL and returns the HTTP status code or an error description. None is
+        returned, if the URL has to be considered as available anyway.
+        '''
+        try:
+            code = self.validate(url, honour_retry_after)
+            self.logger.debug(u'HTTP status code for %s: %s', url, code)
+            return code
+        except RetryAfter:
+            raise
+        except Exception as exception:
+            return self.describe_error(exception)
+
+    def describe_error(self, exception):
+        '''
+        Returns the error description of the given exception of a check according to
+        ERROR_DESCRIPTIONS, so that all HTTP backends describe errors the same way. None is
+        returned for a ValueError, the URL is considered as available then.
+        '''
+        for error_types, description in self.ERROR_DESCRIPTIONS:
+            if isinstance(exception, error_types):
+                return description
+        if isinstance(exception, ValueError):
+            self.logger.debug('Value error: %s', exception)
+            return None
+        self.logger.debug('Unknown Error: %s', exception)
+        return 'Unknown Error'
+
+    def record_results(self, dataset, results):
+        '''
+        Records the given (url, status) check results of a dataset in Redis and deletes the no
+        more existent URLs of the dataset. The record of the dataset is read and written once
+        in a transaction, which is retried if the record was changed concurrently.
+        '''
         dataset_id = dataset['id']
-        self.logger.debug('Dataset id: %s', dataset_id)
-        delete = False
+        date = datetime.now().date()
         active_urls = []
+        outcomes = []
+        checked = []
+        validators = {}
 
-        for resource in dataset['resources']:
-            url = resource['url']
-            self.logger.debug(u'Resource URL: %s', url)
+        for url, status in results:
             active_urls.append(url)
-            try:
-                code = self.validate(url)
-                self.logger.debug(u'HTTP status code for %s: %s', url, code)
-                if self.is_available(code):
-                    self.record_success(dataset_id, url)
-                else:
-                    delete = delete or self.record_failure(
-                        dataset, url, code
-                    )
-            except requests.exceptions.Timeout:
-                delete = delete or self.record_failure(
-                    dataset, url, 'Timeout'
-                )
-            except requests.exceptions.TooManyRedirects:
-                delete = delete or self.record_failure(
-                    dataset, url, 'Redirect Loop'
-                )
-            except requests.exceptions.SSLError:
-                delete = delete or self.record_failure(
-                    dataset, url, 'SSL Error'
-                )
-            except requests.exceptions.RequestException as request_error:
-                if request_error is None:
-                    delete = delete or self.record_failure(
-                        dataset, url, 'Unknown Request Error'
-                    )
-                else:
-                    delete = delete or self.record_failure(
-                        dataset, url, str(request_error)
-                    )
-            except socket.timeout:
-                delete = delete or self.record_failure(
-                    dataset, url, 'Timeout'
-                )
-            except ValueError as value_error:
-                self.logger.debug('Value error: %s', value_error)
-                self.record_success(dataset_id, url)
-            except Exception as exception:
-                self.logger.debug('Unknown Error: %s', exception)
-                #In case of an unknown exception, change nothing
-                delete = delete or self.record_failure(
-                    dataset, url, 'Unknown Error'
-                )
-        # Delete no more existent urls in dataset
-        self.delete_deprecated_urls(dataset_id, active_urls)
+            self._known_validators.pop(url, None)
+            # the record and the schedule of the URL are kept
+            if status in (self.NOT_DUE, self.NOT_CHECKED):
+                continue
+            available = status is None or (isinstance(status, int) and self.is_available(status))
+            outcomes.append((url, status, available))
+            checked.append((url, available))
+            received = self._received_validators.pop(url, None)
+            if received:
+                validators[url] = received
+
+        def update_record(record):
+            delete = False
+            for url, status, available in outcomes:
+                if available:
+                    record = self._remove_url(record, url)
+                elif not delete:
+                    record, delete = self._add_failure(record, dataset, url, status, date)
+            # Delete no more existent urls in dataset
+            return self._remove_deprecated_urls(record, dataset_id, active_urls), delete
+
+        delete = self._update_record(dataset_id, update_record)
+        if self.url_schedule is not None:
+            self.url_schedule.update(checked, validators)
         return delete
 
+    def _update_record(self, dataset_id, update_function):
+        '''
+        Applies the update function to the record of the given dataset, see
+        LinkCheckRecords.update.
+        '''
+        return self.records.update(dataset_id, update_function)
+
     def check_dataset(self, dataset):
         '''
         Checks the URLs (resources) of a given dataset
@@ -114,43 +408,135 @@ class LinkChecker(object):
             datasets.append(self.validate(url))
         return datasets
 
-    def validate(self, url):
+    def validate(self, url, honour_retry_after=False):
         '''
         Validates a given URL by making a request against it
-        and returning it's HTTP status code.
+        and returning it's HTTP status code. With honour_retry_after
+        RetryAfter is raised, if the server asks to retry later.
         '''
         self.logger.debug(u'URL: %s', url)
 
-        self.logger.debug(u'Calling with HEAD method...')
-        response = requests.head(
-            url,
-            allow_redirects=True,
-            timeout=self.default_timeout,
-            headers=self.HEADERS,
-            verify=False
-        )
-
-        if self.has_redirection_to_404_page(response):
-            self.logger.debug(
-                'Redirect ends in HTTP status code %s', str(requests.codes.not_found)
-            )
-            return requests.codes.not_found
-        # if method HEAD is not allowed try again with http method GET
-        elif self.is_method_not_allowed(response.status_code):
-            self.logger.debug(u'HEAD method seems is not supported. Calling with GET method...')
-            response = requests.get(
+        headers = self.request_headers(url)
+        with self.connection_slot():
+            self.logger.debug(u'Calling with HEAD method...')
+            response = self.session.head(
                 url,
                 allow_redirects=True,
                 timeout=self.default_timeout,
-                headers=self.HEADERS,
+                headers=headers,
                 verify=False
             )
 
+            if self.has_redirection_to_404_page(response):
+                self.logger.debug(
+                    'Redirect ends in HTTP status code %s', str(requests.codes.not_found)
+                )
+                return requests.codes.not_found
+            # if method HEAD is not allowed try again with http method GET
+            if self.is_method_not_allowed(response.status_code):
+                self.logger.debug(
+                    u'HEAD method seems is not supported. Calling with GET method...')
+                response = self.probe(url, headers)
+
         self.logger.debug(
             'HTTP status code: %s', str(response.status_code)
         )
+        self.remember_validators(url, response.status_code, response.headers)
+        if honour_retry_after:
+            self.raise_for_retry_after(response.status_code, response.headers)
         return response.status_code
 
+    @contextmanager
+    def connection_slot(self):
+        '''
+        Waits for one of the max_connections connection slots shared by all workers and hosts
+        and releases it afterwards. Without max_connections the connections are bounded by the
+        number of workers only.
+        '''
+        if self._connection_slots is None:
+            yield
+            return
+        with self._connection_slots:
+            yield
+
+    def probe(self, url, headers):
+        '''
+        Requests the given URL with GET as bounded probe. Only the first byte is requested and
+        no response body is read, the connection is closed right after the headers. If the
+        server cannot serve the range (416), the URL is requested again without range.
+        '''
+        response = self._request_headers_only(url, dict(headers, **self.PROBE_HEADERS))
+        if response.status_code == requests.codes.requested_range_not_satisfiable:
+            self.logger.debug(u'Range not satisfiable. Calling without range...')
+            response = self._request_headers_only(url, dict(headers, Connection='close'))
+        return response
+
+    def _request_headers_only(self, url, headers):
+        '''
+        Sends a streamed GET request and closes the response without reading the body.
+        '''
+        with self.session.get(
+            url,
+            allow_redirects=True,
+            timeout=self.default_timeout,
+            headers=headers,
+            verify=False,
+            stream=True,
+            hooks={'response': self._close_redirect}
+        ) as response:
+            pass
+        return response
+
+    @staticmethod
+    def _close_redirect(response, **_kwargs):
+        '''
+        Response hook closing redirect responses, so that requests does not read their body
+        before following the redirect.
+        '''
+        if response.is_redirect:
+            response.close()
+        return response
+
+    def request_headers(self, url):
+        '''
+        Returns the request headers for the given URL. If the URL is known to have an ETag or a
+        Last-Modified date, the request is conditional.
+        '''
+        validators = self._known_validators.get(url)
+        if not validators:
+            return self.HEADERS
+        headers = dict(self.HEADERS)
+        if validators.get('etag'):
+            headers['If-None-Match'] = validators['etag']
+        if validators.get('last_modified'):
+            headers['If-Modified-Since'] = validators['last_modified']
+        return headers
+
+    def remember_validators(self, url, status_code, headers):
+        '''
+        Remembers the ETag and the Last-Modified date of an available URL until its result is
+        recorded.
+        '''
+        if self.url_schedule is None or not self.is_available(status_code):
+            return
+        validators = {}
+        if headers.get('ETag'):
+            validators['etag'] = headers.get('ETag')
+        if headers.get('Last-Modified'):
+            validators['last_modified'] = headers.get('Last-Modified')
+        if validators:
+            self._received_validators[url] = validators
+
+    @staticmethod
+    def raise_for_retry_after(status_code, headers):
+        '''
+        Raises RetryAfter, if the response signals that the server is overloaded.
+        '''
+        retry_after = headers.get('Retry-After')
+        if status_code == requests.codes.too_many_requests or \
+                (status_code == requests.codes.service_unavailable and retry_after is not None):
+            raise RetryAfter(HostScheduler.parse_retry_after(retry_after), status_code)
+
     @staticmethod
     def load_redis_data(data):
         '''
@@ -191,14 +577,24 @@ class LinkChecker(object):
     def is_available(response_code):
         '''
         Utility method for determining the availability from
-        a HTTP status code
+        a HTTP status code. 304 is the answer to a conditional
+        request for an unmodified resource.
         '''
-        return response_code >= 200 and response_code < 300
+        return (response_code >= 200 and response_code < 300) \
+            or response_code == requests.codes.not_modified
 
     def record_failure(self, dataset, url, status, date=datetime.now().date()):
         '''
         Adds a non available URL to the Redis dataset
         '''
+        return self._update_record(
+            dataset['id'], lambda record: self._add_failure(record, dataset, url, status, date))
+
+    def _add_failure(self, record, dataset, url, status, date):
+        '''
+        Adds a non available URL to the given dataset record. Returns the record and whether
+        the dataset has to be deleted.
+        '''
 
         self.logger.debug('Record failure with error (code) %s.', str(status))
 
@@ -211,9 +607,6 @@ class LinkChecker(object):
         dataset_name = dataset['name']
         dataset_maintainer_email = dataset['maintainer_email'] if 'maintainer_email' in dataset else ''
         dataset_maintainer = dataset['maintainer'] if 'maintainer' in dataset else ''
-        record = self.redis_client.get(dataset_id)
-        if record:
-            record = self.load_redis_data(record)
 
         initial_url_record = {
             'status': status,
@@ -226,7 +619,6 @@ class LinkChecker(object):
             record['maintainer'] = dataset_maintainer
             record['maintainer_email'] = dataset_maintainer_email
             record['metadata_original_portal'] = portal
-            self.redis_client.set(dataset_id, json.dumps(record))
 
         # Record is not known yet
         if record is None:
@@ -240,17 +632,14 @@ class LinkChecker(object):
 
             record[self.SCHEMA_RECORD_KEY][url] = initial_url_record
             record['metadata_original_portal'] = portal
-            self.redis_client.set(dataset_id, json.dumps(record))
 
         # Record is known, but only with schema errors
         elif self.SCHEMA_RECORD_KEY not in record:
             record[self.SCHEMA_RECORD_KEY] = {}
             record[self.SCHEMA_RECORD_KEY][url] = initial_url_record
-            self.redis_client.set(dataset_id, json.dumps(record))
         # Record is known, but not that particular URL (Resource)
         elif url not in record[self.SCHEMA_RECORD_KEY]:
             record[self.SCHEMA_RECORD_KEY][url] = initial_url_record
-            self.redis_client.set(dataset_id, json.dumps(record))
 
         # Record and URL are known, increment Strike counter if 1+ day(s) have
         # passed since the last check
@@ -266,7 +655,6 @@ class LinkChecker(object):
                     url_entry['status'] = status
                     url_entry['strikes'] += 1
                     url_entry['date'] = date.strftime("%Y-%m-%d")
-                    self.redis_client.set(dataset_id, json.dumps(record))
             except TypeError:
 
                 last_updated = last_updated.date()
@@ -275,62 +663,128 @@ class LinkChecker(object):
                     url_entry['status'] = status
                     url_entry['strikes'] += 1
                     url_entry['date'] = date.strftime("%Y-%m-%d")
-                    self.redis_client.set(dataset_id, json.dumps(record))
 
         delete = record[self.SCHEMA_RECORD_KEY][url]['strikes'] >= 100
 
-        return delete
+        return record, delete
 
     def record_success(self, dataset_id, url):
         '''
         Deletes or adds URL's from Redis dataset records
         '''
-        record = self.redis_client.get(dataset_id)
+        self._update_record(dataset_id, lambda record: (self._remove_url(record, url), None))
 
-        if record is not None:
-            record = self.load_redis_data(record)
-
-            # Remove URL entry due to a valid URL
-            if record.get(self.SCHEMA_RECORD_KEY):
-                record[self.SCHEMA_RECORD_KEY].pop(url, None)
-                self.redis_client.set(dataset_id, json.dumps(record))
+    def _remove_url(self, record, url):
+        '''
+        Removes the entry of an available URL from the given dataset record.
+        '''
+        # Remove URL entry due to a valid URL
+        if record is not None and record.get(self.SCHEMA_RECORD_KEY):
+            record[self.SCHEMA_RECORD_KEY].pop(url, None)
+        return record
 
     def delete_deprecated_urls(self, dataset_id, active_urls):
         '''
         Deletes deprecated URL's from Redis dataset record
         '''
-        record = self.redis_client.get(dataset_id)
-
-        if record is not None:
-            record = self.load_redis_data(record)
-
-            if self.SCHEMA_RECORD_KEY in record:
-                deprecated_urls = []
-                for candidate in record[self.SCHEMA_RECORD_KEY]:
-                    if candidate not in active_urls:
-                        deprecated_urls.append(candidate)
-
-                # Remove deprecated URL entries
-                for to_remove in deprecated_urls:
-                    self.logger.debug(
-                        'Delete deprecated url %s in dataset %s', to_remove, dataset_id)
-                    record[self.SCHEMA_RECORD_KEY].pop(to_remove, None)
+        self._update_record(
+            dataset_id,
+            lambda record: (self._remove_deprecated_urls(record, dataset_id, active_urls), None))
 
-                self.redis_client.set(dataset_id, json.dumps(record))
+    def _remove_deprecated_urls(self, record, dataset_id, active_urls):
+        '''
+        Removes the entries of URLs not contained in active_urls from the given dataset record.
+        '''
+        if record is not None and self.SCHEMA_RECORD_KEY in record:
+            deprecated_urls = []
+            for candidate in record[self.SCHEMA_RECORD_KEY]:
+                if candidate not in active_urls:
+                    deprecated_urls.append(candidate)
+
+            # Remove deprecated URL entries
+            for to_remove in deprecated_urls:
+                self.logger.debug(
+                    'Delete deprecated url %s in dataset %s', to_remove, dataset_id)
+                record[self.SCHEMA_RECORD_KEY].pop(to_remove, None)
+        return record
+
+    def iterate_keys(self):
+        '''
+        Iterates over the keys in Redis with SCAN, which does not block Redis like KEYS. The
+        keys of the link checker namespace and the key general are skipped. A key can be
+        returned more than once, if Redis resizes its keyspace during the iteration.
+        '''
+        for key in self.redis_client.scan_iter(count=self.SCAN_BATCH_SIZE):
+            if key != 'general' and not key.startswith(self.KEY_PREFIX):
+                yield key
 
     def get_records(self):
         '''
-        Returns the dataset records from Redis
+        Returns a generator of the dataset records from Redis. The records are loaded in
+        pipelined batches.
         '''
-        records = []
-        for dataset_id in self.redis_client.keys('*'):
-            if dataset_id == 'general' or dataset_id.startswith('harvest_object_id', 0):
-                continue
-            try:
-                record = self.redis_client.get(dataset_id)
-                if record:
-                    records.append(self.load_redis_data(record))
-            except ValueError:
-                self.logger.error('Data set error: %s', dataset_id)
+        return self.records.iterate_records(
+            self.records.iterate_dataset_ids(self.SCAN_BATCH_SIZE), self.SCAN_BATCH_SIZE)
 
-        return records
+    def migrate_legacy_records(self):
+        '''
+        Moves the records stored as JSON or Python literal strings with the dataset ID as key
+        into the namespaced layout of LinkCheckRecords. Returns the number of migrated
+        records.
+        '''
+        num_records = 0
+        dataset_ids = (key for key in self.iterate_keys()
+                       if not key.startswith('harvest_object_id', 0))
+        for batch in iterate_batches(dataset_ids, self.SCAN_BATCH_SIZE):
+            migrated = []
+            for dataset_id, data in zip(batch, self.redis_client.mget(batch)):
+                if data is None:
+                    continue
+                try:
+                    record = self.load_redis_data(data)
+                except (ValueError, SyntaxError):
+                    self.logger.error('Data set error: %s', dataset_id)
+                    continue
+                if isinstance(record, dict):
+                    self.records.save(dataset_id, record)
+                    migrated.append(dataset_id)
+            if migrated:
+                self.redis_client.delete(*migrated)
+                num_records += len(migrated)
+        self.redis_client.hset(self.LAYOUT_KEY, 'version', self.LAYOUT_VERSION)
+        return num_records
+
+    def ensure_record_layout(self):
+        '''
+        Migrates the legacy records, unless the records were migrated before, and rewrites the
+        record values, if they were written with another codec than the configured one.
+        Returns a tuple (number of migrated records, number of rewritten values).
+        '''
+        version, codec = self.redis_client.hmget(self.LAYOUT_KEY, 'version', 'codec')
+        num_records = 0
+        if version != self.LAYOUT_VERSION:
+            num_records = self.migrate_legacy_records()
+        num_values = 0
+        if codec != self.codec.codec.name:
+            num_values = self.upgrade_records()
+        return num_records, num_values
+
+    def upgrade_records(self):
+        '''
+        Rewrites the record values not encoded with the configured codec, e.g. after changing
+        the codec. Returns the number of rewritten values.
+        '''
+        num_values = sum(self.records.upgrade(dataset_id) for dataset_id
+                         in self.records.iterate_dataset_ids(self.SCAN_BATCH_SIZE))
+        self.redis_client.hset(self.LAYOUT_KEY, 'codec', self.codec.codec.name)
+        return num_values
+
+def iterate_batches(iterable, size):
+    '''
+    Yields lists of up to size items of the given iterable.
+    '''
+    iterator = iter(iterable)
+    batch = list(islice(iterator, size))
+    while batch:
+        yield batch
+        batch = list(islice(iterator, size))
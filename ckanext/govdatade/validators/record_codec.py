@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+'''
+Module for encoding the values of the link check records in Redis.
+'''
+import json
+import logging
+import zlib
+
+VERSION = b'\x01'
+COMPRESSED = b'Z'
+
+
+class JsonCodec(object):
+
+    '''
+    Encodes values as compact JSON.
+    '''
+
+    name = 'json'
+    tag = b'J'
+
+    @staticmethod
+    def dumps(value):
+        '''
+        Returns the given value as JSON bytes.
+        '''
+        return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+    @staticmethod
+    def loads(data):
+        '''
+        Returns the value of the given JSON bytes.
+        '''
+        return json.loads(data)
+
+
+class MsgpackCodec(object):
+
+    '''
+    Encodes values with MessagePack. Requires the package msgpack.
+    '''
+
+    name = 'msgpack'
+    tag = b'M'
+
+    def __init__(self):
+        import msgpack  # pylint: disable=import-outside-toplevel
+        self.msgpack = msgpack
+
+    def dumps(self, value):
+        '''
+        Returns the given value as MessagePack bytes.
+        '''
+        return self.msgpack.packb(value, use_bin_type=True)
+
+    def loads(self, data):
+        '''
+        Returns the value of the given MessagePack bytes.
+        '''
+        return self.msgpack.unpackb(data, raw=False)
+
+
+class RecordCodec(object):
+
+    '''
+    Encodes values with the given codec. The encoded value starts with the format VERSION and
+    the tag of the codec, so that values of all codecs can be decoded. Values of at least
+    compress_min_size bytes are compressed with zlib, which is marked by COMPRESSED before
+    the tag. Values without VERSION are untagged JSON of previous versions.
+    '''
+
+    def __init__(self, codec, compress_min_size=0):
+        self.codec = codec
+        self.compress_min_size = compress_min_size
+        self._codecs = {codec.tag: codec}
+
+    def encode(self, value):
+        '''
+        Returns the given value encoded as bytes.
+        '''
+        data = self.codec.dumps(value)
+        if self.compress_min_size and len(data) >= self.compress_min_size:
+            return VERSION + COMPRESSED + self.codec.tag + zlib.compress(data)
+        return VERSION + self.codec.tag + data
+
+    def decode(self, data):
+        '''
+        Returns the value of the given encoded bytes.
+        '''
+        if not data.startswith(VERSION):
+            return json.loads(data)
+        compressed = data[1:2] == COMPRESSED
+        offset = 2 if compressed else 1
+        codec = self._codec(data[offset:offset + 1])
+        payload = data[offset + 1:]
+        if compressed:
+            payload = zlib.decompress(payload)
+        return codec.loads(payload)
+
+    def is_current(self, data):
+        '''
+        Checks if the given encoded bytes are encoded with the codec of this instance.
+        '''
+        return data.startswith(VERSION + self.codec.tag) \
+            or data.startswith(VERSION + COMPRESSED + self.codec.tag)
+
+    def _codec(self, tag):
+        '''
+        Returns the codec of the given tag. Raises a ValueError for unknown tags.
+        '''
+        if tag not in self._codecs:
+            if tag == JsonCodec.tag:
+                self._codecs[tag] = JsonCodec()
+            elif tag == MsgpackCodec.tag:
+                self._codecs[tag] = MsgpackCodec()
+            else:
+                raise ValueError('Unknown codec tag %r' % tag)
+        return self._codecs[tag]
+
+
+def create_record_codec(name, compress_min_size=0):
+    '''
+    Creates the record codec for the codec with the given name ('json' or 'msgpack'). If
+    msgpack is not installed, JSON is used.
+    '''
+    logger = logging.getLogger(__name__)
+    if name == MsgpackCodec.name:
+        try:
+            return RecordCodec(MsgpackCodec(), compress_min_size)
+        except ImportError:
+            logger.warning('LinkChecker: Package msgpack not installed, using codec json.')
+    elif name != JsonCodec.name:
+        logger.warning('LinkChecker: Unknown codec %s, using codec json.', name)
+    return RecordCodec(JsonCodec(), compress_min_size)
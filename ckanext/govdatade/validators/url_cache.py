@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+'''
+Module for caching the link check results of URLs within a link checker run.
+'''
+from collections import OrderedDict
+from urllib.parse import urlsplit, urlunsplit
+import threading
+import time
+
+
+class UrlResultCache(object):
+
+    '''
+    Bounded cache of link check results keyed by the normalized URL. The least recently used
+    entries are evicted, if the cache exceeds max_size entries, and entries expire after ttl
+    seconds.
+    '''
+
+    DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def normalize_url(cls, url):
+        '''
+        Normalizes the given URL: Lower case scheme and host, without default port and
+        fragment.
+        '''
+        try:
+            parts = urlsplit(url.strip())
+            scheme = parts.scheme.lower()
+            netloc = (parts.hostname or '').lower()
+            if ':' in netloc:
+                netloc = '[%s]' % netloc
+            if parts.port is not None and parts.port != cls.DEFAULT_PORTS.get(scheme):
+                netloc = '%s:%s' % (netloc, parts.port)
+            if parts.username is not None:
+                userinfo = parts.username
+                if parts.password is not None:
+                    userinfo = '%s:%s' % (userinfo, parts.password)
+                netloc = '%s@%s' % (userinfo, netloc)
+            return urlunsplit((scheme, netloc, parts.path or '/', parts.query, ''))
+        except (AttributeError, TypeError, ValueError):
+            return url
+
+    def get(self, url):
+        '''
+        Returns the cached result for the given URL or None.
+        '''
+        key = self.normalize_url(url)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] < time.monotonic():
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, url, result):
+        '''
+        Caches the result for the given URL.
+        '''
+        key = self.normalize_url(url)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def hit_ratio(self):
+        '''
+        Returns the ratio of cache hits to all lookups.
+        '''
+        lookups = self.hits + self.misses
+        return float(self.hits) / lookups if lookups else 0.0
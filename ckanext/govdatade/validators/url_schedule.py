@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# -*- coding: utf8 -*-
+'''
+Module for scheduling the next link check of URLs.
+'''
+from datetime import date, timedelta
+import json
+
+from ckanext.govdatade.validators.url_cache import UrlResultCache
+
+DATE_FORMAT = '%Y-%m-%d'
+
+
+class UrlSchedule(object):
+
+    '''
+    Persists the date of the last check and the date of the next check per URL in a Redis
+    hash. Available URLs back off, the interval doubles with each successful check up to
+    max_interval days. Not available URLs are due daily.
+    '''
+
+    def __init__(self, redis_client, key, max_interval=7):
+        self.redis_client = redis_client
+        self.key = key
+        self.max_interval = max(max_interval, 1)
+        self.today = date.today
+
+    def load(self, urls):
+        '''
+        Returns the schedule entries of the given URLs as dict. URLs without entry are
+        missing in the dict.
+        '''
+        urls = list(urls)
+        if not urls:
+            return {}
+        fields = [UrlResultCache.normalize_url(url) for url in urls]
+        entries = {}
+        for url, value in zip(urls, self.redis_client.hmget(self.key, fields)):
+            if value is not None:
+                entries[url] = json.loads(value)
+        return entries
+
+    def is_due(self, entry):
+        '''
+        Checks if the URL of the given schedule entry is due. A URL checked today remains due,
+        so that it is recorded for all datasets containing the URL.
+        '''
+        if entry is None:
+            return True
+        today = self.today().strftime(DATE_FORMAT)
+        return entry['next'] <= today or entry['checked'] == today
+
+    def next_entry(self, entry, available, validators=None):
+        '''
+        Returns the schedule entry after a check with the given result. The HTTP validators
+        (etag, last_modified) of an available URL are kept for conditional requests.
+        '''
+        today = self.today()
+        if entry is not None and entry['checked'] == today.strftime(DATE_FORMAT):
+            return entry
+
+        interval = 1
+        if available and entry is not None and entry.get('available'):
+            interval = min(entry['interval'] * 2, self.max_interval)
+        next_entry = {
+            'checked': today.strftime(DATE_FORMAT),
+            'next': (today + timedelta(days=interval)).strftime(DATE_FORMAT),
+            'interval': interval,
+            'available': available
+        }
+        if available:
+            # an unmodified resource (304) does not send its validators again
+            next_entry.update(validators or self.validators(entry))
+        return next_entry
+
+    def update(self, results, validators=None):
+        '''
+        Updates the schedule entries of the given (url, available) check results. validators
+        is a dict with the received HTTP validators per URL.
+        '''
+        results = list(results)
+        if not results:
+            return
+        validators = validators or {}
+        entries = self.load(url for url, dummy_available in results)
+        mapping = {}
+        for url, available in results:
+            entry = self.next_entry(entries.get(url), available, validators.get(url))
+            mapping[UrlResultCache.normalize_url(url)] = json.dumps(entry)
+        self.redis_client.hset(self.key, mapping=mapping)
+
+    @staticmethod
+    def validators(entry):
+        '''
+        Returns the HTTP validators (etag, last_modified) of the given schedule entry.
+        '''
+        if not entry:
+            return {}
+        return dict((name, entry[name]) for name in ('etag', 'last_modified') if entry.get(name))
+
+    def prune(self, days):
+        '''
+        Deletes the entries of URLs not checked within the given number of days, e.g. URLs
+        of deleted resources. Returns the number of deleted entries.
+        '''
+        limit = (self.today() - timedelta(days=days)).strftime(DATE_FORMAT)
+        deprecated = [field for field, value in self.redis_client.hscan_iter(self.key)
+                      if json.loads(value)['checked'] < limit]
+        if deprecated:
+            self.redis_client.hdel(self.key, *deprecated)
+        return len(deprecated)
@@ -5,7 +5,7 @@ ip=$(echo $IP_MASTER | tr -d '\r')
 
 if [ $? -eq 0 ]; then
   logger "Start GovData clean up db"
-  /usr/lib/ckan/env/bin/ckan --config=/etc/ckan/default/production.ini cleanupdb activities
+  /usr/lib/ckan/env/bin/ckan --config=/etc/ckan/default/production.ini cleanupdb activities --chunk-size 10000 --window-days 7
   logger "Finished GovData clean up db"
 else
   logger "Host isn't master host"
@@ -9,7 +9,7 @@ ip=$(echo $IP_MASTER | tr -d '\r')
 
 if [ $? -eq 0 ]; then
   logger "Start GovData linkchecker"
-  /usr/lib/ckan/env/bin/ckan --config=/etc/ckan/default/production.ini linkchecker
+  /usr/lib/ckan/env/bin/ckan --config=/etc/ckan/default/production.ini linkchecker --incremental --resume
   if [ $? -eq 0 ]; then
     logger "Finished GovData linkchecker"
   else
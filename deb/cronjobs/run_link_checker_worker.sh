@@ -0,0 +1,21 @@
+#!/bin/bash
+
+export http_proxy="{{ http_proxy }}"
+export https_proxy="{{ http_proxy }}"
+export no_proxy="{{ no_proxy }}"
+
+ip=$(echo $IP_MASTER | tr -d '\r')
+/sbin/ip -o -4 addr list scope global | awk '{print $4}' | cut -d/ -f1 | grep "$ip"
+
+if [ $? -eq 0 ]; then
+  logger "Enqueue GovData linkchecker round"
+  /usr/lib/ckan/env/bin/ckan --config=/etc/ckan/default/production.ini linkchecker enqueue
+fi
+
+logger "Start GovData linkchecker worker"
+/usr/lib/ckan/env/bin/ckan --config=/etc/ckan/default/production.ini linkchecker worker --incremental --workers 16
+if [ $? -eq 0 ]; then
+  logger "Finished GovData linkchecker worker"
+else
+  logger "Failed GovData linkchecker worker. Exited with Status Code $?."
+fi